@@ -3,6 +3,11 @@ import shutil
 import subprocess
 import sys
 
+import numpy as np
+
+from . import profiling
+from .split_audio import resample_args
+
 def extract_audio_to_wav(input_path, output_wav_path, sr=None, channels=1):
     """
     Extract audio from input file to WAV using ffmpeg.
@@ -10,17 +15,104 @@ def extract_audio_to_wav(input_path, output_wav_path, sr=None, channels=1):
     if not shutil.which("ffmpeg"):
         print("Error: ffmpeg is not installed or not on PATH.", file=sys.stderr)
         sys.exit(1)
-    # Always extract stereo (channels 1 and 2)
     cmd = [
         "ffmpeg", "-hide_banner", "-loglevel", "error",
         "-i", input_path,
         "-vn",
         "-acodec", "pcm_s16le",
-        "-ac", "2",
+        "-ac", str(channels),
         "-y",  # Overwrite output
     ]
     if sr:
-        cmd += ["-ar", str(sr)]
+        cmd += resample_args(sr)
     cmd += [output_wav_path]
-    subprocess.run(cmd, check=True)
+    with profiling.stage("extract_audio_to_wav"):
+        profiling.run(cmd)
     return output_wav_path
+
+def probe_sample_rate(input_path):
+    """
+    Return the sample rate of the first audio stream of input_path using ffprobe.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return int(out.split()[0])
+
+def probe_channels(input_path):
+    """
+    Return the number of channels of the first audio stream of input_path using ffprobe.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=channels",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        input_path
+    ]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return int(out.split()[0])
+
+def pcm_blocks(input_path, channels=2, block_frames=1 << 16, sr=None, input_opts=(), dtype="int16"):
+    """
+    Decode the audio of input_path with ffmpeg and yield it as int16 (or, with
+    dtype "float32", float) arrays of shape (frames, channels), read straight
+    from ffmpeg's stdout. sr resamples in ffmpeg (see split_audio.resample_args),
+    low-pass filtered against aliasing; input_opts go before -i (e.g. -follow 1).
+
+    Blocks are views on a single reused buffer: each one is only valid until
+    the next one is requested.
+    """
+    if not shutil.which("ffmpeg"):
+        print("Error: ffmpeg is not installed or not on PATH.", file=sys.stderr)
+        sys.exit(1)
+    # Same decode as split_audio/extract_audio_to_wav, raw PCM to stdout
+    fmt = {"int16": "s16le", "float32": "f32le"}[dtype]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        *input_opts,
+        "-i", input_path,
+        "-vn",
+        "-acodec", f"pcm_{fmt}",
+        "-ac", str(channels),
+    ]
+    if sr:
+        cmd += resample_args(sr)
+    cmd += ["-f", fmt, "pipe:1"]
+    proc = profiling.popen(cmd, stdout=subprocess.PIPE)
+    try:
+        yield from read_pcm(proc.stdout, channels, block_frames, dtype)
+    finally:
+        proc.stdout.close()
+        returncode = profiling.wait(proc)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+def read_pcm(stream, channels=2, block_frames=1 << 16, dtype="int16"):
+    """
+    Yield raw little-endian PCM (s16le, or f32le with dtype "float32") from a
+    binary stream as arrays of shape (frames, channels), each a view on one
+    reused buffer.
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    frame_bytes = dtype.itemsize * channels
+    buf = bytearray(block_frames * frame_bytes)
+    view = memoryview(buf)
+    while True:
+        # Fill the whole buffer; short reads only happen at end of stream
+        filled = 0
+        while filled < len(buf):
+            n = stream.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+        filled -= filled % frame_bytes
+        if filled:
+            yield np.frombuffer(buf, dtype=dtype, count=filled // dtype.itemsize).reshape(-1, channels)
+        if filled < len(buf):
+            break
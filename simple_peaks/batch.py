@@ -0,0 +1,134 @@
+"""
+Batch mode: run the default workflow over many recordings at once.
+
+Inputs are files, directories (their media files) or glob patterns. Every
+recording is analyzed in a process pool limited to analysis_jobs at a time;
+its clips are scheduled as soon as its peaks are written, on up to
+encode_jobs ffmpeg slots. Analysis and encoding share one job scheduler, so
+one recording's clips are encoded while the next one is still analyzed.
+
+Besides each recording's own <base>_peaks.json, a merged index ranks the
+peaks of all recordings by loudness, with their rank within their own
+recording alongside.
+"""
+import glob
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import workflow
+from .scheduler import Job, ffmpeg_threads, run_jobs
+
+MEDIA_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".avi", ".mxf", ".mts")
+INDEX_NAME = "batch_peaks.json"
+
+def expand_inputs(items):
+    """
+    Recording paths named by items: files as given, the media files directly
+    inside directories, and the matches of glob patterns. Sorted, without
+    duplicates.
+    """
+    paths = []
+    for item in items:
+        if os.path.isdir(item):
+            paths += [os.path.join(item, name) for name in os.listdir(item)
+                      if name.lower().endswith(MEDIA_EXTENSIONS)]
+        elif os.path.exists(item):
+            paths.append(item)
+        else:
+            matches = glob.glob(item)
+            if not matches:
+                raise FileNotFoundError(f"No input matches: {item}")
+            paths += [path for path in matches if os.path.isfile(path)]
+    return sorted(set(paths))
+
+def rank_peaks(peaks_by_file):
+    """
+    Merge the peak lists of several recordings, loudest first.
+    Each peak gets its overall "rank" and its "file_rank" within its own
+    recording (both from 1).
+    """
+    merged = []
+    for peaks in peaks_by_file.values():
+        order = sorted(range(len(peaks)), key=lambda i: (-peaks[i]["rms_db"], peaks[i]["abs_start_sec"]))
+        for file_rank, i in enumerate(order, 1):
+            merged.append(dict(peaks[i], file_rank=file_rank))
+    merged.sort(key=lambda p: (-p["rms_db"], p["source_file"], p["abs_start_sec"]))
+    for rank, peak in enumerate(merged, 1):
+        peak["rank"] = rank
+    return merged
+
+def _analyze(input_path, settings, force, db):
+    # Runs in an analysis worker process
+    from .manifest import Manifest
+    out_dir = workflow.output_dir_for(input_path)
+    os.makedirs(out_dir, exist_ok=True)
+    return workflow.analyze_to_json(input_path, out_dir, jobs=1,
+                                    manifest=Manifest(out_dir, force=force), db=db, **settings)
+
+def _clip_jobs(peaks, thread_opts, single_pass, batch_clips, force, fast_cut):
+    from .extract_clips import clip_jobs_for_peaks, skip_up_to_date
+    from .manifest import Manifest
+    by_dir = {}
+    for peak in peaks:
+        by_dir.setdefault(workflow.output_dir_for(peak["source_file"]), []).append(peak)
+    jobs = []
+    for out_dir, dir_peaks in by_dir.items():
+        dir_jobs = clip_jobs_for_peaks(dir_peaks, out_dir, thread_opts, single_pass, batch_clips, fast_cut)
+        jobs += skip_up_to_date(dir_jobs, Manifest(out_dir, force=force))
+    for job in jobs:
+        job.slot = "encode"
+    return jobs
+
+def run_batch(items, index_path=INDEX_NAME, analysis_jobs=None, encode_jobs=2, threads=None,
+              top=None, clips=True, single_pass=False, batch_clips=False, force=False,
+              sr=None, channels=1, window=2.0, hop=0.5, pipe=False, use_cache=True, db=None,
+              fast_cut=False, scorer="rms", per_minute=False):
+    """
+    Analyze every recording named by items and extract its clips (see
+    expand_inputs and extract_clips.extract_clips_from_peaks), then write the
+    merged index to index_path. With top, only the top loudest peaks across
+    all recordings get clips, once every recording is analyzed. With db,
+    every recording's peaks are also stored in that peaks database.
+    Returns the merged index.
+    """
+    paths = expand_inputs(items)
+    if not paths:
+        print("No recordings found.")
+        return []
+    if analysis_jobs is None:
+        analysis_jobs = min(len(paths), os.cpu_count() or 1)
+    settings = {"sr": sr, "channels": channels, "window": window, "hop": hop,
+                "pipe": pipe, "use_cache": use_cache, "scorer": scorer, "per_minute": per_minute}
+    thread_opts = ffmpeg_threads(encode_jobs, threads)
+    json_paths = {}
+    merged = []
+
+    def analyze(path):
+        json_paths[path] = pool.submit(_analyze, path, settings, force, db).result()
+        if clips and top is None:
+            with open(json_paths[path]) as f:
+                return _clip_jobs(json.load(f), thread_opts, single_pass, batch_clips, force, fast_cut)
+
+    def write_index():
+        peaks_by_file = {}
+        for path in paths:
+            with open(json_paths[path]) as f:
+                peaks_by_file[path] = json.load(f)
+        merged.extend(rank_peaks(peaks_by_file))
+        with open(index_path, "w") as f:
+            json.dump(merged, f, indent=2)
+        print(f"Merged peak index of {len(paths)} recordings written to: {index_path}")
+        if clips and top is not None:
+            return _clip_jobs(merged[:top], thread_opts, single_pass, batch_clips, force, fast_cut)
+
+    jobs = [Job(f"analyze: {path}", [lambda path=path: analyze(path)], message=f"Analyzing: {path}",
+                inputs=[path], slot="analysis") for path in paths]
+    jobs.append(Job(index_path, [write_index], deps=[job.name for job in jobs]))
+    # Workers are started from scheduler threads, where forking is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=analysis_jobs, mp_context=context) as pool:
+        run_jobs(jobs, max_workers=analysis_jobs + encode_jobs + 1,
+                 slots={"analysis": analysis_jobs, "encode": encode_jobs})
+    return merged
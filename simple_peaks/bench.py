@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for simple-peaks on deterministic synthetic media.
+
+Usage:
+  python -m simple_peaks.bench run --durations 60,900,3600 --output baseline.json
+  python -m simple_peaks.bench compare baseline.json current.json --tolerance 0.15
+  python -m simple_peaks.bench rates recording.mov --rate 8000
+
+Each case times one stage on generated input: find_loud_segments (with
+the RMS and the K-weighted loudness scorer) and split_audio on a noise
+track with loud bursts, extract_clips_from_peaks and
+split_video on short ffmpeg lavfi test videos. Every case runs in a fresh
+Python process, so its peak RSS (its own, and that of the ffmpeg processes
+it started) is not shared with the other cases. Media is generated before
+the case process starts, so cold and warm work folders measure the same,
+and is kept in the work folder for later runs.
+
+`rates` checks the low-rate analysis decode (--analysis-rate) on a real
+recording: it analyzes it once at its native rate and once decimated by
+ffmpeg, and reports whether the same peaks are selected (exit status 1 if
+not), with the time and PCM bytes each decode took.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BENCH_SR = 16000
+DURATIONS = [60, 900, 3600]  # seconds; 14400 (4 h) on request
+CLIP_VIDEO_SEC = 120
+CLIP_COUNT = 4
+SPLIT_VIDEO_SEC = 10
+REPEAT = 3
+TOLERANCE = 0.15
+# Wall time changes smaller than this are timer noise, whatever their ratio
+MIN_DELTA_SEC = 0.05
+CASES = ["find_loud_segments", "find_loud_segments_lufs", "split_audio", "extract_clips_from_peaks", "split_video"]
+# Cases whose input length follows --durations; the video cases use fixed short inputs
+AUDIO_CASES = {"find_loud_segments", "find_loud_segments_lufs", "split_audio"}
+
+def synthetic_audio(path, seconds, sr=BENCH_SR, seed=0):
+    """
+    Write a mono 16-bit WAV of low noise with a 2 s burst every ~20 s,
+    generated a minute at a time. The same seed gives the same file.
+    """
+    import soundfile as sf
+    if os.path.exists(path):
+        return path
+    rng = np.random.default_rng(seed)
+    tmp = path + ".tmp.wav"
+    with sf.SoundFile(tmp, "w", sr, 1, subtype="PCM_16") as f:
+        for start in range(0, seconds, 60):
+            n = min(60, seconds - start) * sr
+            y = 0.01 * rng.standard_normal(n)
+            for burst in range(0, n - 2 * sr, 20 * sr):
+                at = burst + int(rng.integers(0, 10 * sr))
+                y[at:at + 2 * sr] *= rng.uniform(3, 30)
+            f.write(np.clip(y, -1, 1).astype(np.float32))
+    os.replace(tmp, path)
+    return path
+
+def synthetic_video(path, seconds, size="640x360", channels=2):
+    """
+    Write an H.264/AAC test video from ffmpeg's lavfi sources: testsrc2
+    picture and one sine tone per audio channel.
+    """
+    if os.path.exists(path):
+        return path
+    tones = "|".join(f"0.3*sin({220 * (c + 1)}*2*PI*t)" for c in range(channels))
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=s={size}:r=25:d={seconds}",
+        "-f", "lavfi", "-i", f"aevalsrc={tones}:s=48000:d={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-y", path + ".tmp.mp4"
+    ]
+    subprocess.run(cmd, check=True)
+    os.replace(path + ".tmp.mp4", path)
+    return path
+
+def case_inputs(case, seconds, work_dir):
+    """
+    Generate the input media of a case in work_dir, if not there already.
+    Returns the path of its main input.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    if case in AUDIO_CASES:
+        if case in ("find_loud_segments", "find_loud_segments_lufs"):
+            # Warm-up input, see run_case
+            synthetic_audio(os.path.join(work_dir, "noise_1.wav"), 1)
+        return synthetic_audio(os.path.join(work_dir, f"noise_{seconds}.wav"), seconds)
+    if case == "extract_clips_from_peaks":
+        return synthetic_video(os.path.join(work_dir, f"clips_{CLIP_VIDEO_SEC}.mp4"), CLIP_VIDEO_SEC)
+    if case == "split_video":
+        return synthetic_video(os.path.join(work_dir, f"quad_{SPLIT_VIDEO_SEC}.mp4"), SPLIT_VIDEO_SEC,
+                               size="3840x2160", channels=16)
+    raise ValueError(f"Unknown case {case!r}: expected one of {', '.join(CASES)}")
+
+def run_case(case, seconds, work_dir, repeat=REPEAT):
+    """
+    Time a case in this process, keeping the best wall time of repeat runs.
+    Its input is expected from case_inputs (run generates it before starting
+    the case process, so that generating it never counts in the case's peak
+    RSS); it is generated here only when missing.
+    Returns {"wall_sec", "samples", "samples_per_sec", "peak_rss_mb"}.
+    """
+    if case not in CASES:
+        raise ValueError(f"Unknown case {case!r}: expected one of {', '.join(CASES)}")
+    wav = video = case_inputs(case, seconds, work_dir)
+    if case in AUDIO_CASES:
+        samples = seconds * BENCH_SR
+    elif case == "extract_clips_from_peaks":
+        peaks = [{
+            "wav_file": None, "start_sec": t, "duration_sec": 2.0, "abs_start_sec": t,
+            "source_file": video, "rms_db": 0.1,
+        } for t in np.linspace(5, CLIP_VIDEO_SEC - 5, CLIP_COUNT).round(3).tolist()]
+        peaks_json = os.path.join(work_dir, "clips_peaks.json")
+        with open(peaks_json, "w") as f:
+            json.dump(peaks, f)
+        samples = int(2.0 * CLIP_COUNT * 48000)
+    else:
+        samples = SPLIT_VIDEO_SEC * 48000
+    # Imports are not part of the timing, nor is librosa loading its
+    # decoding backends on first use (seconds), so warm it up on 1 s of audio
+    if case in ("find_loud_segments", "find_loud_segments_lufs"):
+        from .find_loud import find_loud_segments
+        scorer = "lufs" if case.endswith("_lufs") else "rms"
+        find_loud_segments(synthetic_audio(os.path.join(work_dir, "noise_1.wav"), 1), None, 2.0, 0.5, scorer=scorer)
+        stage = lambda: find_loud_segments(wav, None, 2.0, 0.5, scorer=scorer)
+    elif case == "split_audio":
+        from .split_audio import split_audio
+        stage = lambda: split_audio(wav, 900, os.path.join(work_dir, f"split_{seconds}"), "segment", None, 1)
+    elif case == "extract_clips_from_peaks":
+        from .extract_clips import extract_clips_from_peaks
+        stage = lambda: extract_clips_from_peaks(peaks_json, os.path.join(work_dir, "clips"))
+    else:
+        from .split import split_video
+        stage = lambda: split_video(video, os.path.join(work_dir, "quad.split"))
+    wall = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stage()
+        elapsed = time.perf_counter() - started
+        wall = elapsed if wall is None else min(wall, elapsed)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+    return {
+        "wall_sec": round(wall, 4),
+        "samples": samples,
+        "samples_per_sec": round(samples / wall, 1) if wall > 0 else None,
+        "peak_rss_mb": round(rss, 1),
+    }
+
+def run(cases, durations, work_dir, repeat=REPEAT):
+    """
+    Run every case (audio cases once per duration), each in its own process.
+    Returns the results document: machine info and results keyed "case/seconds".
+    """
+    results = {}
+    for case in cases:
+        for seconds in (durations if case in AUDIO_CASES else [None]):
+            seconds = seconds or (CLIP_VIDEO_SEC if case == "extract_clips_from_peaks" else SPLIT_VIDEO_SEC)
+            name = f"{case}/{seconds}"
+            print(f"Running {name}...", file=sys.stderr)
+            case_inputs(case, seconds, work_dir)
+            cmd = [sys.executable, "-m", "simple_peaks.bench", "case", case, str(seconds), work_dir, "--repeat", str(repeat)]
+            proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True)
+            # The case's own output comes first, its result is the last line
+            results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"  {results[name]['wall_sec']:.2f} s, {results[name]['peak_rss_mb']:.0f} MB",
+                  file=sys.stderr)
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "created": time.time(),
+        "results": results,
+    }
+
+def compare(baseline, current, tolerance=TOLERANCE):
+    """
+    Regressions of current against baseline: cases whose wall time or peak
+    RSS grew by more than tolerance (a fraction), ignoring wall time changes
+    under MIN_DELTA_SEC. Returns messages.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for key in ("wall_sec", "peak_rss_mb"):
+            if key == "wall_sec" and result[key] - base[key] < MIN_DELTA_SEC:
+                continue
+            if base[key] and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]} "
+                                   f"(+{100 * (result[key] / base[key] - 1):.0f}%)")
+    return regressions
+
+def compare_rates(input_path, rate=8000, window=2.0, hop=0.5):
+    """
+    Peaks of input_path analyzed at its native rate and at rate (see
+    streaming.analysis_rate_blocks). Returns a report dict; "match" is True
+    when both select peaks at the same times.
+    """
+    from . import streaming, workflow
+    report = {"input": input_path, "rate": rate}
+    peaks = {}
+    for name, sr in (("native", None), ("low", rate)):
+        started = time.perf_counter()
+        envelope = streaming.pipe_envelope(input_path, sr, window, hop)
+        report[f"{name}_sec"] = round(time.perf_counter() - started, 3)
+        report[f"{name}_sr"] = envelope["sr"]
+        peaks[name] = workflow.select_per_minute(envelope, window)
+    # Native decode: mono 16-bit; low rate: mono float32
+    report["native_pcm_bytes"] = int(report["native_sr"] * 2 * envelope["duration"])
+    report["low_pcm_bytes"] = int(rate * 4 * envelope["duration"])
+    native_starts = [p["start_sec"] for p in peaks["native"]]
+    low_starts = [p["start_sec"] for p in peaks["low"]]
+    report["peaks"] = len(native_starts)
+    report["mismatched"] = sorted(set(native_starts) ^ set(low_starts))
+    report["match"] = not report["mismatched"]
+    return report
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = p.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="run the benchmarks and write a results JSON")
+    run_p.add_argument("--cases", default=",".join(CASES), help="comma-separated cases (default: all)")
+    run_p.add_argument("--durations", default=",".join(map(str, DURATIONS)),
+                       help="comma-separated audio durations in seconds (default: 60,900,3600)")
+    run_p.add_argument("--work-dir", default="bench_media", help="folder for generated media (default: bench_media)")
+    run_p.add_argument("--repeat", type=int, default=REPEAT, help="runs per case, best wall time kept (default: 3)")
+    run_p.add_argument("--output", "-o", default=None, help="results JSON to write (default: stdout)")
+    cmp_p = sub.add_parser("compare", help="flag regressions of a run against a baseline")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed growth as a fraction (default: 0.15)")
+    rates_p = sub.add_parser("rates", help="check that the low-rate analysis decode selects the native-rate peaks")
+    rates_p.add_argument("input")
+    rates_p.add_argument("--rate", type=int, default=8000, help="analysis rate in Hz (default: 8000)")
+    rates_p.add_argument("--window", type=float, default=2.0)
+    rates_p.add_argument("--hop", type=float, default=0.5)
+    case_p = sub.add_parser("case")
+    case_p.add_argument("case")
+    case_p.add_argument("seconds", type=int)
+    case_p.add_argument("work_dir")
+    case_p.add_argument("--repeat", type=int, default=REPEAT)
+    args = p.parse_args()
+    if args.command == "case":
+        print(json.dumps(run_case(args.case, args.seconds, args.work_dir, args.repeat)))
+    elif args.command == "rates":
+        report = compare_rates(args.input, args.rate, args.window, args.hop)
+        print(json.dumps(report, indent=2))
+        if not report["match"]:
+            sys.exit(1)
+    elif args.command == "run":
+        doc = run(args.cases.split(","), [int(d) for d in args.durations.split(",")], args.work_dir,
+                  args.repeat)
+        text = json.dumps(doc, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} ({len(current['results'])} cases)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Persistent cache of RMS envelopes for simple-peaks.
+
+Envelopes are stored as .npy files under <base>.simple-peaks/cache/<key>/,
+next to a meta.json describing each envelope segment. The key combines a
+fast fingerprint of the source file (size, mtime and a hash of a few sampled
+blocks) with the analysis parameters, so re-running peak selection on the
+same recording skips decoding entirely. Entries are evicted oldest-used
+first once the cache exceeds a size limit, and after a maximum age.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+CACHE_DIR_NAME = "cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_MAX_AGE = 30 * 24 * 3600  # seconds
+# Per-frame arrays of an envelope segment, stored as .npy files
+ARRAY_KEYS = ("rms", "momentary")
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+
+def fingerprint(path, blocks=SAMPLE_BLOCKS, block_size=SAMPLE_BLOCK_SIZE):
+    """
+    Fast content fingerprint of a file: size, mtime and a hash of blocks
+    sampled evenly across it (the whole file when it is small).
+    """
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        if st.st_size <= blocks * block_size:
+            h.update(f.read())
+        else:
+            step = (st.st_size - block_size) // (blocks - 1)
+            for i in range(blocks):
+                f.seek(i * step)
+                h.update(f.read(block_size))
+    return h.hexdigest()
+
+def cache_key(path, params):
+    """
+    Cache key for the analysis of path with the given parameters (a JSON-able dict).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(fingerprint(path).encode())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+def load_envelopes(cache_dir, key):
+    """
+    Return the cached envelope segments for key, or None on a miss.
+    Each segment is its meta dict with the envelope under "rms" (and the
+    other ARRAY_KEYS it had).
+    """
+    entry = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry, "meta.json")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        segments = []
+        for i, seg in enumerate(meta["segments"]):
+            seg = dict(seg)
+            seg["rms"] = np.load(os.path.join(entry, f"{i:03d}.npy"))
+            for name in seg.pop("arrays", []):
+                seg[name] = np.load(os.path.join(entry, f"{i:03d}_{name}.npy"))
+            segments.append(seg)
+    except (OSError, ValueError, KeyError):
+        return None
+    # Mark as recently used for eviction
+    os.utime(meta_path)
+    return segments
+
+def save_envelopes(cache_dir, key, segments):
+    """
+    Store envelope segments (meta dicts with the envelope under "rms") under key.
+    """
+    entry = os.path.join(cache_dir, key)
+    tmp = entry + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = []
+    for i, seg in enumerate(segments):
+        np.save(os.path.join(tmp, f"{i:03d}.npy"), np.asarray(seg["rms"]))
+        arrays = [name for name in ARRAY_KEYS[1:] if seg.get(name) is not None]
+        for name in arrays:
+            np.save(os.path.join(tmp, f"{i:03d}_{name}.npy"), np.asarray(seg[name]))
+        meta.append({k: v for k, v in seg.items() if k not in ARRAY_KEYS})
+        if arrays:
+            meta[-1]["arrays"] = arrays
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"segments": meta, "created": time.time()}, f, indent=2)
+    # Replace any previous entry in one rename
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+def evict(cache_dir, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE):
+    """
+    Remove entries unused for longer than max_age seconds, then the least
+    recently used ones until the cache fits in max_bytes.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        meta_path = os.path.join(entry, "meta.json")
+        if not os.path.isfile(meta_path):
+            continue
+        size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+        entries.append((os.path.getmtime(meta_path), size, entry))
+    entries.sort()
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    for used, size, entry in entries:
+        if total <= max_bytes and now - used <= max_age:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
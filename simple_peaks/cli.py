@@ -1,26 +1,73 @@
 import argparse
+import os
 import sys
-from . import split_audio, find_loud
+from . import split_audio
 from . import split
 
-import math
-import glob
-import soundfile as sf
+# Analysis modules (numpy, soundfile, librosa) are imported by the commands
+# that use them, so --help, split and video-split start fast
+
+PROFILE_TRACE = "simple-peaks-trace.json"
+
+def profile_option(argv):
+    """
+    Take --profile, --profile TRACE.json or --profile=TRACE.json out of argv.
+    A bare --profile only takes the next argument as its path when it ends
+    in .json, so "--profile input.mov" still profiles input.mov.
+    Returns (argv, trace path or None).
+    """
+    trace_path = None
+    rest = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        if arg == "--profile":
+            trace_path = PROFILE_TRACE
+            if i < len(argv) and argv[i].endswith(".json") and not argv[i].startswith("-"):
+                trace_path = argv[i]
+                i += 1
+        elif arg.startswith("--profile="):
+            trace_path = arg.split("=", 1)[1]
+        else:
+            rest.append(arg)
+    return rest, trace_path
 
 def main():
-    import sys
+    argv = sys.argv[1:]
+    # Hand the command to a warm daemon when one is configured and running
+    socket_path = os.environ.get("SIMPLE_PEAKS_DAEMON")
+    if socket_path and argv[:1] != ["daemon"]:
+        from .daemon import forward
+        code = forward(argv, socket_path)
+        if code is not None:
+            sys.exit(code)
+    run_local(argv)
+
+def run_local(argv):
+    """
+    Run a command line in this process, profiled if it asks for --profile.
+    """
+    argv, trace_path = profile_option(argv)
+    if trace_path is None:
+        return run(argv)
+    from . import profiling
+    profiling.enable()
+    try:
+        with profiling.stage("simple-peaks", argv=" ".join(argv)):
+            run(argv)
+    finally:
+        profiling.finish(trace_path)
+
+def run(argv):
     import os
     import json
 
     # List of valid subcommands
-    valid_commands = {"split", "find", "analyze", "video-split", "-h", "--help"}
-    argv = sys.argv[1:]
+    valid_commands = {"split", "find", "analyze", "video-split", "envelope", "batch", "channels", "live", "daemon", "peaks", "serve", "-h", "--help"}
     # If first arg is not a known subcommand or help, treat it as a file and run default workflow
     if argv and (argv[0] not in valid_commands and not argv[0].startswith("-")):
         input_path = argv[0]
-        import math
-        import glob
-        import soundfile as sf
         base = os.path.splitext(os.path.basename(input_path))[0]
         out_dir = os.path.join(os.path.dirname(input_path), f"{base}.simple-peaks")
         os.makedirs(out_dir, exist_ok=True)
@@ -36,64 +83,44 @@ def main():
         parser.add_argument("--channels", type=int, default=1)
         parser.add_argument("--window", type=float, default=2.0)
         parser.add_argument("--hop", type=float, default=0.5)
+        parser.add_argument("--pipe", action="store_true")
+        parser.add_argument("--analysis-rate", type=int, nargs="?", const=8000, default=None)
+        parser.add_argument("--jobs", "-j", type=int, default=1)
+        parser.add_argument("--clip-jobs", type=int, default=1)
+        parser.add_argument("--clip-threads", type=int, default=None)
+        parser.add_argument("--single-pass", action="store_true")
+        parser.add_argument("--batch-clips", action="store_true")
+        parser.add_argument("--no-cache", action="store_true")
+        parser.add_argument("--pyramid", action="store_true")
+        parser.add_argument("--force", action="store_true")
+        parser.add_argument("--store", nargs="?", const="", default=None)
+        parser.add_argument("--fast-cut", action="store_true")
+        parser.add_argument("--scorer", choices=["rms", "lufs"], default="rms")
+        parser.add_argument("--per-minute", action="store_true")
         opts = parser.parse_args(argv)
         sr = opts.sr
+        if opts.analysis_rate:
+            # ffmpeg decodes straight to mono float at the low rate
+            sr = opts.analysis_rate
+            opts.pipe = True
         channels = opts.channels
         window = opts.window
         hop = opts.hop
-        # 2. Split to ≤900s wavs
-        split_audio.check_ffmpeg()
-        split_audio.split_audio(
-            input_path, 900, out_dir, base, sr, channels
+        from . import workflow
+        from .manifest import Manifest
+        manifest = Manifest(out_dir, force=opts.force)
+        json_path = workflow.analyze_to_json(
+            input_path, out_dir, sr, channels, window, hop,
+            pipe=opts.pipe, jobs=opts.jobs, use_cache=not opts.no_cache,
+            pyramid=opts.pyramid, manifest=manifest, db=store_path(opts.store),
+            scorer=opts.scorer, per_minute=opts.per_minute
         )
-        # 3. For each wav, determine duration and calculate top_n
-        wavs = sorted(glob.glob(os.path.join(out_dir, f"{base}_*.wav")))
-        if not wavs:
-            # If only one segment, fallback to single wav extraction
-            wav_path = os.path.join(out_dir, f"{base}.wav")
-            extract_audio_to_wav(input_path, wav_path, sr=sr, channels=channels)
-            wavs = [wav_path]
-        # Compute offsets for each wav segment
-        segment_offsets = []
-        offset = 0.0
-        wav_durations = []
-        # Get durations for all wavs
-        for wav in wavs:
-            with sf.SoundFile(wav) as f:
-                dur = f.frames / f.samplerate
-            wav_durations.append(dur)
-        for dur in wav_durations:
-            segment_offsets.append(offset)
-            offset += dur
-        # Build a flat array of peaks with absolute positions
-        all_peaks = []
-        import soundfile as sf
-        for i, wav in enumerate(wavs):
-            # Detect sample rate if not set
-            _sr = sr
-            if _sr is None:
-                with sf.SoundFile(wav) as f:
-                    _sr = f.samplerate
-            segs = find_loud.find_loud_segments(wav, _sr, window, hop, max(1, math.ceil(wav_durations[i] / 60)))
-            for seg in segs:
-                abs_start_sec = segment_offsets[i] + seg["start_sec"]
-                all_peaks.append({
-                    "wav_file": wav,
-                    "start_sec": seg["start_sec"],
-                    "duration_sec": seg["duration_sec"],
-                    "abs_start_sec": abs_start_sec,
-                    "source_file": input_path,
-                    "rms_db": seg["rms_db"]
-                })
-        # Write as a single JSON array
-        json_path = os.path.join(out_dir, f"{base}_peaks.json")
-        with open(json_path, "w") as f:
-            json.dump(all_peaks, f, indent=2)
-        print(f"WAV segments written to: {out_dir}")
-        print(f"Peak info written to: {json_path}")
         # Extract video clips for each peak
         from .extract_clips import extract_clips_from_peaks
-        extract_clips_from_peaks(json_path, output_dir=out_dir)
+        extract_clips_from_peaks(json_path, output_dir=out_dir,
+                                 jobs=opts.clip_jobs, threads=opts.clip_threads,
+                                 single_pass=opts.single_pass, batch=opts.batch_clips,
+                                 manifest=manifest, fast_cut=opts.fast_cut)
         return
 
     # Otherwise, proceed with argparse as usual
@@ -102,6 +129,9 @@ def main():
     parser.add_argument("--channels", type=int, default=1, help="Number of audio channels (default: 1)")
     parser.add_argument("--window", type=float, default=2.0, help="Window size in seconds for peak analysis")
     parser.add_argument("--hop", type=float, default=0.5, help="Hop size in seconds for peak analysis")
+    parser.add_argument("--profile", nargs="?", metavar="TRACE.json", const=PROFILE_TRACE,
+                        help=f"Record stage and ffmpeg timings, CPU, I/O and memory: print a summary and write a "
+                             f"Chrome trace (--profile PATH.json or --profile=PATH; default: {PROFILE_TRACE}). Works with every command")
     subparsers = parser.add_subparsers(dest="command")
 
     # Split subcommand
@@ -119,7 +149,10 @@ def main():
     find_parser.add_argument("--sr", type=int, default=None, help="sample rate to resample to (None for native)")
     find_parser.add_argument("--window", type=float, default=2.0, help="window size in seconds")
     find_parser.add_argument("--hop", type=float, default=0.5, help="hop size in seconds")
-    find_parser.add_argument("--top", type=int, default=10, help="number of top segments to return")
+    find_parser.add_argument("--top", type=int, default=10, help="number of top segments to return per 15-minute bin")
+    find_parser.add_argument("--global-top", action="store_true", help="return the top segments of the whole file instead of per bin")
+    find_parser.add_argument("--stream", action="store_true", help="analyze block by block in constant memory")
+    find_parser.add_argument("--scorer", choices=["rms", "lufs"], default="rms", help="rank windows by RMS or K-weighted loudness (LUFS)")
 
     # Analyze subcommand
     analyze_parser = subparsers.add_parser('analyze', help='Extract audio and find loudest peaks, saving results to a new folder')
@@ -128,25 +161,201 @@ def main():
     analyze_parser.add_argument("--channels", type=int, default=1, help="Number of audio channels (default: 1)")
     analyze_parser.add_argument("--window", type=float, default=2.0, help="Window size in seconds for peak analysis")
     analyze_parser.add_argument("--hop", type=float, default=0.5, help="Hop size in seconds for peak analysis")
-    analyze_parser.add_argument("--top", type=int, default=10, help="Number of top segments to return")
+    analyze_parser.add_argument("--top", type=int, default=10, help="Number of top segments to return per 15-minute bin")
+    analyze_parser.add_argument("--global-top", action="store_true", help="Return the top segments of the whole file instead of per bin")
+    analyze_parser.add_argument("--stream", action="store_true", help="Analyze block by block in constant memory")
+    analyze_parser.add_argument("--scorer", choices=["rms", "lufs"], default="rms", help="Rank windows by RMS or K-weighted loudness (LUFS)")
 
     # --- Add video-split subcommand ---
     video_split_parser = subparsers.add_parser('video-split', help='Split a 4K video with 4 corners into 4 1080p videos with mapped audio')
     video_split_parser.add_argument('input', help='Path to input video file')
     video_split_parser.add_argument('--output-dir', default='.', help='Directory to write segments (default: current dir)')
+    video_split_parser.add_argument('--map', action='append', default=None, metavar='CORNER=CHANNEL',
+                                    help='Audio channel for a corner, e.g. top_left=7 (repeatable; default: split.CONFIG)')
+    video_split_parser.add_argument('--single-pass', action='store_true', help='Decode the source once and encode all corners in one ffmpeg process')
+
+    # Envelope subcommand
+    envelope_parser = subparsers.add_parser('envelope', help='Print loudness over a time span from a loudness pyramid, as JSON')
+    envelope_parser.add_argument("input", help="Path to <base>_loudness.json (or .bin)")
+    envelope_parser.add_argument("--start", type=float, default=0.0, help="Span start in seconds (default: 0)")
+    envelope_parser.add_argument("--end", type=float, default=None, help="Span end in seconds (default: end of recording)")
+    envelope_parser.add_argument("--level", type=int, default=None, help="Zoom level (default: chosen from --points)")
+    envelope_parser.add_argument("--points", type=int, default=2000, help="Maximum number of values when choosing the level")
+
+    # Channels subcommand
+    channels_parser = subparsers.add_parser('channels', help='Find the loudest peaks of every audio channel from a single decode')
+    channels_parser.add_argument("input", help="Path to input file (audio or video)")
+    channels_parser.add_argument("--sr", type=int, default=None, help="Sample rate for analysis (default: native)")
+    channels_parser.add_argument("--window", type=float, default=2.0, help="Window size in seconds for peak analysis")
+    channels_parser.add_argument("--hop", type=float, default=0.5, help="Hop size in seconds for peak analysis")
+    channels_parser.add_argument("--per-minute", action="store_true", help="Select one peak per started minute instead of the 5 loudest per 15-minute bin")
+    channels_parser.add_argument("--by", choices=["channel", "corner"], default="channel",
+                                 help="Analyze every channel, or only the channels mapped to corners (default: channel)")
+    channels_parser.add_argument('--map', action='append', default=None, metavar='CORNER=CHANNEL',
+                                 help='Audio channel for a corner with --by corner (repeatable; default: split.CONFIG)')
+
+    # Live subcommand
+    live_parser = subparsers.add_parser('live', help='Print peaks as NDJSON while a recording is still being written')
+    live_parser.add_argument("input", help="Path to a growing recording, or - for raw s16le PCM on stdin")
+    live_parser.add_argument("--sr", type=int, default=None, help="Analysis sample rate (required for stdin; default: native)")
+    live_parser.add_argument("--channels", type=int, default=2, help="Channels of the PCM on stdin (default: 2)")
+    live_parser.add_argument("--window", type=float, default=2.0, help="Window size in seconds for peak analysis")
+    live_parser.add_argument("--hop", type=float, default=0.5, help="Hop size in seconds for peak analysis")
+    live_parser.add_argument("--bin", type=float, default=60, help="Bin length in seconds; peaks are final at the end of their bin (default: 60)")
+    live_parser.add_argument("--top", type=int, default=1, help="Number of peaks per bin (default: 1)")
+    live_parser.add_argument("--timeout", type=float, default=30, help="Stop after this many seconds without new data (default: 30)")
+    live_parser.add_argument("--clips", action="store_true", help="Extract the clips of each peak once it is final")
+    live_parser.add_argument("--clip-threads", type=int, default=None, help="Threads per ffmpeg encode")
 
-    args = parser.parse_args()
+    # Daemon subcommand
+    daemon_parser = subparsers.add_parser('daemon', help='Serve commands from a warm worker on a Unix socket (see SIMPLE_PEAKS_DAEMON)')
+    daemon_parser.add_argument("--socket", default=None, help="Socket path (default: simple-peaks-<uid>.sock in the temp folder)")
+
+    # Serve subcommand
+    serve_parser = subparsers.add_parser('serve', help='Run analysis and clip jobs for the front-end over local HTTP')
+    serve_parser.add_argument("--root", default=".", help="Folder whose recordings and outputs are served (default: current dir)")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    serve_parser.add_argument("--jobs", type=int, default=2, help="Jobs run at once; others wait in the queue (default: 2)")
+    serve_parser.add_argument("--clip-threads", type=int, default=None, help="Threads per ffmpeg encode")
+    serve_parser.add_argument("--allow-origin", action="append", default=[], metavar="ORIGIN",
+                              help="Let web pages from ORIGIN (e.g. http://localhost:3000) use the server; repeatable")
+
+    # Batch subcommand
+    batch_parser = subparsers.add_parser('batch', help='Run the default workflow over many recordings with a shared job pool')
+    batch_parser.add_argument("inputs", nargs="+", help="Input files, directories or glob patterns")
+    batch_parser.add_argument("--index", default="batch_peaks.json", help="Merged peak index to write (default: batch_peaks.json)")
+    batch_parser.add_argument("--analysis-jobs", type=int, default=None, help="Recordings analyzed at once (default: CPU count)")
+    batch_parser.add_argument("--encode-jobs", type=int, default=2, help="ffmpeg clip encodes run at once (default: 2)")
+    batch_parser.add_argument("--clip-threads", type=int, default=None, help="Threads per ffmpeg encode (default: CPU count / encode jobs)")
+    batch_parser.add_argument("--top", type=int, default=None, help="Only extract clips of the N loudest peaks across all recordings")
+    batch_parser.add_argument("--no-clips", action="store_true", help="Only analyze and write the peak index")
+    batch_parser.add_argument("--sr", type=int, default=None, help="Sample rate for analysis (default: native)")
+    batch_parser.add_argument("--channels", type=int, default=1, help="Number of audio channels (default: 1)")
+    batch_parser.add_argument("--window", type=float, default=2.0, help="Window size in seconds for peak analysis")
+    batch_parser.add_argument("--hop", type=float, default=0.5, help="Hop size in seconds for peak analysis")
+    batch_parser.add_argument("--pipe", action="store_true", help="Decode through an ffmpeg pipe instead of WAV segments")
+    batch_parser.add_argument("--analysis-rate", type=int, nargs="?", const=8000, default=None,
+                              help="Analyze mono audio decimated by ffmpeg to this rate (default with no value: 8000); implies --pipe")
+    batch_parser.add_argument("--no-cache", action="store_true", help="Do not use the envelope cache")
+    batch_parser.add_argument("--scorer", choices=["rms", "lufs"], default="rms", help="Rank windows by RMS or K-weighted loudness (LUFS)")
+    batch_parser.add_argument("--per-minute", action="store_true", help="Select one peak per started minute instead of the 5 loudest per 15-minute bin")
+    batch_parser.add_argument("--single-pass", action="store_true", help="Write all renditions of a clip from one decode")
+    batch_parser.add_argument("--batch-clips", action="store_true", help="Cut nearby clips of a source from one seek and decode per ffmpeg run")
+    batch_parser.add_argument("--fast-cut", action="store_true", help="Copy whole GOPs of H.264 sources and re-encode only clip edges")
+    batch_parser.add_argument("--force", action="store_true", help="Redo every stage, even when up to date")
+    batch_parser.add_argument("--store", nargs="?", const="", default=None, metavar="DB",
+                              help="Also store the peaks in a peaks database (default with no value: $SIMPLE_PEAKS_DB or ~/.simple-peaks/peaks.db)")
+
+    # Peaks subcommand
+    peaks_parser = subparsers.add_parser('peaks', help='Import, query and export the peaks database, or extract clips from it')
+    peaks_parser.add_argument("--db", default=None, help="Peaks database (default: $SIMPLE_PEAKS_DB or ~/.simple-peaks/peaks.db)")
+    peaks_actions = peaks_parser.add_subparsers(dest="action", required=True)
+    import_parser = peaks_actions.add_parser('import', help='Add the peaks of peaks JSON files (either shape)')
+    import_parser.add_argument("files", nargs="+", help="Peaks JSON files")
+    peaks_actions.add_parser('sources', help='List the stored recordings and their peak counts')
+    for name, help_text in (("query", "Print matching peaks as JSON"),
+                            ("export", "Write matching peaks as a peaks JSON file"),
+                            ("clips", "Extract the clips of matching peaks")):
+        action_parser = peaks_actions.add_parser(name, help=help_text)
+        action_parser.add_argument("--source", action="append", default=None, help="Only peaks of this recording (repeatable)")
+        action_parser.add_argument("--since", default=None, help="Only recordings modified at or after this ISO date/time")
+        action_parser.add_argument("--until", default=None, help="Only recordings modified before this ISO date/time")
+        action_parser.add_argument("--start", type=float, default=None, help="Only peaks starting at or after this second of their recording")
+        action_parser.add_argument("--end", type=float, default=None, help="Only peaks starting before this second of their recording")
+        action_parser.add_argument("--min-db", type=float, default=None, help="Only peaks at least this loud (dB)")
+        action_parser.add_argument("--top", type=int, default=None, help="Only the N first peaks")
+        action_parser.add_argument("--order", choices=["loudness", "time"], default="loudness",
+                                   help="Loudest first, or by recording and time (default: loudness)")
+        if name == "export":
+            action_parser.add_argument("--format", choices=["list", "by-wav"], default="list",
+                                       help="Flat list as <base>_peaks.json, or segments keyed by WAV file (default: list)")
+            action_parser.add_argument("--output", "-o", default=None, help="JSON file to write (default: stdout)")
+        if name == "clips":
+            action_parser.add_argument("--clip-jobs", type=int, default=1, help="ffmpeg clip encodes run at once")
+            action_parser.add_argument("--clip-threads", type=int, default=None, help="Threads per ffmpeg encode")
+            action_parser.add_argument("--single-pass", action="store_true", help="Write all renditions of a clip from one decode")
+            action_parser.add_argument("--batch-clips", action="store_true", help="Cut nearby clips of a source from one seek and decode per ffmpeg run")
+            action_parser.add_argument("--fast-cut", action="store_true", help="Copy whole GOPs of H.264 sources and re-encode only clip edges")
+
+    args = parser.parse_args(argv)
 
     # Handle video-split subcommand
     if getattr(args, 'command', None) == 'video-split':
-        split.split_video(args.input, args.output_dir)
+        try:
+            mapping = split.parse_mapping(args.map) if args.map else None
+        except ValueError as e:
+            parser.error(str(e))
+        split.split_video(args.input, args.output_dir, mapping, args.single_pass)
+        return
+
+    # Handle channels subcommand
+    if getattr(args, 'command', None) == 'channels':
+        from . import workflow
+        mapping = None
+        if args.by == "corner":
+            try:
+                mapping = split.parse_mapping(args.map) if args.map else split.CONFIG
+            except ValueError as e:
+                parser.error(str(e))
+        out_dir = workflow.output_dir_for(args.input)
+        os.makedirs(out_dir, exist_ok=True)
+        workflow.analyze_channels(args.input, out_dir, args.sr, args.window, args.hop, mapping, args.per_minute)
+        return
+
+    # Handle live subcommand
+    if getattr(args, 'command', None) == 'live':
+        import contextlib
+        from . import workflow
+        from .live import live_peaks
+        clips_dir = None
+        if args.clips:
+            clips_dir = workflow.output_dir_for(args.input)
+            os.makedirs(clips_dir, exist_ok=True)
+        # stdout carries the NDJSON peaks only; progress goes to stderr
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            live_peaks(args.input, args.sr, args.window, args.hop, args.bin, args.top,
+                       args.channels, args.timeout, out, clips_dir, args.clip_threads)
+        return
+
+    # Handle daemon subcommand
+    if getattr(args, 'command', None) == 'daemon':
+        from .daemon import serve
+        serve(args.socket)
+        return
+
+    # Handle serve subcommand
+    if getattr(args, 'command', None) == 'serve':
+        from .server import serve
+        serve(args.root, args.host, args.port, args.jobs, args.clip_threads, args.allow_origin)
+        return
+
+    # Handle batch subcommand
+    if getattr(args, 'command', None) == 'batch':
+        from .batch import run_batch
+        if args.analysis_rate:
+            args.sr = args.analysis_rate
+            args.pipe = True
+        run_batch(args.inputs, args.index, args.analysis_jobs, args.encode_jobs, args.clip_threads,
+                  top=args.top, clips=not args.no_clips, single_pass=args.single_pass,
+                  batch_clips=args.batch_clips, force=args.force, sr=args.sr, channels=args.channels,
+                  window=args.window, hop=args.hop, pipe=args.pipe, use_cache=not args.no_cache,
+                  db=store_path(args.store), fast_cut=args.fast_cut, scorer=args.scorer,
+                  per_minute=args.per_minute)
+        return
+
+    # Handle peaks subcommand
+    if getattr(args, 'command', None) == 'peaks':
+        run_peaks(args)
         return
 
     # If input is provided and no subcommand, run main workflow
     if args.input and not args.command:
-        import os
-        import json
-        from . import split_audio, find_loud
+        import math
+        import glob
+        import soundfile as sf
+        from . import find_loud
         from .audio_utils import extract_audio_to_wav
         # 1. Create output folder
         input_path = args.input
@@ -186,11 +395,22 @@ def main():
             args.input, args.segment_length, args.output_dir, args.prefix, args.sr, args.channels
         )
     elif args.command == 'find':
-        segs = find_loud.find_loud_segments(
-            args.input, args.sr, args.window, args.hop, args.top
+        from . import find_loud
+        analyze = find_loud.find_loud_segments
+        if args.stream:
+            from .streaming import stream_loud_segments as analyze
+        segs = analyze(
+            args.input, args.sr, args.window, args.hop, args.top,
+            None if args.global_top else find_loud.BIN_SIZE, scorer=args.scorer
         )
         import json
         print(json.dumps(segs, indent=2))
+    elif args.command == 'envelope':
+        import json
+        from .pyramid import LoudnessPyramid
+        pyramid = LoudnessPyramid(args.input)
+        end = pyramid.duration if args.end is None else args.end
+        print(json.dumps(pyramid.envelope(args.start, end, args.level, args.points)))
     elif args.command == 'video-split':
         split.split_video(args.input, args.parts, args.output_dir)
     elif args.command == 'analyze':
@@ -206,7 +426,12 @@ def main():
         wav_path = os.path.join(out_dir, f"{base}.wav")
         extract_audio_to_wav(input_path, wav_path, sr=args.sr, channels=args.channels)
         # Analyze peaks
-        segs = find_loud.find_loud_segments(wav_path, args.sr, args.window, args.hop, args.top)
+        from . import find_loud
+        analyze = find_loud.find_loud_segments
+        if args.stream:
+            from .streaming import stream_loud_segments as analyze
+        segs = analyze(wav_path, args.sr, args.window, args.hop, args.top,
+                       None if args.global_top else find_loud.BIN_SIZE, scorer=args.scorer)
         # Write JSON
         json_path = os.path.join(out_dir, f"{base}_peaks.json")
         with open(json_path, "w") as f:
@@ -217,5 +442,59 @@ def main():
         parser.print_help()
         sys.exit(1)
 
+def store_path(option):
+    """
+    Database path for a --store [DB] option: None when not given, the
+    default database when given without a value.
+    """
+    if option is None:
+        return None
+    from .store import default_db_path
+    return option or default_db_path()
+
+def _timestamp(value):
+    from datetime import datetime
+    return None if value is None else datetime.fromisoformat(value).timestamp()
+
+def run_peaks(args):
+    """
+    The actions of the peaks subcommand.
+    """
+    import json
+    from .store import PeakStore, to_json_shape
+    with PeakStore(args.db) as store:
+        if args.action == "import":
+            for path in args.files:
+                print(f"Imported {store.import_json(path)} peaks from: {path}")
+            return
+        if args.action == "sources":
+            print(json.dumps(store.sources(), indent=2))
+            return
+        peaks = store.query(args.source, _timestamp(args.since), _timestamp(args.until),
+                            args.start, args.end, args.min_db, args.top, args.order)
+    if args.action == "query":
+        print(json.dumps(peaks, indent=2))
+    elif args.action == "export":
+        data = json.dumps(to_json_shape(peaks, args.format), indent=2)
+        if args.output is None:
+            print(data)
+        else:
+            with open(args.output, "w") as f:
+                f.write(data)
+            print(f"{len(peaks)} peaks written to: {args.output}", file=sys.stderr)
+    elif args.action == "clips":
+        from . import workflow
+        from .extract_clips import extract_clips_from_peaks
+        from .manifest import Manifest
+        by_source = {}
+        for peak in peaks:
+            by_source.setdefault(peak["source_file"], []).append(peak)
+        for source, source_peaks in by_source.items():
+            out_dir = workflow.output_dir_for(source)
+            os.makedirs(out_dir, exist_ok=True)
+            extract_clips_from_peaks(None, output_dir=out_dir, jobs=args.clip_jobs, threads=args.clip_threads,
+                                     single_pass=args.single_pass, batch=args.batch_clips,
+                                     manifest=Manifest(out_dir), peaks=source_peaks, fast_cut=args.fast_cut)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,139 @@
+"""
+Warm worker daemon for simple-peaks.
+
+`simple-peaks daemon` imports the analysis modules once, decodes a short
+silent file so that librosa's lazily loaded backends are ready, and then
+listens on a Unix socket. When SIMPLE_PEAKS_DAEMON is set to that socket,
+the simple-peaks command forwards its arguments, working directory and
+environment to the daemon instead of starting the analysis itself. The
+daemon forks a child per request, which inherits the warm modules and runs
+the command with the caller's stdin, stdout and stderr (passed over the
+socket), so output, including ffmpeg's, goes straight to the caller's
+terminal. The command's exit status is sent back when it is done. Requests
+run concurrently, each in its own process.
+
+If the daemon is not running, the command runs locally as usual.
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+
+DAEMON_ENV = "SIMPLE_PEAKS_DAEMON"
+
+def default_socket_path():
+    return os.path.join(tempfile.gettempdir(), f"simple-peaks-{os.getuid()}.sock")
+
+def forward(argv, socket_path):
+    """
+    Run a simple-peaks command line in the daemon listening on socket_path.
+    Returns its exit status, or None if no daemon is listening there.
+    """
+    if not hasattr(socket, "send_fds"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+        sys.stdout.flush()
+        sys.stderr.flush()
+        socket.send_fds(sock, [json.dumps(request).encode() + b"\n"], [0, 1, 2])
+        reply = sock.makefile("rb").readline()
+    # No reply: the worker died without reporting
+    return json.loads(reply)["exit"] if reply else 1
+
+def warm():
+    """
+    Import the analysis modules and run one tiny decode and analysis.
+    """
+    import numpy as np
+    import soundfile as sf
+    from . import find_loud, streaming, workflow  # noqa: F401
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "warm.wav")
+        sf.write(path, np.zeros(8000, dtype=np.float32), 8000)
+        find_loud.find_loud_segments(path, None, 0.5, 0.25)
+
+class _Handler(socketserver.BaseRequestHandler):
+    # Runs in the forked child of one request
+    def handle(self):
+        data, fds, _, _ = socket.recv_fds(self.request, 1 << 16, 3)
+        while not data.endswith(b"\n"):
+            more = self.request.recv(1 << 16)
+            if not more:
+                return
+            data += more
+        request = json.loads(data)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        code = _run(request["argv"])
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.request.sendall(json.dumps({"exit": code}).encode() + b"\n")
+
+def _run(argv):
+    from . import cli
+    sys.argv = ["simple-peaks"] + argv
+    try:
+        cli.run_local(argv)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
+
+class _Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+def serve(socket_path=None):
+    """
+    Warm up and serve requests on socket_path until interrupted.
+    """
+    if not hasattr(socket, "recv_fds"):
+        # Clients check for send_fds and run commands themselves
+        raise RuntimeError("simple-peaks daemon needs Python 3.9 or later (socket.recv_fds)")
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # Left over from a daemon that did not shut down cleanly
+            os.remove(socket_path)
+        else:
+            probe.close()
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+    print("Warming up analysis modules...")
+    warm()
+    # Owner-only from the moment the socket exists: chmod after bind leaves a window
+    umask = os.umask(0o177)
+    try:
+        server = _Server(socket_path, _Handler)
+    finally:
+        os.umask(umask)
+    with server:
+        print(f"Listening on {socket_path}")
+        print(f"Use it with: export {DAEMON_ENV}={socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
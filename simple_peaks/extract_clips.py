@@ -1,24 +1,245 @@
 import os
-import subprocess
 import json
 import shutil
 
+from . import cache, profiling
+from .manifest import file_state as manifest_state
+from .scheduler import Job, ffmpeg_threads, run_jobs
+
 # --- CONFIGURATION ---
 # Set these to True/False to control which outputs are generated for each clip
 OUTPUT_540P_MP4 = True      # Save a 540p version of each clip (mp4)
 OUTPUT_540P_GIF = True      # Save a 540px-wide GIF of each clip
 OUTPUT_270P_GIF = True      # Save a 270px-wide GIF of each clip
 OUTPUT_SCROLLING_MP4 = True  # Save a "scrolling" all-I-frames MP4 (1-frame GOP)
+# Batched extraction: clips of one source that overlap or are at most this
+# many seconds apart are cut by one ffmpeg process from one seek and one
+# decode, at most this many clips per process. The gaps between them are
+# decoded too: up to BATCH_MAX_GAP seconds per clip, instead of a seek and
+# the GOP before each clip
+BATCH_MAX_GAP = 10.0
+BATCH_MAX_CLIPS = 8
 # ---------------------
 
 def check_ffmpeg():
     if not shutil.which("ffmpeg"):
         raise RuntimeError("ffmpeg is not installed or not on PATH.")
 
-def extract_clips_from_peaks(peaks_json_path, output_dir=None):
+def clip_name(peak):
+    """
+    File name of the original clip of a peak.
+    """
+    base = os.path.splitext(os.path.basename(peak["source_file"]))[0]
+    return f"{base}_{peak['abs_start_sec']:.3f}.mp4"
+
+def plan_batches(peaks, max_gap=BATCH_MAX_GAP, max_clips=BATCH_MAX_CLIPS):
+    """
+    Group peaks for batched extraction.
+
+    Peaks are grouped by source_file and sorted by abs_start_sec; runs of
+    clips that overlap or are at most max_gap seconds apart, up to max_clips
+    clips, become one batch. Returns (source_file, start_sec, end_sec, peaks)
+    batches, each decoded once from start_sec to end_sec.
+    """
+    by_source = {}
+    for peak in peaks:
+        by_source.setdefault(peak["source_file"], []).append(peak)
+    batches = []
+    for source_file, source_peaks in by_source.items():
+        source_peaks.sort(key=lambda p: p["abs_start_sec"])
+        batch = None
+        for peak in source_peaks:
+            start = peak["abs_start_sec"]
+            end = start + peak["duration_sec"]
+            if batch and start - batch[2] <= max_gap and len(batch[3]) < max_clips:
+                batch[2] = max(batch[2], end)
+                batch[3].append(peak)
+            else:
+                batch = [source_file, start, end, [peak]]
+                batches.append(batch)
+    return [tuple(batch) for batch in batches]
+
+def batch_clip_cmd(source_file, start, end, peaks, out_paths, thread_opts=()):
+    """
+    One ffmpeg command cutting several original clips from one source.
+
+    The source is seeked once to start and decoded once up to end; each clip
+    is a trim/atrim branch of that decode, encoded with the same settings as
+    a single original clip. out_paths maps each peak's clip name to its path.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error",
+           "-ss", str(start), "-t", str(end - start), "-i", source_file]
+    n = len(peaks)
+    graph = [
+        f"[0:v:0]split={n}" + "".join(f"[v{j}]" for j in range(n)),
+        f"[0:a:0]asplit={n}" + "".join(f"[a{j}]" for j in range(n)),
+    ]
+    maps = []
+    for j, peak in enumerate(peaks):
+        offset = round(peak["abs_start_sec"] - start, 6)
+        trim = f"start={offset}:duration={peak['duration_sec']}"
+        graph.append(f"[v{j}]trim={trim},setpts=PTS-STARTPTS[cv{j}]")
+        graph.append(f"[a{j}]atrim={trim},asetpts=PTS-STARTPTS[ca{j}]")
+        # Same settings as a single original clip, for Mac QuickTime compatibility
+        maps += [
+            "-map", f"[cv{j}]", "-map", f"[ca{j}]",
+            "-c:v", "libx264",
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-ac", "2",
+            "-b:a", "192k",
+            "-movflags", "+faststart",
+            *thread_opts,
+            "-y",
+            out_paths[clip_name(peak)]
+        ]
+    return cmd + ["-filter_complex", ";".join(graph)] + maps
+
+def clip_outputs(output_dir, out_name):
+    """
+    Paths of every rendition of a clip, None for renditions that are disabled.
+    """
+    stem = os.path.splitext(out_name)[0]
+    return {
+        "original": os.path.join(output_dir, "original", out_name),
+        "540": os.path.join(output_dir, "540", stem + "_540p.mp4") if OUTPUT_540P_MP4 else None,
+        "scrolling": os.path.join(output_dir, "scrolling", stem + "_scrolling.mp4") if OUTPUT_SCROLLING_MP4 else None,
+        "540_gif": os.path.join(output_dir, "540_gif", stem + "_540.gif") if OUTPUT_540P_GIF else None,
+        "270_gif": os.path.join(output_dir, "270_gif", stem + "_270.gif") if OUTPUT_270P_GIF else None,
+    }
+
+def single_pass_clip_cmd(source_file, abs_start_sec, duration_sec, outputs, thread_opts=()):
+    """
+    One ffmpeg command that decodes the clip once and writes every enabled
+    rendition through a single filter graph: the video is split into the
+    original, 540p, scrolling and GIF branches (each GIF branch doing its own
+    palettegen/paletteuse), the audio into the original and 540p outputs.
+    Encoding settings are the same as the separate per-rendition commands.
+    """
+    gifs = [(w, outputs[f"{w}_gif"]) for w in (540, 270) if outputs[f"{w}_gif"]]
+    v_labels = ["vorig"]
+    if outputs["540"]:
+        v_labels.append("v540")
+    if outputs["scrolling"]:
+        v_labels.append("vscroll")
+    v_labels += [f"vgif{w}" for w, _ in gifs]
+    a_labels = ["aorig"] + (["a540"] if outputs["540"] else [])
+    graph = [
+        f"[0:v:0]split={len(v_labels)}" + "".join(f"[{l}]" for l in v_labels),
+        f"[0:a:0]asplit={len(a_labels)}" + "".join(f"[{l}]" for l in a_labels),
+    ]
+    if outputs["540"]:
+        graph.append("[v540]scale=-2:540[o540]")
+    for w, _ in gifs:
+        graph.append(f"[vgif{w}]fps=15,scale=-2:{w}:flags=lanczos,split[g{w}a][g{w}b]")
+        graph.append(f"[g{w}a]palettegen[p{w}]")
+        graph.append(f"[g{w}b][p{w}]paletteuse[ogif{w}]")
+    mp4_audio = ["-c:a", "aac", "-ac", "2", "-b:a", "192k"]
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-ss", str(abs_start_sec),
+        "-t", str(duration_sec),
+        "-i", source_file,
+        "-filter_complex", ";".join(graph),
+        # Original, for Mac QuickTime compatibility
+        "-map", "[vorig]", "-map", "[aorig]",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", *mp4_audio,
+        "-movflags", "+faststart", *thread_opts, "-y", outputs["original"],
+    ]
+    if outputs["540"]:
+        cmd += [
+            "-map", "[o540]", "-map", "[a540]",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", *mp4_audio,
+            "-movflags", "+faststart", *thread_opts, "-y", outputs["540"],
+        ]
+    if outputs["scrolling"]:
+        cmd += [
+            "-map", "[vscroll]",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
+            "-g", "1", "-keyint_min", "1", "-sc_threshold", "0",
+            "-pix_fmt", "yuv420p", "-an",
+            "-movflags", "+faststart", *thread_opts, "-y", outputs["scrolling"],
+        ]
+    for w, path in gifs:
+        cmd += ["-map", f"[ogif{w}]", *thread_opts, "-y", path]
+    return cmd
+
+def skip_up_to_date(clip_jobs, manifest):
+    """
+    Drop jobs whose outputs the manifest shows are up to date, and make the
+    kept ones record themselves in it when they succeed. Jobs are expected in
+    dependency order; a job whose dependency is rerun is rerun too.
+    """
+    produced = {path for job in clip_jobs for path in job.outputs}
+    source_states = {}
+
+    def state(path):
+        if path in produced:
+            # Clip rendered by this run (e.g. the original of a GIF)
+            return manifest_state(path) if os.path.exists(path) else None
+        # Sources are large: fingerprint them once, by sampled content
+        if path not in source_states:
+            source_states[path] = cache.fingerprint(path)
+        return source_states[path]
+
+    def record(stage, job, params):
+        manifest.record(stage, {path: state(path) for path in job.inputs}, params, job.outputs, save=False)
+
+    kept = []
+    rerun = set()
+    for job in clip_jobs:
+        stage = f"clip:{job.name}"
+        params = {"cmds": [_without_threads(cmd) for cmd in job.cmds if not callable(cmd)]}
+        inputs = {path: state(path) for path in job.inputs}
+        if not any(dep in rerun for dep in job.deps) and manifest.is_fresh(stage, inputs, params):
+            continue
+        rerun.add(job.name)
+        # Dependencies that are up to date are not run
+        job.deps = [dep for dep in job.deps if dep in rerun]
+        job.cmds.append(lambda stage=stage, job=job, params=params: record(stage, job, params))
+        kept.append(job)
+    if len(kept) < len(clip_jobs):
+        print(f"Up to date: {len(clip_jobs) - len(kept)} of {len(clip_jobs)} clip jobs")
+    if kept:
+        # Clip records are saved in batches; write the rest once every clip is done
+        kept.append(Job(f"manifest: {manifest.path}", [manifest.save],
+                        deps=[job.name for job in kept]))
+    return kept
+
+def _without_threads(cmd):
+    # The thread budget depends on the machine, not on what is rendered
+    out = []
+    skip = False
+    for arg in cmd:
+        if skip:
+            skip = False
+        elif arg == "-threads":
+            skip = True
+        else:
+            out.append(arg)
+    return out
+
+def extract_clips_from_peaks(peaks_json_path, output_dir=None, jobs=1, threads=None, single_pass=False,
+                             batch=False, manifest=None, peaks=None, fast_cut=False):
+    """
+    Render the clips listed in a peaks JSON file, or those of peaks (a peak
+    list, e.g. from store.PeakStore.query; output_dir is then required).
+
+    Up to jobs ffmpeg processes run at once, each limited to threads threads
+    (by default the CPU count shared between jobs). Renditions derived from a
+    peak's original clip start once that clip is written. With single_pass,
+    each clip is decoded once and all its renditions come out of one ffmpeg.
+    With batch, original clips close to each other in a source are cut by
+    one ffmpeg process from a single seek and decode (see plan_batches);
+    batch takes precedence over single_pass. With fast_cut, original clips copy the whole GOPs of their
+    source and re-encode only their edges (see smartcut); it takes precedence
+    over batch and single_pass. With a manifest, renditions already up to
+    date are skipped.
+    """
     check_ffmpeg()
-    with open(peaks_json_path, "r") as f:
-        peaks = json.load(f)
+    if peaks is None:
+        with open(peaks_json_path, "r") as f:
+            peaks = json.load(f)
     if not peaks:
         print("No peaks found in JSON.")
         return
@@ -26,6 +247,24 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
     if output_dir is None:
         output_dir = os.path.dirname(peaks_json_path)
 
+    clip_jobs = clip_jobs_for_peaks(peaks, output_dir, ffmpeg_threads(jobs, threads), single_pass, batch,
+                                    fast_cut)
+    if manifest is not None:
+        clip_jobs = skip_up_to_date(clip_jobs, manifest)
+    with profiling.stage("extract_clips", jobs=len(clip_jobs)):
+        try:
+            run_jobs(clip_jobs, max_workers=jobs)
+        finally:
+            # Keep the clips that were rendered before a failure
+            if manifest is not None:
+                manifest.save()
+    print(f"All clips extracted to: {output_dir}")
+
+def clip_jobs_for_peaks(peaks, output_dir, thread_opts=(), single_pass=False, batch=False, fast_cut=False):
+    """
+    Jobs rendering every clip of peaks into output_dir (see
+    extract_clips_from_peaks), with its subfolders created.
+    """
     # Define subfolders for each output type
     original_dir = os.path.join(output_dir, "original")
     mp4_540_dir = os.path.join(output_dir, "540")
@@ -36,13 +275,37 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
     for d in [original_dir, mp4_540_dir, gif_540_dir, gif_270_dir, scrolling_dir]:
         os.makedirs(d, exist_ok=True)
 
+    clip_jobs = []
+    # Job that writes each original clip
+    source_jobs = {}
+    # Packet index of each source, for fast cuts
+    indexes = {}
+    if fast_cut:
+        batch = single_pass = False
+    if batch:
+        single_pass = False
+        out_paths = {clip_name(p): os.path.join(original_dir, clip_name(p)) for p in peaks}
+        for n, (source_file, start, end, clips) in enumerate(plan_batches(peaks)):
+            name = f"batch {n}: {source_file}"
+            for p in clips:
+                source_jobs[out_paths[clip_name(p)]] = name
+            cmd = batch_clip_cmd(source_file, start, end, clips, out_paths, thread_opts)
+            clip_jobs.append(Job(name, [cmd],
+                                 message=f"Extracting {len(clips)} clips from {source_file} "
+                                         f"({end - start:.1f} s decoded from one seek)",
+                                 inputs=[source_file], outputs=[out_paths[clip_name(p)] for p in clips]))
     for peak in peaks:
         source_file = peak["source_file"]
         abs_start_sec = peak["abs_start_sec"]
         duration_sec = peak["duration_sec"]
-        base = os.path.splitext(os.path.basename(source_file))[0]
-        out_name = f"{base}_{abs_start_sec:.3f}.mp4"
-        out_path = os.path.join(original_dir, out_name)
+        out_name = clip_name(peak)
+        outputs = clip_outputs(output_dir, out_name)
+        out_path = outputs["original"]
+        if single_pass:
+            cmd = single_pass_clip_cmd(source_file, abs_start_sec, duration_sec, outputs, thread_opts)
+            clip_jobs.append(Job(out_path, [cmd], message=f"Extracting all renditions: {out_path}",
+                                 inputs=[source_file], outputs=[p for p in outputs.values() if p]))
+            continue
         # ffmpeg command for Mac QuickTime compatibility
         cmd = [
             "ffmpeg", "-hide_banner", "-loglevel", "error",
@@ -56,16 +319,30 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
             "-ac", "2",
             "-b:a", "192k",
             "-movflags", "+faststart",
+            *thread_opts,
             "-y",  # Overwrite
             out_path
         ]
-        print(f"Extracting: {out_path}")
-        subprocess.run(cmd, check=True)
+        if out_path not in source_jobs:
+            source_jobs[out_path] = out_path
+            cut = None
+            if fast_cut:
+                from .smartcut import index_path, load_index, smart_cut_cmds
+                if source_file not in indexes:
+                    indexes[source_file] = load_index(source_file, output_dir)
+                cut = smart_cut_cmds(source_file, abs_start_sec, duration_sec, indexes[source_file],
+                                     out_path, thread_opts, fallback=cmd,
+                                     index_file=index_path(source_file, output_dir))
+            if cut is not None:
+                cut_cmds, parts = cut
+                clip_jobs.append(Job(out_path, cut_cmds, message=f"Fast-cutting: {out_path}",
+                                     cleanup=parts, inputs=[source_file]))
+            else:
+                clip_jobs.append(Job(out_path, [cmd], message=f"Extracting: {out_path}", inputs=[source_file]))
 
         # Optionally create a 540p mp4 version
         if OUTPUT_540P_MP4:
-            out_540p_name = os.path.splitext(out_name)[0] + "_540p.mp4"
-            out_540p_path = os.path.join(mp4_540_dir, out_540p_name)
+            out_540p_path = outputs["540"]
             cmd_540p = [
                 "ffmpeg", "-hide_banner", "-loglevel", "error",
                 "-i", out_path,
@@ -76,16 +353,16 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
                 "-ac", "2",
                 "-b:a", "192k",
                 "-movflags", "+faststart",
+                *thread_opts,
                 "-y",
                 out_540p_path
             ]
-            print(f"Creating 540p mp4: {out_540p_path}")
-            subprocess.run(cmd_540p, check=True)
+            clip_jobs.append(Job(out_540p_path, [cmd_540p], deps=[source_jobs[out_path]],
+                                 message=f"Creating 540p mp4: {out_540p_path}", inputs=[out_path]))
 
         # Optionally create a scrolling (all-I-frames) MP4
         if OUTPUT_SCROLLING_MP4:
-            out_scroll_name = os.path.splitext(out_name)[0] + "_scrolling.mp4"
-            out_scroll_path = os.path.join(scrolling_dir, out_scroll_name)
+            out_scroll_path = outputs["scrolling"]
             cmd_scroll = [
                 "ffmpeg", "-hide_banner", "-loglevel", "error",
                 "-i", out_path,
@@ -98,18 +375,19 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
                 "-pix_fmt", "yuv420p",
                 "-an",
                 "-movflags", "+faststart",
+                *thread_opts,
                 "-y",
                 out_scroll_path
             ]
-            print(f"Creating scrolling all-I-frames mp4: {out_scroll_path}")
-            subprocess.run(cmd_scroll, check=True)
+            clip_jobs.append(Job(out_scroll_path, [cmd_scroll], deps=[source_jobs[out_path]],
+                                 message=f"Creating scrolling all-I-frames mp4: {out_scroll_path}",
+                                 inputs=[out_path]))
 
         # Optionally create 540px and 270px GIFs
         for width, enabled in [(540, OUTPUT_540P_GIF), (270, OUTPUT_270P_GIF)]:
             if enabled:
                 gif_dir = gif_540_dir if width == 540 else gif_270_dir
-                out_gif_name = os.path.splitext(out_name)[0] + f"_{width}.gif"
-                out_gif_path = os.path.join(gif_dir, out_gif_name)
+                out_gif_path = outputs[f"{width}_gif"]
                 # Use palette for better GIF quality
                 palette_name = os.path.splitext(out_name)[0] + f"_palette_{width}.png"
                 palette_path = os.path.join(gif_dir, palette_name)
@@ -118,22 +396,22 @@ def extract_clips_from_peaks(peaks_json_path, output_dir=None):
                     "ffmpeg", "-hide_banner", "-loglevel", "error",
                     "-i", out_path,
                     "-vf", f"fps=15,scale=-2:{width}:flags=lanczos,palettegen",
+                    *thread_opts,
                     "-y",
                     palette_path
                 ]
-                subprocess.run(cmd_palette, check=True)
                 # 2. Create GIF using palette
                 cmd_gif = [
                     "ffmpeg", "-hide_banner", "-loglevel", "error",
                     "-i", out_path,
                     "-i", palette_path,
                     "-filter_complex", f"fps=15,scale=-2:{width}:flags=lanczos[x];[x][1:v]paletteuse",
+                    *thread_opts,
                     "-y",
                     out_gif_path
                 ]
-                print(f"Creating {width}px GIF: {out_gif_path}")
-                subprocess.run(cmd_gif, check=True)
-                # Remove palette file
-                os.remove(palette_path)
-
-    print(f"All clips extracted to: {output_dir}")
+                # Palette file is removed once the GIF is written
+                clip_jobs.append(Job(out_gif_path, [cmd_palette, cmd_gif], deps=[source_jobs[out_path]],
+                                     message=f"Creating {width}px GIF: {out_gif_path}",
+                                     cleanup=[palette_path], inputs=[out_path]))
+    return clip_jobs
@@ -5,77 +5,203 @@ Usage:
     --window 2.0 --hop 0.5 --top 10
 """
 import argparse, json
+import math
 import numpy as np
-import librosa
 
-def find_loud_segments(path, sr, window, hop, top_n=None):
+from . import profiling
+
+BIN_SIZE = 900  # 15 minutes
+PEAKS_PER_BIN = 5
+MIN_RMS = 0.005
+# Frame scoring: "rms" (plain RMS) or "lufs" (K-weighted loudness, see loudness.py)
+SCORERS = ("rms", "lufs")
+# Number of block sums squared and reduced at a time when building the envelope
+ENVELOPE_CHUNK_BLOCKS = 1 << 16
+
+def load_mono(path, sr):
+    """
+    Decode an audio file to mono float32, resampled to sr (None for native).
+    Returns (y, sr) with sr the effective sample rate.
     """
-    Find top peaks per 15-minute bin (default: 5 per bin, at least 1 per file).
+    # librosa pulls in scipy and numba: only imported when decoding
+    import librosa
+    y, sr = librosa.load(path, sr=sr, mono=True)
+    return y, sr
+
+def rms_envelope(y, win_length, hop_length):
+    """
+    RMS of every win_length window of y, one window every hop_length samples.
+    A 2-D y of shape (samples, channels) gives one envelope column per channel.
+
+    The signal is reduced once into sums of squares over blocks of
+    gcd(win_length, hop_length) samples; every window is then a difference of
+    two entries of the prefix sum over those blocks.
     """
-    y, _ = librosa.load(path, sr=sr, mono=True)
     n = len(y)
-    win_length = int(window * sr)
-    hop_length = int(hop * sr)
-    duration = n / sr
-    bin_size = 900  # 15 minutes
-    peaks_per_bin = 5
+    channels = np.shape(y)[1:]
+    if win_length <= 0 or hop_length <= 0 or n < win_length:
+        return np.zeros((0,) + channels)
+    num_frames = (n - win_length) // hop_length + 1
+    block = math.gcd(win_length, hop_length)
+    num_blocks = (num_frames - 1) * hop_length // block + win_length // block
+    csum = np.zeros((num_blocks + 1,) + channels)
+    for s in range(0, num_blocks, ENVELOPE_CHUNK_BLOCKS):
+        e = min(s + ENVELOPE_CHUNK_BLOCKS, num_blocks)
+        seg = np.asarray(y[s * block:e * block], dtype=np.float64).reshape((e - s, block) + channels)
+        csum[s + 1:e + 1] = np.einsum("ij...,ij...->i...", seg, seg)
+    np.cumsum(csum, axis=0, out=csum)
+    first = np.arange(num_frames) * (hop_length // block)
+    sums = csum[first + win_length // block] - csum[first]
+    return np.sqrt(np.maximum(sums, 0.0) / win_length)
+
+def frame_starts(num_frames, hop_length, sr):
+    """
+    Start time in seconds of each envelope frame.
+    """
+    return np.arange(num_frames) * hop_length / sr
+
+def _ranked(rms, candidates, count):
+    """
+    Indices of the count loudest candidates (plus any tied with the last one),
+    ordered by rms descending and then by time.
+    """
+    values = rms[candidates]
+    if count < len(candidates):
+        threshold = np.partition(values, len(values) - count)[len(values) - count]
+        keep = values >= threshold
+        candidates, values = candidates[keep], values[keep]
+    return candidates[np.lexsort((candidates, -values))]
+
+def to_db(rms, scorer="rms"):
+    """
+    Envelope values of scorer in dB: dBFS for RMS, LUFS values as they are.
+    """
+    if scorer == "lufs":
+        return rms
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(rms)
+
+def select_bin(rms, starts, window, top_n=None, scorer="rms", momentary=None):
+    """
+    Pick the top_n (default 5) loudest non-overlapping frames among the
+    envelope frames of one bin. Returns segment dicts in time order, with
+    the loudness of the frame in dB ("rms_db") and, given the momentary
+    loudness of the frames, its "momentary_lufs".
+
+    Frames are taken greedily from the loudest down; each pick masks every
+    frame whose window overlaps its own. Only a partition of the loudest
+    candidates is sorted, growing it if too many of them get masked.
+    """
+    top_n = PEAKS_PER_BIN if top_n is None else top_n
+    if scorer == "lufs":
+        from .loudness import MIN_LUFS as floor
+    else:
+        floor = MIN_RMS
+    candidates = np.flatnonzero(rms >= floor)
+    if not len(candidates):
+        return []
+    ends = starts + window
+    selected = []
+    pool = max(1, top_n) * 16
+    while True:
+        suppressed = np.zeros(len(rms), dtype=bool)
+        selected = []
+        ranked = _ranked(rms, candidates, pool)
+        for c in ranked:
+            if suppressed[c]:
+                continue
+            selected.append(c)
+            if len(selected) >= top_n:
+                break
+            # Mask frames that end after this one starts and start before it ends
+            lo = int(np.searchsorted(ends, starts[c], side="right"))
+            hi = int(np.searchsorted(starts, ends[c], side="left"))
+            suppressed[lo:hi] = True
+        if len(selected) >= top_n or len(ranked) == len(candidates):
+            break
+        pool *= 4
+    # Always select at least 1 (the loudest) if bin has any candidates
+    if not selected:
+        selected.append(_ranked(rms, candidates, 1)[0])
+    segments = [{
+        "start_sec":    float(round(float(starts[i]), 3)),
+        "duration_sec": float(round(window, 3)),
+        "rms_db":       float(round(float(to_db(rms[i], scorer)), 3))
+    } for i in sorted(selected)]
+    if momentary is not None:
+        for seg, i in zip(segments, sorted(selected)):
+            seg["momentary_lufs"] = float(round(float(momentary[i]), 3))
+    return segments
+
+def select_peaks(rms, starts, window, duration, top_n=None, bin_size=BIN_SIZE, scorer="rms", momentary=None):
+    """
+    Pick the top_n loudest non-overlapping frames of an envelope per bin of
+    bin_size seconds, or over the whole envelope if bin_size is None.
+    """
+    if not bin_size:
+        return select_bin(rms, starts, window, top_n, scorer, momentary)
     segments = []
     # Always at least 1 bin
     num_bins = max(1, int(np.ceil(duration / bin_size)))
     for b in range(num_bins):
         bin_start = b * bin_size
         bin_end = min((b + 1) * bin_size, duration)
-        # Find candidate frames in this bin
-        candidates = []
-        min_rms = 0.005
-        for i in range(0, n - win_length + 1, hop_length):
-            start_sec = i / sr
-            if start_sec < bin_start or start_sec >= bin_end:
-                continue
-            seg = y[i:i+win_length]
-            rms_val = np.sqrt(np.mean(seg ** 2))
-            if rms_val >= min_rms:
-                candidates.append({
-                    "rms": float(rms_val),
-                    "start": start_sec,
-                    "idx": i
-                })
-        # Sort by rms descending
-        candidates.sort(key=lambda x: x["rms"], reverse=True)
-        selected = []
-        selected_intervals = []
-        for cand in candidates:
-            c_start = cand["start"]
-            c_end = c_start + window
-            overlap = False
-            for (s, e) in selected_intervals:
-                if not (c_end <= s or c_start >= e):
-                    overlap = True
-                    break
-            if not overlap:
-                selected.append(cand)
-                selected_intervals.append((c_start, c_end))
-            if len(selected) >= peaks_per_bin:
-                break
-        # Always select at least 1 (the loudest) if bin has any candidates
-        if not selected and candidates:
-            selected.append(candidates[0])
-        segments.extend({
-            "start_sec":    float(round(cand["start"], 3)),
-            "duration_sec": float(round(window, 3)),
-            "rms_db":       float(round(float(cand["rms"]), 3))
-        } for cand in sorted(selected, key=lambda x: x["start"]))
+        lo = int(np.searchsorted(starts, bin_start, side="left"))
+        hi = int(np.searchsorted(starts, bin_end, side="left"))
+        segments.extend(select_bin(rms[lo:hi], starts[lo:hi], window, top_n, scorer,
+                                   None if momentary is None else momentary[lo:hi]))
     return segments
 
+def compute_envelope(path, sr, window, hop, scorer="rms"):
+    """
+    Decode path and compute its envelope: RMS, or with scorer "lufs" the
+    short-term loudness, with the momentary loudness under "momentary".
+    Returns a dict with the envelope ("rms") and the "scorer", "sr",
+    "hop_length" and "duration" needed to read it and place its frames in time.
+    """
+    with profiling.stage("decode", path=path):
+        y, sr = load_mono(path, sr)
+    win_length = int(window * sr)
+    hop_length = int(hop * sr)
+    envelope = {"scorer": scorer, "sr": sr, "hop_length": hop_length, "duration": len(y) / sr}
+    if scorer == "lufs":
+        from .loudness import loudness_envelope
+        with profiling.stage("loudness_envelope", samples=len(y)):
+            envelope["rms"], envelope["momentary"] = loudness_envelope(y, sr, win_length, hop_length)
+    else:
+        with profiling.stage("rms_envelope", samples=len(y)):
+            envelope["rms"] = rms_envelope(y, win_length, hop_length)
+    return envelope
+
+def envelope_peaks(envelope, window, top_n=None, bin_size=BIN_SIZE):
+    """
+    select_peaks on an envelope dict (see compute_envelope).
+    """
+    starts = frame_starts(len(envelope["rms"]), envelope["hop_length"], envelope["sr"])
+    return select_peaks(envelope["rms"], starts, window, envelope["duration"], top_n, bin_size,
+                        envelope.get("scorer", "rms"), envelope.get("momentary"))
+
+def find_loud_segments(path, sr, window, hop, top_n=None, bin_size=BIN_SIZE, scorer="rms"):
+    """
+    Find the top_n peaks (default 5) per 15-minute bin, or over the whole file
+    if bin_size is None. At least 1 peak per bin with any sound.
+    """
+    envelope = compute_envelope(path, sr, window, hop, scorer)
+    with profiling.stage("select_peaks"):
+        return envelope_peaks(envelope, window, top_n, bin_size)
+
 def main():
     p = argparse.ArgumentParser(description=__doc__)
     p.add_argument("input", help="path to audio file (WAV/FLAC)")
     p.add_argument("--sr", type=int, default=None, help="sample rate to resample to (None for native)")
     p.add_argument("--window", type=float, default=2.0, help="window size in seconds")
     p.add_argument("--hop", type=float, default=0.5, help="hop size in seconds")
-    p.add_argument("--top", type=int, default=10, help="number of top segments to return")
+    p.add_argument("--top", type=int, default=10, help="number of top segments to return per 15-minute bin")
+    p.add_argument("--global-top", action="store_true", help="return the top segments of the whole file instead of per bin")
+    p.add_argument("--scorer", choices=SCORERS, default="rms", help="rank windows by RMS or K-weighted loudness (LUFS)")
     args = p.parse_args()
-    segs = find_loud_segments(args.input, args.sr, args.window, args.hop, args.top)
+    segs = find_loud_segments(args.input, args.sr, args.window, args.hop, args.top,
+                              None if args.global_top else BIN_SIZE, args.scorer)
     print(json.dumps(segs, indent=2))
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Live peak detection for simple-peaks.
+
+Follows a recording while it is being written (ffmpeg's -follow) or reads
+raw s16le PCM from stdin, and reports peaks as soon as they are final.
+Peaks are selected per short bin (one minute by default), so a peak is
+final, and printed as one NDJSON line, at most one bin plus one window
+after it was recorded. Envelope frames of the current bin are kept in a
+buffer of fixed size, reused for every bin: memory does not grow with the
+length of the session.
+"""
+import json
+import math
+import sys
+
+import numpy as np
+
+from . import find_loud
+from .streaming import EnvelopeStream
+
+LIVE_BIN_SIZE = 60  # seconds
+LIVE_BLOCK_SEC = 0.5
+FOLLOW_TIMEOUT = 30  # seconds without new data before a followed file is done
+
+class LiveSelector:
+    """
+    Turns mono blocks into final peaks: the top_n loudest non-overlapping
+    frames of each bin_size-second bin, returned once the bin is complete.
+    """
+    def __init__(self, sr, window, hop, bin_size=LIVE_BIN_SIZE, top_n=1):
+        self.sr = sr
+        self.window = window
+        self.hop_length = int(hop * sr)
+        self.bin_size = bin_size
+        self.top_n = top_n
+        self.envelope = EnvelopeStream(int(window * sr), self.hop_length)
+        capacity = int(math.ceil(bin_size * sr / self.hop_length)) + 1
+        self.rms = np.zeros(capacity)
+        self.starts = np.zeros(capacity)
+        self.filled = 0
+        self.frames = 0
+        self.bin = 0
+
+    def push(self, block):
+        """
+        Add samples and return the peaks of any bins they completed.
+        """
+        rms = self.envelope.push(block)
+        starts = (self.frames + np.arange(len(rms))) * self.hop_length / self.sr
+        self.frames += len(rms)
+        peaks = []
+        while len(rms):
+            bin_end = (self.bin + 1) * self.bin_size
+            split = int(np.searchsorted(starts, bin_end, side="left"))
+            self.rms[self.filled:self.filled + split] = rms[:split]
+            self.starts[self.filled:self.filled + split] = starts[:split]
+            self.filled += split
+            if split == len(rms):
+                break
+            peaks.extend(self._flush())
+            rms, starts = rms[split:], starts[split:]
+        return peaks
+
+    def finish(self):
+        """
+        Peaks of the last, partial bin.
+        """
+        return self._flush()
+
+    def _flush(self):
+        segs = find_loud.select_bin(self.rms[:self.filled], self.starts[:self.filled],
+                                    self.window, self.top_n)
+        for seg in segs:
+            seg["bin"] = self.bin
+        self.filled = 0
+        self.bin += 1
+        return segs
+
+def follow_blocks(input_path, sr, blocksize, timeout=FOLLOW_TIMEOUT):
+    """
+    Mono float32 blocks of a file that may still be growing, resampled by
+    ffmpeg to sr. Ends once no data arrived for timeout seconds.
+    """
+    from .audio_utils import pcm_blocks
+    follow = ["-follow", "1", "-rw_timeout", str(int(timeout * 1e6))]
+    for block in pcm_blocks(input_path, channels=2, block_frames=blocksize, sr=sr, input_opts=follow):
+        y = block.mean(axis=1, dtype=np.float32)
+        y *= 1.0 / 32768
+        yield y
+
+def stdin_blocks(channels, blocksize):
+    """
+    Mono float32 blocks of raw s16le PCM with channels channels read from stdin.
+    """
+    from .audio_utils import read_pcm
+    for block in read_pcm(sys.stdin.buffer, channels, blocksize):
+        y = block.mean(axis=1, dtype=np.float32)
+        y *= 1.0 / 32768
+        yield y
+
+def live_peaks(input_path, sr, window=2.0, hop=0.5, bin_size=LIVE_BIN_SIZE, top_n=1,
+               channels=2, timeout=FOLLOW_TIMEOUT, out=None, clips_dir=None, threads=None):
+    """
+    Print every final peak of input_path ("-" for PCM on stdin, which needs
+    sr and channels) to out as one JSON line, as the recording grows.
+    With clips_dir, the clips of each peak are extracted there in the
+    background once it is final; the source must then be readable while
+    written (e.g. MPEG-TS or Matroska, not MP4). Returns the peaks.
+    """
+    out = sys.stdout if out is None else out
+    if input_path == "-":
+        if not sr:
+            raise ValueError("Reading PCM from stdin needs its sample rate (--sr)")
+        blocks = stdin_blocks(channels, int(LIVE_BLOCK_SEC * sr))
+    else:
+        if not sr:
+            from .audio_utils import probe_sample_rate
+            sr = probe_sample_rate(input_path)
+        blocks = follow_blocks(input_path, sr, int(LIVE_BLOCK_SEC * sr), timeout)
+    clip_pool = None
+    if clips_dir is not None:
+        if input_path == "-":
+            raise ValueError("Clips need a source file, not stdin")
+        from concurrent.futures import ThreadPoolExecutor
+        from .extract_clips import check_ffmpeg, clip_jobs_for_peaks
+        from .scheduler import ffmpeg_threads, run_jobs
+        check_ffmpeg()
+        clip_pool = ThreadPoolExecutor(max_workers=1)
+        clip_futures = []
+    selector = LiveSelector(sr, window, hop, bin_size, top_n)
+    peaks = []
+
+    def emit(segs):
+        for seg in segs:
+            peak = {
+                "wav_file": None,
+                "start_sec": seg["start_sec"],
+                "duration_sec": seg["duration_sec"],
+                "abs_start_sec": seg["start_sec"],
+                "source_file": input_path,
+                "rms_db": seg["rms_db"],
+                "bin": seg["bin"],
+            }
+            out.write(json.dumps(peak) + "\n")
+            out.flush()
+            peaks.append(peak)
+            if clip_pool is not None:
+                jobs = clip_jobs_for_peaks([peak], clips_dir, ffmpeg_threads(1, threads))
+                clip_futures.append(clip_pool.submit(run_jobs, jobs))
+
+    for block in blocks:
+        emit(selector.push(block))
+    emit(selector.finish())
+    if clip_pool is not None:
+        clip_pool.shutdown(wait=True)
+        for future in clip_futures:
+            future.result()
+    return peaks
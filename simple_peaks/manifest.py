@@ -0,0 +1,101 @@
+"""
+Stage manifest for resumable simple-peaks runs.
+
+manifest.json in the output folder records, for each stage (WAV split,
+peaks JSON, every clip rendition), the fingerprints of its inputs,
+its parameters and the size and mtime of each output it wrote. A rerun skips
+a stage whose inputs and parameters are unchanged and whose outputs are
+still on disk as written; force rebuilds everything.
+"""
+import json
+import os
+import threading
+import time
+
+MANIFEST_NAME = "manifest.json"
+# Records made with save=False are written at most this often (seconds)
+SAVE_INTERVAL = 5.0
+
+def file_state(path):
+    """
+    Cheap fingerprint of an output file: size and mtime.
+    """
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def _normalize(value):
+    # Compare parameters the way they are stored
+    return json.loads(json.dumps(value, sort_keys=True))
+
+class Manifest:
+    """
+    The stage records of one output folder. Safe to update from several threads.
+    """
+    def __init__(self, out_dir, force=False):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.force = force
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.saved = time.monotonic()
+        self.dirty = False
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.stages = json.load(f).get("stages", {})
+            except ValueError:
+                self.stages = {}
+
+    def is_fresh(self, stage, inputs, params):
+        """
+        True if stage ran with the same inputs and params and all its outputs
+        are unchanged since.
+        """
+        if self.force:
+            return False
+        entry = self.stages.get(stage)
+        if not entry or entry["inputs"] != _normalize(inputs) or entry["params"] != _normalize(params):
+            return False
+        for path, state in entry["outputs"].items():
+            if not os.path.exists(path) or file_state(path) != state:
+                return False
+        return True
+
+    def outputs(self, stage):
+        """
+        Output paths recorded for stage, in the order they were recorded.
+        """
+        return list(self.stages[stage]["outputs"])
+
+    def record(self, stage, inputs, params, outputs, save=True):
+        """
+        Record a completed stage and save the manifest. With save=False (many
+        small stages, such as clips), it is saved only every SAVE_INTERVAL
+        seconds; call save() once they are done.
+        """
+        entry = {
+            "inputs": _normalize(inputs),
+            "params": _normalize(params),
+            "outputs": {path: file_state(path) for path in outputs},
+            "updated": time.time(),
+        }
+        with self.lock:
+            self.stages[stage] = entry
+            self.dirty = True
+            if save or time.monotonic() - self.saved >= SAVE_INTERVAL:
+                self._write()
+
+    def save(self):
+        """
+        Write any records not saved yet.
+        """
+        with self.lock:
+            if self.dirty:
+                self._write()
+
+    def _write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"stages": self.stages}, f, indent=2)
+        os.replace(tmp, self.path)
+        self.saved = time.monotonic()
+        self.dirty = False
@@ -0,0 +1,208 @@
+"""
+Optional instrumentation of simple-peaks runs (--profile).
+
+Stages (stage(name) blocks) and external commands (run and wait instead of
+plain subprocess calls) are recorded while a profile is active: wall time,
+CPU time, bytes read and written, peak RSS and, for commands, the exact
+command line. The records are written as a Chrome trace-event JSON (open it
+in chrome://tracing or https://ui.perfetto.dev) and summed up per stage and
+command in a table. With no active profile, stage does nothing and run is
+subprocess.run.
+
+Stage CPU time is that of the calling thread; bytes are those of the whole
+Python process (/proc/self/io, Linux only). Commands are measured on their
+own, from their rusage and /proc/<pid>/io just before they are reaped. Work
+done in worker processes (--jobs) only shows as the time of its stage.
+"""
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+_active = None
+_local = threading.local()
+
+class Profile:
+    """
+    Trace events of one run.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+        self.threads = {}
+
+    def add(self, name, cat, start, end, args):
+        tid = threading.get_ident()
+        with self.lock:
+            self.events.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": round((start - self.origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": self.threads.setdefault(tid, len(self.threads) + 1),
+                "args": args,
+            })
+
+    def write_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, indent=1)
+
+    def summary(self):
+        """
+        Table of wall and CPU time, bytes and peak RSS per stage and command.
+        """
+        rows = {}
+        for event in self.events:
+            args = event["args"]
+            row = rows.setdefault((event["cat"], event["name"]), [0, 0.0, 0.0, 0, 0, 0.0])
+            row[0] += 1
+            row[1] += event["dur"] / 1e6
+            row[2] += args.get("cpu_sec", 0.0)
+            row[3] += args.get("read_bytes") or 0
+            row[4] += args.get("written_bytes") or 0
+            row[5] = max(row[5], args.get("peak_rss_mb", 0.0))
+        lines = [f"{'stage / command':<40} {'count':>5} {'wall s':>9} {'cpu s':>9} "
+                 f"{'read MB':>9} {'written MB':>10} {'peak RSS MB':>11}"]
+        for (cat, name), row in sorted(rows.items(), key=lambda item: -item[1][1]):
+            label = name if cat == "stage" else f"  {name}"
+            lines.append(f"{label[:40]:<40} {row[0]:>5} {row[1]:>9.2f} {row[2]:>9.2f} "
+                         f"{row[3] / 1e6:>9.1f} {row[4] / 1e6:>10.1f} {row[5]:>11.1f}")
+        return "\n".join(lines)
+
+def enable():
+    """
+    Start recording. Returns the active Profile.
+    """
+    global _active
+    _active = Profile()
+    return _active
+
+def disable():
+    """
+    Stop recording. Returns the Profile that was active, if any.
+    """
+    global _active
+    profile, _active = _active, None
+    return profile
+
+def _rss_mb(usage):
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def _io(pid="self"):
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+@contextlib.contextmanager
+def stage(name, **args):
+    """
+    Record the enclosed block as a stage; args are stored with it.
+    """
+    profile = _active
+    if profile is None:
+        yield
+        return
+    stack = _local.__dict__.setdefault("stages", [])
+    stack.append(name)
+    io_before = _io()
+    cpu_before = time.thread_time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stack.pop()
+        io_after = _io()
+        args = dict(args)
+        args["cpu_sec"] = round(time.thread_time() - cpu_before, 4)
+        args["peak_rss_mb"] = round(_rss_mb(resource.getrusage(resource.RUSAGE_SELF)), 1)
+        if io_before and io_after:
+            args["read_bytes"] = io_after[0] - io_before[0]
+            args["written_bytes"] = io_after[1] - io_before[1]
+        profile.add(name, "stage", start, end, args)
+
+def _exit_code(status):
+    # os.waitstatus_to_exitcode needs Python 3.9; negative for a signal, as Popen does
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def wait(proc):
+    """
+    Wait for a Popen process and return its exit code, recording it as a
+    command of the current stage when a profile is active.
+    """
+    profile = _active
+    if profile is None or not hasattr(os, "wait4"):
+        return proc.wait()
+    start = getattr(proc, "_profile_start", time.perf_counter())
+    # Wait without reaping, so that /proc/<pid>/io can still be read
+    if hasattr(os, "waitid"):
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    io = _io(proc.pid)
+    _, status, usage = os.wait4(proc.pid, 0)
+    end = time.perf_counter()
+    proc.returncode = _exit_code(status)
+    stages = _local.__dict__.get("stages") or ["(no stage)"]
+    args = {
+        "cmd": subprocess.list2cmdline(proc.args) if isinstance(proc.args, list) else str(proc.args),
+        "returncode": proc.returncode,
+        "cpu_sec": round(usage.ru_utime + usage.ru_stime, 4),
+        "user_sec": round(usage.ru_utime, 4),
+        "system_sec": round(usage.ru_stime, 4),
+        "peak_rss_mb": round(_rss_mb(usage), 1),
+    }
+    if io:
+        args["read_bytes"], args["written_bytes"] = io
+    name = f"{os.path.basename(proc.args[0])} ({stages[-1]})"
+    profile.add(name, "subprocess", start, end, args)
+    return proc.returncode
+
+def popen(cmd, **kwargs):
+    """
+    subprocess.Popen, noting the start time for wait.
+    """
+    proc = subprocess.Popen(cmd, **kwargs)
+    proc._profile_start = time.perf_counter()
+    return proc
+
+def run(cmd, check=True):
+    """
+    subprocess.run(cmd, check=check) for commands writing to the terminal,
+    recorded when a profile is active.
+    """
+    if _active is None:
+        return subprocess.run(cmd, check=check)
+    proc = popen(cmd)
+    try:
+        returncode = wait(proc)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return subprocess.CompletedProcess(cmd, returncode)
+
+def finish(trace_path):
+    """
+    Stop recording, write the trace to trace_path and print the summary
+    (to stderr, as stdout may carry a command's JSON output).
+    """
+    profile = disable()
+    if profile is None:
+        return
+    profile.write_trace(trace_path)
+    print(profile.summary(), file=sys.stderr)
+    print(f"Profile trace written to: {trace_path}", file=sys.stderr)
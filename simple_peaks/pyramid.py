@@ -0,0 +1,165 @@
+"""
+Multi-resolution loudness pyramid for simple-peaks.
+
+The pyramid stores sums of squares of the mono signal over fixed base blocks
+(10 ms by default) and over power-of-two groups of them: level k holds sums
+over 2**k base blocks, its last value over the base blocks that remain. All
+levels are concatenated in one little-endian float64 file,
+<base>_loudness.bin, memory-mapped when read; a JSON header
+next to it, <base>_loudness.json, gives the sample rate, the base block size
+and where each level starts.
+
+Any RMS envelope whose window and hop are multiples of the base block is
+answered by slicing level 0, and loudness over a time span at any zoom level
+by slicing the matching level, without decoding the audio again.
+"""
+import json
+import os
+
+import numpy as np
+
+BASE_SEC = 0.01
+
+class PyramidBuilder:
+    """
+    Accumulates base-block sums of squares from consecutive mono blocks.
+    """
+    def __init__(self, sr, base_sec=BASE_SEC):
+        self.sr = sr
+        self.base_samples = max(1, int(round(base_sec * sr)))
+        self.carry = np.zeros(0, dtype=np.float64)
+        self.sums = []
+
+    def push(self, block):
+        buf = np.concatenate([self.carry, np.asarray(block, dtype=np.float64)])
+        n = len(buf) // self.base_samples
+        full = buf[:n * self.base_samples].reshape(n, self.base_samples)
+        self.sums.append(np.einsum("ij,ij->i", full, full))
+        self.carry = buf[n * self.base_samples:]
+
+    def tap(self, blocks):
+        """
+        Pass blocks through unchanged while accumulating them.
+        """
+        for block in blocks:
+            self.push(block)
+            yield block
+
+    def write(self, path):
+        """
+        Write the pyramid to path (.bin) and its header (.json next to it).
+        Returns the header path.
+        """
+        level = np.concatenate(self.sums) if self.sums else np.zeros(0)
+        levels = [level]
+        while len(levels[-1]) >= 2:
+            prev = levels[-1]
+            # An odd last value becomes a partial last cell of the next level
+            if len(prev) % 2:
+                prev = np.append(prev, 0.0)
+            levels.append(prev[0::2] + prev[1::2])
+        header = {
+            "sr": self.sr,
+            "base_samples": self.base_samples,
+            "levels": [],
+            "dtype": "<f8",
+        }
+        offset = 0
+        with open(path, "wb") as f:
+            for k, data in enumerate(levels):
+                f.write(data.astype("<f8").tobytes())
+                header["levels"].append({"offset": offset, "length": len(data), "blocks": 2 ** k})
+                offset += len(data)
+        header_path = os.path.splitext(path)[0] + ".json"
+        with open(header_path, "w") as f:
+            json.dump(header, f, indent=2)
+        return header_path
+
+def pyramid_paths(out_dir, base):
+    """
+    Paths of the pyramid data and header files for a recording.
+    """
+    return (os.path.join(out_dir, f"{base}_loudness.bin"),
+            os.path.join(out_dir, f"{base}_loudness.json"))
+
+class LoudnessPyramid:
+    """
+    Read-only, memory-mapped view of a pyramid written by PyramidBuilder.
+    """
+    def __init__(self, path):
+        stem = os.path.splitext(path)[0]
+        with open(stem + ".json") as f:
+            self.header = json.load(f)
+        self.sr = self.header["sr"]
+        self.base_samples = self.header["base_samples"]
+        self.data = np.memmap(stem + ".bin", dtype=self.header["dtype"], mode="r")
+
+    @property
+    def num_levels(self):
+        return len(self.header["levels"])
+
+    @property
+    def duration(self):
+        return self.header["levels"][0]["length"] * self.base_samples / self.sr
+
+    def level(self, k):
+        """
+        Sums of squares over blocks of 2**k base blocks.
+        """
+        info = self.header["levels"][k]
+        return self.data[info["offset"]:info["offset"] + info["length"]]
+
+    def level_for(self, start_sec, end_sec, max_points):
+        """
+        Finest level showing the span with at most max_points values.
+        """
+        blocks = (end_sec - start_sec) * self.sr / self.base_samples
+        k = 0
+        while k + 1 < self.num_levels and blocks / 2 ** k > max_points:
+            k += 1
+        return k
+
+    def envelope(self, start_sec, end_sec, level=None, max_points=2000):
+        """
+        RMS loudness over [start_sec, end_sec) at a zoom level (chosen from
+        max_points when level is None).
+        Returns {"level", "step_sec", "start_sec", "rms"} for drawing.
+        """
+        if level is None:
+            level = self.level_for(start_sec, end_sec, max_points)
+        samples = self.base_samples * 2 ** level
+        step = samples / self.sr
+        lo = max(0, int(start_sec // step))
+        hi = max(lo, int(np.ceil(end_sec / step)))
+        sums = np.asarray(self.level(level)[lo:hi])
+        # The last cell of a level may cover fewer base blocks
+        total = self.header["levels"][0]["length"]
+        blocks = np.minimum(2 ** level, total - np.arange(lo, lo + len(sums)) * 2 ** level)
+        return {
+            "level": level,
+            "step_sec": step,
+            "start_sec": lo * step,
+            "rms": np.sqrt(sums / (blocks * self.base_samples)).tolist(),
+        }
+
+    def rms(self, window, hop):
+        """
+        RMS envelope for a window and hop that are multiples of the base
+        block: find_loud.rms_envelope of the decoded signal, less any frame
+        reaching into the trailing partial base block.
+        Returns (rms, hop_length).
+        """
+        win_blocks = window * self.sr / self.base_samples
+        hop_blocks = hop * self.sr / self.base_samples
+        if not (float(win_blocks).is_integer() and float(hop_blocks).is_integer()):
+            raise ValueError(f"window and hop must be multiples of {self.base_samples / self.sr} s")
+        win_blocks, hop_blocks = int(win_blocks), int(hop_blocks)
+        base = self.level(0)
+        if len(base) < win_blocks or hop_blocks <= 0:
+            return np.zeros(0), hop_blocks * self.base_samples
+        csum = np.zeros(len(base) + 1)
+        np.cumsum(base, out=csum[1:])
+        first = np.arange((len(base) - win_blocks) // hop_blocks + 1) * hop_blocks
+        sums = csum[first + win_blocks] - csum[first]
+        win_length = win_blocks * self.base_samples
+        return np.sqrt(np.maximum(sums, 0.0) / win_length), hop_blocks * self.base_samples
@@ -0,0 +1,140 @@
+"""
+Small dependency-aware job runner for simple-peaks.
+
+Jobs are lists of commands (usually ffmpeg) run one after another; a job
+starts once all the jobs it depends on have succeeded. Jobs run concurrently
+on a thread pool, since the work itself happens in subprocesses. The first
+failure stops the run: jobs not yet started are dropped, running ones are
+allowed to finish.
+
+A job may be tied to a slot (e.g. "analysis" or "encode") so that several
+kinds of work share one pool with their own concurrency limits, and a
+callable command may return further jobs, which join the run (so the clips
+of a recording can be scheduled once its analysis is done).
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import profiling
+
+class Job:
+    """
+    A named unit of work: commands run in order, then cleanup paths removed.
+    A command is an argv list run with subprocess, or a Python callable,
+    which may return a list of further jobs to run.
+    inputs and outputs list the files the job reads and writes (outputs
+    default to the job name). slot names the concurrency limit it counts against.
+    """
+    def __init__(self, name, cmds, deps=(), message=None, cleanup=(), inputs=(), outputs=None,
+                 slot=None):
+        self.name = name
+        self.cmds = cmds
+        self.deps = list(deps)
+        self.message = message
+        self.cleanup = list(cleanup)
+        self.inputs = list(inputs)
+        self.outputs = [name] if outputs is None else list(outputs)
+        self.slot = slot
+
+    def run(self):
+        if self.message:
+            print(self.message)
+        spawned = []
+        try:
+            with profiling.stage("job", job=self.name):
+                for cmd in self.cmds:
+                    if callable(cmd):
+                        spawned.extend(cmd() or [])
+                    else:
+                        profiling.run(cmd)
+        finally:
+            for path in self.cleanup:
+                if os.path.exists(path):
+                    os.remove(path)
+        return spawned
+
+def ffmpeg_threads(jobs, threads=None):
+    """
+    Per-ffmpeg thread budget so that jobs concurrent encodes fit the machine.
+    Returns the -threads output option (empty when ffmpeg's default is fine).
+    """
+    if threads is None:
+        if jobs <= 1:
+            return []
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+    return ["-threads", str(threads)]
+
+def _add_jobs(by_name, jobs):
+    """
+    Add jobs to by_name, checking their names and dependencies.
+    Returns the added jobs by name.
+    """
+    added = {}
+    for job in jobs:
+        if job.name in by_name or job.name in added:
+            raise ValueError(f"Duplicate job name: {job.name}")
+        added[job.name] = job
+    by_name.update(added)
+    for job in added.values():
+        unknown = [dep for dep in job.deps if dep not in by_name]
+        if unknown:
+            raise ValueError(f"Job {job.name} depends on unknown jobs: {', '.join(unknown)}")
+    return added
+
+def run_jobs(jobs, max_workers=1, slots=None):
+    """
+    Run jobs honoring their dependencies with at most max_workers at a time,
+    and at most slots[job.slot] at a time of the jobs in each slot.
+    Jobs returned by a job's commands are added to the run. Raises
+    ValueError on duplicate job names and on dependencies that name no job.
+    Prints a summary and re-raises the first failure.
+    Returns the names of the jobs that completed.
+    """
+    slots = slots or {}
+    by_name = {}
+    _add_jobs(by_name, jobs)
+    waiting = dict(by_name)
+    busy = {}
+    done = []
+    running = {}
+    error = None
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while True:
+            if error is None:
+                for name, job in list(waiting.items()):
+                    if job.slot in slots and busy.get(job.slot, 0) >= slots[job.slot]:
+                        continue
+                    if all(dep in done for dep in job.deps):
+                        running[pool.submit(job.run)] = name
+                        busy[job.slot] = busy.get(job.slot, 0) + 1
+                        del waiting[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                busy[by_name[name].slot] -= 1
+                if future.cancelled():
+                    continue
+                exc = future.exception()
+                if exc is None:
+                    done.append(name)
+                    try:
+                        waiting.update(_add_jobs(by_name, future.result()))
+                    except ValueError as e:
+                        exc = e
+                if exc is not None and error is None:
+                    error = exc
+                    print(f"Failed: {name}: {exc}")
+                    # Drop everything that has not started yet
+                    for other in running:
+                        other.cancel()
+    elapsed = time.time() - started
+    skipped = len(by_name) - len(done) - (error is not None)
+    print(f"Jobs: {len(done)} done, {int(error is not None)} failed, {skipped} not run "
+          f"in {elapsed:.1f}s ({max(1, max_workers)} workers)")
+    if error is not None:
+        raise error
+    return done
@@ -0,0 +1,432 @@
+"""
+Local HTTP job server for simple-peaks (`simple-peaks serve`).
+
+Lets the front-end start work on recordings under a root folder and
+follow it, instead of reading output produced earlier by hand. Plain
+asyncio, no web framework:
+
+  POST /jobs                 {"kind": "analyze" | "extract" | "split", "path": ..., options}
+                             -> 202 {"id", "status", "events"}
+  GET  /jobs                 every job, without its events
+  GET  /jobs/<id>            one job
+  GET  /jobs/<id>/events     its events from the start, streamed as NDJSON until
+                             the job ends (text/event-stream with Accept:
+                             text/event-stream or ?format=sse)
+  GET  /files/<path>         a file under the root, with HTTP range requests
+
+Jobs run at most max_jobs at a time, in worker threads (the analysis is
+numpy and ffmpeg work, which does not hold the GIL for long); the others
+wait in the queue. An analyze job decodes the recording through an ffmpeg
+pipe at the low analysis rate and reports each peak as soon as its minute
+is complete (RMS, as `simple-peaks live` selects them, see
+live.LiveSelector), then writes them to <base>_live_peaks.json; the default
+workflow's <base>_peaks.json and manifest are left alone. An extract job
+renders the clips of the "peaks" it is given, or of that file, or else of
+<base>_peaks.json, and reports each one with its /files URL. A split job
+runs video-split. Every job ends with a "done" or "failed" event.
+
+The server listens on 127.0.0.1 by default and only reads and writes below
+its root. Requests must name this machine in their Host header (so that a
+web page cannot reach the server through DNS rebinding), unless it listens
+on every interface. Browser requests from other origins are refused, and
+no CORS header is sent, except for the origins given with allow_origins
+(--allow-origin, e.g. the front-end's dev server, http://localhost:3000).
+"""
+import asyncio
+import ipaddress
+import itertools
+import json
+import mimetypes
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_JOBS = 2
+MAX_BODY = 1 << 20
+# Seconds of decoded audio between two progress events of an analyze job
+PROGRESS_SEC = 10.0
+FINISHED = ("done", "failed")
+LIVE_PEAKS_SUFFIX = "_live_peaks.json"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 202: "Accepted", 204: "No Content", 206: "Partial Content",
+           400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 416: "Range Not Satisfiable", 500: "Internal Server Error"}
+
+class ServerJob:
+    """
+    A queued or running job and the events it has produced so far.
+    Only touched from the event loop thread.
+    """
+    def __init__(self, job_id, kind, path, options):
+        self.id = job_id
+        self.kind = kind
+        self.path = path
+        self.options = options
+        self.status = "queued"
+        self.created = time.time()
+        self.events = []
+        self.wakeup = asyncio.Event()
+
+    def add(self, event):
+        self.events.append(event)
+        if event.get("event") in FINISHED:
+            self.status = event["event"]
+        elif event.get("event") == "started":
+            self.status = "running"
+        self.wakeup.set()
+        self.wakeup = asyncio.Event()
+
+    def summary(self):
+        return {"id": self.id, "kind": self.kind, "path": self.path, "options": self.options,
+                "status": self.status, "created": self.created, "events": f"/jobs/{self.id}/events"}
+
+def parse_range(header, size):
+    """
+    (start, end) byte span, end excluded, of a "bytes=" Range header for a
+    file of size bytes. None to serve the whole file (no header, or several
+    ranges); HTTPError 416 when the range is outside the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        else:
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        return None
+    if start >= end:
+        raise HTTPError(416, f"Range {header} outside of {size} bytes")
+    return start, end
+
+class JobServer:
+    """
+    Job queue and HTTP handler over the files below root.
+    """
+    def __init__(self, root=".", max_jobs=MAX_JOBS, threads=None, allow_origins=(), hosts=LOCAL_HOSTS):
+        self.root = os.path.realpath(root)
+        self.threads = threads
+        self.allow_origins = set(allow_origins)
+        # None: any Host header (listening on every interface)
+        self.hosts = None if hosts is None else set(hosts)
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.slots = asyncio.Semaphore(max_jobs)
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.runners = {"analyze": run_analyze, "extract": run_extract, "split": run_split}
+
+    def resolve(self, path):
+        """
+        Absolute path of path (relative to the root), which must stay below it.
+        """
+        full = os.path.realpath(os.path.join(self.root, path))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise HTTPError(404, f"Not below the server root: {path}")
+        return full
+
+    def url_for(self, path):
+        return "/files/" + urllib.parse.quote(os.path.relpath(path, self.root))
+
+    def submit(self, kind, path, options):
+        if kind not in self.runners:
+            raise HTTPError(400, f"Unknown job kind {kind!r}: expected one of {', '.join(self.runners)}")
+        full = self.resolve(path)
+        if not os.path.isfile(full):
+            raise HTTPError(404, f"No such file: {path}")
+        job = ServerJob(str(next(self.ids)), kind, path, options)
+        self.jobs[job.id] = job
+        job.add({"event": "queued"})
+        asyncio.get_running_loop().create_task(self._run(job, full))
+        return job
+
+    async def _run(self, job, full):
+        loop = asyncio.get_running_loop()
+
+        def emit(event):
+            # Called from the worker thread
+            loop.call_soon_threadsafe(job.add, event)
+
+        async with self.slots:
+            job.add({"event": "started"})
+            try:
+                result = await loop.run_in_executor(
+                    self.executor, self.runners[job.kind], self, full, job.options, emit)
+            except Exception as e:
+                job.add({"event": "failed", "error": f"{type(e).__name__}: {e}"})
+            else:
+                job.add(dict({"event": "done"}, **(result or {})))
+
+    # --- HTTP ---
+
+    def check_request(self, headers):
+        """
+        Refuse requests for another Host name and browser requests from
+        origins that are not allowed. Returns the CORS headers of the response.
+        """
+        if self.hosts is not None:
+            host = headers.get("host", "")
+            # Strip the port: "localhost:8765", "[::1]:8765"
+            name = host[1:host.find("]")] if host.startswith("[") else host.rsplit(":", 1)[0]
+            if name not in self.hosts:
+                raise HTTPError(403, f"Host not allowed: {host!r}")
+        origin = headers.get("origin")
+        if origin is None:
+            return {}
+        if origin not in self.allow_origins:
+            raise HTTPError(403, f"Origin not allowed: {origin} (see --allow-origin)")
+        return {"Access-Control-Allow-Origin": origin, "Vary": "Origin"}
+
+    async def handle(self, reader, writer):
+        cors = {}
+        try:
+            method, target, headers, body = await read_request(reader)
+            cors = self.check_request(headers)
+            url = urllib.parse.urlsplit(target)
+            query = urllib.parse.parse_qs(url.query)
+            await self.route(method, urllib.parse.unquote(url.path), query, headers, body, writer, cors)
+        except HTTPError as e:
+            await send_json(writer, e.status, {"error": str(e)}, cors)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            await send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"}, cors)
+        finally:
+            writer.close()
+
+    async def route(self, method, path, query, headers, body, writer, cors):
+        parts = [p for p in path.split("/") if p]
+        if method == "OPTIONS":
+            return await send(writer, 204, dict(cors, **{"Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+                                                          "Access-Control-Allow-Headers": "Content-Type, Range"}))
+        if parts[:1] == ["files"] and method in ("GET", "HEAD"):
+            return await self.send_file(writer, "/".join(parts[1:]), headers.get("range"), method == "HEAD", cors)
+        if parts == ["jobs"] and method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+                kind, job_path = request.pop("kind"), request.pop("path")
+            except (ValueError, KeyError, AttributeError):
+                raise HTTPError(400, 'Expected a JSON object with "kind" and "path"')
+            job = self.submit(kind, job_path, request)
+            return await send_json(writer, 202, job.summary(), cors)
+        if parts == ["jobs"] and method == "GET":
+            return await send_json(writer, 200, [job.summary() for job in self.jobs.values()], cors)
+        if len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"No job {parts[1]}")
+            if len(parts) == 2:
+                return await send_json(writer, 200, dict(job.summary(), events=job.events), cors)
+            if parts[2] == "events":
+                sse = "sse" in query.get("format", []) or "text/event-stream" in headers.get("accept", "")
+                return await self.send_events(writer, job, sse, cors)
+        raise HTTPError(404 if method in ("GET", "POST") else 405, f"No route for {method} {path}")
+
+    async def send_events(self, writer, job, sse, cors):
+        await send(writer, 200, dict(cors, **{
+            "Content-Type": "text/event-stream" if sse else "application/x-ndjson",
+            "Cache-Control": "no-cache",
+            "Transfer-Encoding": "chunked",
+        }))
+        sent = 0
+        while True:
+            # Taken before draining: events added meanwhile set this one
+            wakeup = job.wakeup
+            while sent < len(job.events):
+                data = json.dumps(job.events[sent])
+                chunk = (f"data: {data}\n\n" if sse else data + "\n").encode()
+                writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                sent += 1
+            await writer.drain()
+            if job.status in FINISHED:
+                break
+            await wakeup.wait()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def send_file(self, writer, path, range_header, head_only, cors):
+        full = self.resolve(path)
+        if not os.path.isfile(full):
+            raise HTTPError(404, f"No such file: {path}")
+        size = os.path.getsize(full)
+        span = parse_range(range_header, size)
+        start, end = span or (0, size)
+        headers = {
+            **cors,
+            "Content-Type": mimetypes.guess_type(full)[0] or "application/octet-stream",
+            "Content-Length": str(end - start),
+            "Accept-Ranges": "bytes",
+        }
+        if span is not None:
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        await send(writer, 206 if span else 200, headers)
+        if head_only or end == start:
+            return
+        with open(full, "rb") as f:
+            # Zero-copy where the platform allows it
+            await asyncio.get_running_loop().sendfile(writer.transport, f, start, end - start)
+
+async def read_request(reader):
+    """
+    (method, target, lowercase headers, body) of one HTTP/1.1 request.
+    """
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise HTTPError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+async def send(writer, status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+    headers = dict({"Connection": "close"}, **headers)
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+async def send_json(writer, status, data, cors=None):
+    body = json.dumps(data, indent=2).encode()
+    await send(writer, status, dict(cors or {}, **{"Content-Type": "application/json",
+                                                     "Content-Length": str(len(body))}))
+    writer.write(body)
+    await writer.drain()
+
+# --- Job runners: run in worker threads, report through emit ---
+
+def live_peaks_path(path, out_dir):
+    """
+    Where an analyze job writes the peaks of path (beside, not over, the
+    default workflow's <base>_peaks.json).
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(out_dir, base + LIVE_PEAKS_SUFFIX)
+
+def run_analyze(server, path, options, emit):
+    from . import streaming, workflow
+    from .live import LIVE_BIN_SIZE, LiveSelector
+    window = float(options.get("window", 2.0))
+    hop = float(options.get("hop", 0.5))
+    sr = int(options.get("sr") or streaming.ANALYSIS_RATE)
+    top_n = int(options.get("top", 1))
+    blocks, sr = streaming.pipe_blocks(path, sr)
+    selector = LiveSelector(sr, window, hop, LIVE_BIN_SIZE, top_n)
+    peaks = []
+    samples = 0
+    reported = 0.0
+
+    def add(segs):
+        for seg in segs:
+            peak = {
+                "wav_file": None,
+                "start_sec": seg["start_sec"],
+                "duration_sec": seg["duration_sec"],
+                "abs_start_sec": seg["start_sec"],
+                "source_file": path,
+                "rms_db": seg["rms_db"],
+                "bin": seg["bin"],
+            }
+            peaks.append(peak)
+            emit({"event": "peak", "peak": dict(peak, source_file=os.path.relpath(path, server.root))})
+
+    for block in blocks:
+        add(selector.push(block))
+        samples += len(block)
+        if samples / sr - reported >= PROGRESS_SEC:
+            reported = samples / sr
+            emit({"event": "progress", "seconds": round(reported, 1)})
+    add(selector.finish())
+    out_dir = workflow.output_dir_for(path)
+    os.makedirs(out_dir, exist_ok=True)
+    json_path = live_peaks_path(path, out_dir)
+    with open(json_path, "w") as f:
+        json.dump(peaks, f, indent=2)
+    return {"peaks": len(peaks), "seconds": round(samples / sr, 1), "peaks_json": server.url_for(json_path)}
+
+def run_extract(server, path, options, emit):
+    from . import workflow
+    from .extract_clips import check_ffmpeg, clip_jobs_for_peaks, clip_outputs, clip_name
+    from .scheduler import ffmpeg_threads, run_jobs
+    check_ffmpeg()
+    out_dir = workflow.output_dir_for(path)
+    peaks = options.get("peaks")
+    if peaks is None:
+        json_path = live_peaks_path(path, out_dir)
+        if not os.path.exists(json_path):
+            json_path = workflow.peaks_json_path(path, out_dir)
+        with open(json_path) as f:
+            peaks = json.load(f)
+    # Clips of this recording only, whatever the request says
+    peaks = [dict(peak, source_file=path) for peak in peaks]
+    jobs = clip_jobs_for_peaks(peaks, out_dir, ffmpeg_threads(1, server.threads),
+                               fast_cut=bool(options.get("fast_cut")))
+    total = len(jobs)
+    done = []
+    for job in jobs:
+        def report(job=job):
+            done.append(job.name)
+            emit({"event": "clip", "done": len(done), "total": total,
+                  "files": [server.url_for(p) for p in job.outputs if os.path.exists(p)]})
+        job.cmds.append(report)
+    run_jobs(jobs, max_workers=1)
+    originals = [clip_outputs(out_dir, clip_name(peak))["original"] for peak in peaks]
+    return {"clips": [server.url_for(p) for p in originals if os.path.exists(p)]}
+
+def run_split(server, path, options, emit):
+    from . import split
+    mapping = split.parse_mapping(options["map"]) if options.get("map") else None
+    base = os.path.splitext(os.path.basename(path))[0]
+    out_dir = os.path.join(os.path.dirname(path), f"{base}.split")
+    split.split_video(path, out_dir, mapping, bool(options.get("single_pass")))
+    return {"files": [server.url_for(os.path.join(out_dir, name)) for name in sorted(os.listdir(out_dir))]}
+
+def allowed_hosts(host):
+    """
+    Host header names accepted when listening on host; None (any) when it
+    listens on every interface.
+    """
+    try:
+        if ipaddress.ip_address(host).is_unspecified:
+            return None
+    except ValueError:
+        if not host:
+            return None
+    return LOCAL_HOSTS + (host,)
+
+def serve(root=".", host=DEFAULT_HOST, port=DEFAULT_PORT, max_jobs=MAX_JOBS, threads=None, allow_origins=()):
+    """
+    Serve jobs and files below root until interrupted.
+    """
+    async def main():
+        server = JobServer(root, max_jobs, threads, allow_origins, allowed_hosts(host))
+        listener = await asyncio.start_server(server.handle, host, port)
+        print(f"Serving {server.root} on http://{host}:{port} ({max_jobs} jobs at a time)")
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
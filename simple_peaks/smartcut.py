@@ -0,0 +1,242 @@
+"""
+Fast-cut clip extraction: copy whole GOPs, re-encode only the edges.
+
+A clip [start, end) of an H.264 yuv420p source is cut as up to three pieces:
+the frames before the first keyframe inside the clip (the head) and the
+frames from the last keyframe inside the clip (the tail) are re-encoded with
+the usual clip settings, the whole GOPs in between are stream-copied. The
+pieces are joined with ffmpeg's concat demuxer and muxed with the audio,
+which is always re-encoded (cheap next to 4K video), into the clip MP4 with
++faststart. Piece boundaries are counted in frames from a packet index of
+the source, so the clip has exactly the frames a full re-encode has.
+
+An MP4 carries one set of H.264 parameter sets (SPS/PPS, in its avcC) and
+QuickTime and hardware decoders use only those, so the pieces can only be
+joined when the re-encoded edges came out with the very parameter sets of
+the copied GOPs. That is checked on the pieces before joining them; when
+they differ (as they do for most camera encoders), the clip is fully
+re-encoded instead and the source is marked in its index so that its later
+clips skip straight to that.
+
+The packet index (video packet times and keyframe times, from ffprobe
+without decoding) is built once per source and cached as
+<base>_keyframes.json in the output folder. Sources that are not H.264
+yuv420p in limited (TV) range, and clips without a whole GOP, are fully
+re-encoded as before.
+Sources are expected to use closed GOPs, as camera encoders and x264 do by
+default.
+"""
+import bisect
+import json
+import os
+import subprocess
+import threading
+
+from . import cache, profiling
+
+INDEX_SUFFIX = "_keyframes.json"
+# Copyable sources: copying keeps the output H.264 yuv420p, as full re-encodes
+# are. Full-range sources (yuvj420p, or color_range pc) are not: the edges
+# would come out limited range and brightness would jump at each boundary
+COPY_CODECS = ("h264",)
+COPY_PIX_FMTS = ("yuv420p",)
+COPY_COLOR_RANGES = (None, "tv", "unknown")
+NAL_SPS = 7
+NAL_PPS = 8
+# Seek this far past a keyframe (stream copy) or before a frame (re-encode),
+# so that rounded frame times never miss the frame
+SEEK_EPSILON = 0.001
+
+def index_path(source_file, output_dir):
+    base = os.path.splitext(os.path.basename(source_file))[0]
+    return os.path.join(output_dir, base + INDEX_SUFFIX)
+
+def probe_packets(source_file):
+    """
+    Packet index of the first video stream of source_file: its codec, pixel
+    format and color range, the sorted times of its packets and of its keyframes.
+    """
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=codec_name,pix_fmt,color_range:packet=pts_time,flags",
+        "-of", "json",
+        source_file
+    ]
+    with profiling.stage("keyframe index", source=source_file):
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    data = json.loads(out)
+    stream = data["streams"][0] if data.get("streams") else {}
+    packets = [p for p in data.get("packets", []) if p.get("pts_time") not in (None, "N/A")]
+    return {
+        "codec": stream.get("codec_name"),
+        "pix_fmt": stream.get("pix_fmt"),
+        "color_range": stream.get("color_range"),
+        "pts": sorted(float(p["pts_time"]) for p in packets),
+        "keyframes": sorted(float(p["pts_time"]) for p in packets if "K" in p.get("flags", "")),
+    }
+
+def load_index(source_file, output_dir):
+    """
+    The packet index of source_file, from its cache in output_dir when the
+    source is unchanged, probed (and cached) otherwise.
+    """
+    path = index_path(source_file, output_dir)
+    state = cache.fingerprint(source_file)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        # Indexes written before color ranges were probed are probed again
+        if index.get("fingerprint") == state and "color_range" in index:
+            return index
+    except (OSError, ValueError):
+        pass
+    index = probe_packets(source_file)
+    index["fingerprint"] = state
+    save_index(path, index)
+    return index
+
+_index_lock = threading.Lock()
+
+def save_index(path, index):
+    with _index_lock:
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, path)
+
+def can_copy(index):
+    return (index["codec"] in COPY_CODECS and index["pix_fmt"] in COPY_PIX_FMTS
+            and index.get("color_range") in COPY_COLOR_RANGES
+            and index.get("parameter_sets_match", True))
+
+def parameter_sets(path):
+    """
+    The SPS and PPS NAL units (as bytes) of the first frame of the H.264
+    stream in path.
+    """
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", path,
+        "-map", "0:v:0", "-c:v", "copy", "-frames:v", "1",
+        "-f", "h264", "pipe:1"
+    ]
+    data = subprocess.run(cmd, check=True, capture_output=True).stdout
+    units = set()
+    # Annex B: NAL units follow 00 00 01 start codes (00 00 00 01 ends in one)
+    for nal in data.split(b"\x00\x00\x01")[1:]:
+        nal = nal.rstrip(b"\x00")
+        if nal and (nal[0] & 0x1f) in (NAL_SPS, NAL_PPS):
+            units.add(nal)
+    return units
+
+def plan_cut(index, start, duration):
+    """
+    Pieces of the clip [start, start + duration): a list of (kind, first
+    frame time, frame count), kind being "head" (re-encoded up to the first
+    keyframe), "copy" (whole GOPs) or "tail" (re-encoded from the last
+    keyframe). Returns None when there is no whole GOP to copy.
+    """
+    pts = index["pts"]
+    end = start + duration
+    first = bisect.bisect_left(pts, start)
+    last = bisect.bisect_left(pts, end)
+    keyframes = [t for t in index["keyframes"] if pts[first] <= t < end] if first < last else []
+    if len(keyframes) < 2:
+        return None
+    copy_start = bisect.bisect_left(pts, keyframes[0])
+    copy_end = bisect.bisect_left(pts, keyframes[-1])
+    pieces = []
+    if copy_start > first:
+        pieces.append(("head", pts[first], copy_start - first))
+    pieces.append(("copy", pts[copy_start], copy_end - copy_start))
+    pieces.append(("tail", pts[copy_end], last - copy_end))
+    return pieces
+
+def piece_cmd(source_file, kind, first, frames, path, thread_opts=()):
+    """
+    ffmpeg command writing one piece (see plan_cut) as an MPEG-TS video stream.
+    """
+    if kind == "copy":
+        return [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-ss", str(round(first + SEEK_EPSILON, 6)),
+            "-i", source_file,
+            "-map", "0:v:0", "-frames:v", str(frames),
+            "-c:v", "copy", "-bsf:v", "h264_mp4toannexb",
+            "-f", "mpegts", "-y", path
+        ]
+    if kind == "tail":
+        # Starts on a keyframe: no need to decode the GOP before it
+        seek = ["-noaccurate_seek", "-ss", str(round(first + SEEK_EPSILON, 6))]
+    else:
+        seek = ["-ss", str(round(max(0.0, first - SEEK_EPSILON), 6))]
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        *seek,
+        "-i", source_file,
+        "-map", "0:v:0", "-frames:v", str(frames),
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        *thread_opts,
+        "-f", "mpegts", "-y", path
+    ]
+
+def smart_cut_cmds(source_file, start, duration, index, out_path, thread_opts=(), fallback=None,
+                   index_file=None):
+    """
+    Commands (and callables writing the concat list and joining the pieces)
+    that cut the clip [start, start + duration) of source_file to out_path,
+    and the temporary files they leave. Returns None when the clip has to
+    be fully re-encoded. fallback is the full re-encode command, run when
+    the pieces' parameter sets differ; the index is then marked (and saved
+    to index_file) so that later clips of the source are not fast-cut.
+    """
+    if not can_copy(index):
+        return None
+    pieces = plan_cut(index, start, duration)
+    if pieces is None:
+        return None
+    stem = os.path.splitext(out_path)[0]
+    paths = [f"{stem}.part{i}.ts" for i in range(len(pieces))]
+    list_path = stem + ".parts.txt"
+    cmds = [piece_cmd(source_file, kind, first, frames, path, thread_opts)
+            for (kind, first, frames), path in zip(pieces, paths)]
+
+    def write_list():
+        with open(list_path, "w") as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+    cmds.append(write_list)
+    # Same audio and container settings as a full re-encode, for Mac QuickTime compatibility
+    concat = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-ss", str(start), "-t", str(duration), "-i", source_file,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        "-ac", "2",
+        "-b:a", "192k",
+        "-t", str(duration),
+        "-movflags", "+faststart",
+        *thread_opts,
+        "-y",
+        out_path
+    ]
+
+    def join():
+        if len({frozenset(parameter_sets(path)) for path in paths}) == 1:
+            profiling.run(concat)
+            return
+        index["parameter_sets_match"] = False
+        if index_file is not None:
+            save_index(index_file, index)
+        if fallback is None:
+            raise RuntimeError(f"Re-encoded edges of {out_path} do not match the parameter sets of {source_file}")
+        print(f"Parameter sets of {source_file} cannot be reproduced: re-encoding {out_path} fully")
+        profiling.run(fallback)
+
+    cmds.append(join)
+    return cmds, paths + [list_path]
@@ -6,7 +6,8 @@ Exports each corner as a separate 1080p video with a selected mono audio channel
 """
 import argparse
 import os
-import subprocess
+
+from . import profiling
 
 # Configuration: map corners to audio channel indices (0-based)
 CONFIG = {
@@ -26,25 +27,86 @@ CORNERS = {
 WIDTH = 1920
 HEIGHT = 1080
 
-def split_video(input_path, output_dir):
+def parse_mapping(items):
+    """
+    Parse CORNER=CHANNEL strings (e.g. "top_left=7") into a corner -> channel dict.
+    """
+    mapping = {}
+    for item in items:
+        corner, sep, channel = item.partition("=")
+        if not sep or corner not in CORNERS or not channel.strip().isdigit():
+            raise ValueError(f"Invalid mapping {item!r}: expected CORNER=CHANNEL with CORNER one of "
+                             f"{', '.join(CORNERS)} and CHANNEL a channel number from 0")
+        mapping[corner] = int(channel)
+    return mapping
+
+def corner_filters(corner, audio_channel, video_in="[0:v]", audio_in="[0:a]", suffix=""):
+    """
+    Crop and pan filters for one corner, with outputs [vout<suffix>] and [aout<suffix>].
+    """
+    crop = CORNERS[corner]
+    return (f"{video_in}crop={WIDTH}:{HEIGHT}:{crop['x']}:{crop['y']}[vout{suffix}];"
+            f"{audio_in}pan=stereo|c0=c{audio_channel}|c1=c{audio_channel}[aout{suffix}]")
+
+def single_pass_cmd(input_path, output_dir, mapping):
+    """
+    ffmpeg command writing every corner of mapping from one decode of input_path.
+    """
+    corners = list(mapping.items())
+    n = len(corners)
+    # One decode: split video and audio once per corner, then crop/pan each branch
+    graph = [
+        f"[0:v]split={n}" + "".join(f"[v{i}]" for i in range(n)),
+        f"[0:a]asplit={n}" + "".join(f"[a{i}]" for i in range(n)),
+    ]
+    outputs = []
+    for i, (corner, audio_channel) in enumerate(corners):
+        graph.append(corner_filters(corner, audio_channel, f"[v{i}]", f"[a{i}]", str(i)))
+        outputs += [
+            "-map", f"[vout{i}]",
+            "-map", f"[aout{i}]",
+            "-c:v", "libx264",
+            "-c:a", "aac",
+            "-y",
+            os.path.join(output_dir, f"{corner}.mp4")
+        ]
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", input_path,
+        "-filter_complex", ";".join(graph),
+        *outputs
+    ]
+
+def split_video(input_path, output_dir, mapping=None, single_pass=False):
     """
     Splits a 4K video into four 1080p videos (corners), each with a mapped mono audio channel (duplicated to stereo).
     If output_dir is not specified or is '.', creates an output directory named after the input file (without extension) in the same parent folder as the input.
+    mapping maps corner names to audio channels (default: CONFIG). With single_pass, the source is decoded once
+    and all corners are encoded by the same ffmpeg process.
     """
+    mapping = CONFIG if mapping is None else mapping
     if not output_dir or output_dir == ".":
         base = os.path.splitext(os.path.basename(input_path))[0]
         parent = os.path.dirname(input_path)
         output_dir = os.path.join(parent, f"{base}.split")
     os.makedirs(output_dir, exist_ok=True)
-    for corner, audio_channel in CONFIG.items():
-        crop = CORNERS[corner]
+    if single_pass:
+        for corner, audio_channel in mapping.items():
+            output_path = os.path.join(output_dir, f"{corner}.mp4")
+            print(f"Exporting {corner} to {output_path} (audio channel {audio_channel})...")
+        ffmpeg_cmd = single_pass_cmd(input_path, output_dir, mapping)
+        with profiling.stage("split_video", corners=len(mapping)):
+            profiling.run(ffmpeg_cmd)
+        print(f"All corners exported to {output_dir}.")
+        return
+    for corner, audio_channel in mapping.items():
         output_path = os.path.join(output_dir, f"{corner}.mp4")
         # ffmpeg command to crop and map audio
         ffmpeg_cmd = [
             "ffmpeg", "-hide_banner", "-loglevel", "error",
             "-i", input_path,
             "-filter_complex",
-            f"[0:v]crop={WIDTH}:{HEIGHT}:{crop['x']}:{crop['y']}[vout];[0:a]pan=stereo|c0=c{audio_channel}|c1=c{audio_channel}[aout]",
+            corner_filters(corner, audio_channel),
             "-map", "[vout]",
             "-map", "[aout]",
             "-c:v", "libx264",
@@ -53,5 +115,6 @@ def split_video(input_path, output_dir):
             output_path
         ]
         print(f"Exporting {corner} to {output_path} (audio channel {audio_channel})...")
-        subprocess.run(ffmpeg_cmd, check=True)
+        with profiling.stage("split_video", corner=corner):
+            profiling.run(ffmpeg_cmd)
     print(f"All corners exported to {output_dir}.")
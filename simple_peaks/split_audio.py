@@ -12,32 +12,61 @@ Examples:
 """
 import argparse
 import os
+import functools
 import shutil
 import subprocess
 import sys
 
+from . import profiling
+
 def check_ffmpeg():
     if not shutil.which("ffmpeg"):
         print("Error: ffmpeg is not installed or not on PATH.", file=sys.stderr)
         sys.exit(1)
 
+@functools.lru_cache(maxsize=None)
+def has_soxr():
+    """
+    Whether this ffmpeg is built with libsoxr (stock builds often are not).
+    """
+    try:
+        out = subprocess.run(["ffmpeg", "-hide_banner", "-buildconf"],
+                             capture_output=True, text=True).stdout
+    except OSError:
+        return False
+    return "--enable-libsoxr" in out
+
+def resample_args(sr):
+    """
+    ffmpeg output options resampling to sr: with soxr when available,
+    otherwise with ffmpeg's own (also low-pass filtered) swr resampler.
+    """
+    if has_soxr():
+        return ["-af", "aresample=resampler=soxr", "-ar", str(sr)]
+    return ["-ar", str(sr)]
+
 def split_audio(input_path, segment_length, output_dir, prefix, sr, channels):
     os.makedirs(output_dir, exist_ok=True)
     output_pattern = os.path.join(output_dir, f"{prefix}_%03d.wav")
-    # Always extract stereo (channels 1 and 2)
     cmd = [
         "ffmpeg", "-hide_banner", "-loglevel", "error",
         "-i", input_path,
         "-vn",
         "-acodec", "pcm_s16le",
-        "-ac", "2",
+        "-ac", str(channels),
+    ]
+    if sr:
+        # Resample in ffmpeg (low-pass filtered) rather than in librosa
+        cmd += resample_args(sr)
+    cmd += [
         "-f", "segment",
         "-segment_time", str(segment_length),
         "-reset_timestamps", "1",
         output_pattern
     ]
     print("Running:", " ".join(cmd))
-    subprocess.run(cmd, check=True)
+    with profiling.stage("split_audio"):
+        profiling.run(cmd)
     print(f"Segments written to: {output_dir}")
 
 def main():
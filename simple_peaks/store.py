@@ -0,0 +1,228 @@
+"""
+SQLite store of peaks across recordings.
+
+One database (by default ~/.simple-peaks/peaks.db, or $SIMPLE_PEAKS_DB)
+holds the peaks of every analyzed recording, indexed by source, by absolute
+time in the source and by loudness, so questions like "the loudest moments
+of every session recorded this week" are one indexed query instead of a
+scan of every <base>_peaks.json. Analyzing a recording again replaces its
+peaks. Both JSON shapes written by simple-peaks (the flat list of the
+default workflow and the dict keyed by WAV file) can be imported and
+exported.
+"""
+import json
+import math
+import os
+import sqlite3
+import time
+
+DB_ENV = "SIMPLE_PEAKS_DB"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    recorded_at REAL,
+    analyzed_at REAL NOT NULL,
+    params TEXT
+);
+CREATE TABLE IF NOT EXISTS peaks (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    wav_file TEXT,
+    start_sec REAL NOT NULL,
+    duration_sec REAL NOT NULL,
+    abs_start_sec REAL NOT NULL,
+    rms_db REAL NOT NULL,
+    channel INTEGER,
+    corner TEXT,
+    momentary_lufs REAL
+);
+CREATE INDEX IF NOT EXISTS peaks_source_time ON peaks (source_id, abs_start_sec);
+CREATE INDEX IF NOT EXISTS peaks_loudness ON peaks (rms_db DESC);
+CREATE INDEX IF NOT EXISTS sources_recorded ON sources (recorded_at);
+"""
+PEAK_COLUMNS = ["wav_file", "start_sec", "duration_sec", "abs_start_sec", "rms_db", "channel", "corner",
+                "momentary_lufs"]
+# Columns added since the first schema, with their types, for older databases
+ADDED_COLUMNS = {"momentary_lufs": "REAL"}
+
+def default_db_path():
+    return os.environ.get(DB_ENV) or os.path.join(os.path.expanduser("~"), ".simple-peaks", "peaks.db")
+
+class PeakStore:
+    """
+    Connection to a peaks database, created on first use.
+    """
+    def __init__(self, path=None):
+        self.path = path or default_db_path()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Several analysis processes may write at once (batch)
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        existing = {row["name"] for row in self.db.execute("PRAGMA table_info(peaks)")}
+        for column, kind in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.db.execute(f"ALTER TABLE peaks ADD COLUMN {column} {kind}")
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_peaks(self, source_file, peaks, params=None):
+        """
+        Store the peaks of source_file (peak dicts as in <base>_peaks.json),
+        replacing any it had, in one transaction. Sources are stored by
+        absolute path.
+        """
+        source_file = os.path.abspath(source_file)
+        recorded_at = os.path.getmtime(source_file) if os.path.exists(source_file) else None
+        with self.db:
+            self.db.execute("DELETE FROM sources WHERE path = ?", (source_file,))
+            cur = self.db.execute(
+                "INSERT INTO sources (path, recorded_at, analyzed_at, params) VALUES (?, ?, ?, ?)",
+                (source_file, recorded_at, time.time(), json.dumps(params) if params else None))
+            source_id = cur.lastrowid
+            self.db.executemany(
+                f"INSERT INTO peaks (source_id, {', '.join(PEAK_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(PEAK_COLUMNS))})",
+                [(source_id, *_row(peak)) for peak in peaks])
+        return len(peaks)
+
+    def import_json(self, json_path):
+        """
+        Add the peaks of a peaks JSON file of either shape. A dict keyed by
+        WAV file has no source or offsets: each WAV (next to the JSON) is
+        stored as its own source. Relative source paths are resolved from
+        where the JSON is (see source_path). Files written before rms_db was
+        in dBFS (see legacy_rms_db) are converted. Returns the number of peaks added.
+        """
+        with open(json_path) as f:
+            data = json.load(f)
+        by_source = {}
+        if isinstance(data, dict):
+            for wav, segs in data.items():
+                wav_path = os.path.join(os.path.dirname(json_path), wav)
+                by_source[wav_path] = [dict(seg, wav_file=wav_path, abs_start_sec=seg["start_sec"])
+                                       for seg in segs]
+        else:
+            for peak in data:
+                by_source.setdefault(source_path(json_path, peak["source_file"]), []).append(peak)
+        peaks = [peak for source_peaks in by_source.values() for peak in source_peaks]
+        if legacy_rms_db(peaks):
+            for peak in peaks:
+                peak["rms_db"] = 20 * math.log10(peak["rms_db"]) if peak["rms_db"] > 0 else float("-inf")
+        return sum(self.add_peaks(source, peaks) for source, peaks in by_source.items())
+
+    def query(self, sources=None, since=None, until=None, start=None, end=None, min_db=None,
+              top=None, order="loudness"):
+        """
+        Peaks matching every given filter, as peak dicts with "source_file":
+        sources (paths), recorded (source mtime) between since and until
+        (timestamps), starting between start and end seconds into their
+        source, at least min_db loud. Ordered loudest first ("loudness") or
+        by source and time ("time"), limited to top.
+        """
+        where, args = [], []
+        if sources:
+            where.append(f"s.path IN ({', '.join('?' * len(sources))})")
+            args += [os.path.abspath(source) for source in sources]
+        for clause, value in (("s.recorded_at >= ?", since), ("s.recorded_at < ?", until),
+                              ("p.abs_start_sec >= ?", start), ("p.abs_start_sec < ?", end),
+                              ("p.rms_db >= ?", min_db)):
+            if value is not None:
+                where.append(clause)
+                args.append(value)
+        sql = (f"SELECT s.path AS source_file, {', '.join('p.' + c for c in PEAK_COLUMNS)} "
+               f"FROM peaks p JOIN sources s ON s.id = p.source_id")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += (" ORDER BY p.rms_db DESC, s.path, p.abs_start_sec" if order == "loudness"
+                else " ORDER BY s.path, p.abs_start_sec")
+        if top is not None:
+            sql += " LIMIT ?"
+            args.append(top)
+        return [_peak(row) for row in self.db.execute(sql, args)]
+
+    def sources(self):
+        """
+        Paths of the stored recordings with their peak counts.
+        """
+        rows = self.db.execute(
+            "SELECT s.path, COUNT(p.id) AS peaks FROM sources s LEFT JOIN peaks p ON p.source_id = s.id "
+            "GROUP BY s.id ORDER BY s.path")
+        return {row["path"]: row["peaks"] for row in rows}
+
+def legacy_rms_db(peaks):
+    """
+    True if peaks come from a JSON written when rms_db held the linear RMS:
+    every value is within 0..1, where dBFS values are all at most 0.
+    """
+    values = [peak["rms_db"] for peak in peaks if peak.get("rms_db") is not None]
+    return any(v > 0 for v in values) and all(0 <= v <= 1 for v in values)
+
+def source_path(json_path, source_file):
+    """
+    Absolute path of a peak's source_file as written in json_path. Relative
+    sources are relative to where the analysis ran, which was the parent of
+    the <base>.simple-peaks folder holding the JSON; for a JSON elsewhere
+    (such as a batch index), its own folder.
+    """
+    if os.path.isabs(source_file):
+        return source_file
+    folder = os.path.dirname(os.path.abspath(json_path))
+    base = os.path.splitext(os.path.basename(source_file))[0]
+    if os.path.basename(folder) == f"{base}.simple-peaks":
+        return os.path.join(os.path.dirname(folder), os.path.basename(source_file))
+    return os.path.join(folder, source_file)
+
+def _row(peak):
+    values = [peak.get(c) for c in PEAK_COLUMNS]
+    # Channel peaks list every corner mapped to their channel
+    if "corners" in peak:
+        values[PEAK_COLUMNS.index("corner")] = ",".join(peak["corners"])
+    return values
+
+def _peak(row):
+    peak = {
+        "wav_file": row["wav_file"],
+        "start_sec": row["start_sec"],
+        "duration_sec": row["duration_sec"],
+        "abs_start_sec": row["abs_start_sec"],
+        "source_file": row["source_file"],
+        "rms_db": row["rms_db"],
+    }
+    # LUFS scorer only
+    if row["momentary_lufs"] is not None:
+        peak["momentary_lufs"] = row["momentary_lufs"]
+    # Multichannel peaks only
+    if row["channel"] is not None:
+        peak["channel"] = row["channel"]
+        peak["corners"] = row["corner"].split(",") if row["corner"] else []
+    return peak
+
+def to_json_shape(peaks, shape="list"):
+    """
+    Peaks in one of the JSON shapes simple-peaks writes: "list", the flat
+    list of <base>_peaks.json, or "by-wav", segments keyed by WAV file name.
+    """
+    if shape == "list":
+        return peaks
+    by_wav = {}
+    for peak in peaks:
+        key = os.path.basename(peak["wav_file"] or peak["source_file"])
+        by_wav.setdefault(key, []).append({
+            "start_sec": peak["start_sec"],
+            "duration_sec": peak["duration_sec"],
+            "rms_db": peak["rms_db"],
+        })
+    return by_wav
@@ -0,0 +1,268 @@
+"""
+Constant-memory loudness analysis for simple-peaks.
+
+Audio is consumed block by block (from soundfile, an ffmpeg pipe or any
+iterator of PCM arrays). Only the samples of one partial window are carried between blocks and
+only the envelope of the current 15-minute bin is kept, so memory stays flat
+whatever the length of the input. Peaks match find_loud.find_loud_segments.
+"""
+import numpy as np
+import soundfile as sf
+
+from . import find_loud
+
+BLOCK_FRAMES = 1 << 16
+# Sample rate of the low-rate analysis decode (--analysis-rate)
+ANALYSIS_RATE = 8000
+
+class EnvelopeStream:
+    """
+    Running RMS envelope over consecutive blocks of mono samples, or of
+    (frames, channels) samples for one envelope column per channel.
+    """
+    def __init__(self, win_length, hop_length):
+        self.win_length = win_length
+        self.hop_length = hop_length
+        self.carry = np.zeros(0, dtype=np.float32)
+        self.samples = 0
+        # Samples before the next window start still to come (hop > window)
+        self.skip = 0
+
+    def push(self, block):
+        """
+        Add samples and return the RMS of every window completed by them.
+        """
+        self.samples += len(block)
+        if self.skip:
+            skipped = min(self.skip, len(block))
+            block = block[skipped:]
+            self.skip -= skipped
+        buf = np.concatenate([self.carry, block]) if len(self.carry) else np.asarray(block)
+        rms = find_loud.rms_envelope(buf, self.win_length, self.hop_length)
+        # Keep everything from the first window start not yet emitted
+        self.carry = buf[len(rms) * self.hop_length:].copy()
+        self.skip += max(0, len(rms) * self.hop_length - len(buf))
+        return rms
+
+class BinSelector:
+    """
+    Collects envelope frames and selects peaks each time a bin is complete.
+    Holds at most one bin of envelope frames (the whole envelope when
+    bin_size is None).
+    """
+    def __init__(self, window, hop_length, sr, top_n=None, bin_size=find_loud.BIN_SIZE, scorer="rms"):
+        self.window = window
+        self.hop_length = hop_length
+        self.sr = sr
+        self.top_n = top_n
+        self.bin_size = bin_size
+        self.scorer = scorer
+        self.frames = 0
+        self.bin = 0
+        self.rms = []
+        self.starts = []
+        self.momentary = []
+
+    def push(self, rms, momentary=None):
+        """
+        Add envelope frames (and their momentary loudness, with the "lufs"
+        scorer) and return the peaks of any bins they completed.
+        """
+        segments = []
+        if not len(rms):
+            return segments
+        starts = (self.frames + np.arange(len(rms))) * self.hop_length / self.sr
+        self.frames += len(rms)
+        while len(rms):
+            if not self.bin_size:
+                split = len(rms)
+            else:
+                bin_end = (self.bin + 1) * self.bin_size
+                split = int(np.searchsorted(starts, bin_end, side="left"))
+            self.rms.append(rms[:split])
+            self.starts.append(starts[:split])
+            if momentary is not None:
+                self.momentary.append(momentary[:split])
+            if split == len(rms):
+                break
+            segments.extend(self._flush())
+            self.bin += 1
+            rms, starts = rms[split:], starts[split:]
+            if momentary is not None:
+                momentary = momentary[split:]
+        return segments
+
+    def finish(self):
+        """
+        Select peaks of the last, partial bin.
+        """
+        return self._flush()
+
+    def _flush(self):
+        rms = np.concatenate(self.rms) if self.rms else np.zeros(0)
+        starts = np.concatenate(self.starts) if self.starts else np.zeros(0)
+        momentary = np.concatenate(self.momentary) if self.momentary else None
+        self.rms, self.starts, self.momentary = [], [], []
+        return find_loud.select_bin(rms, starts, self.window, self.top_n, self.scorer, momentary)
+
+def envelope_stream(sr, window, hop, scorer="rms"):
+    """
+    EnvelopeStream, or with scorer "lufs" a loudness.LoudnessStream, whose
+    push returns (short-term, momentary) loudness.
+    """
+    win_length = int(window * sr)
+    hop_length = int(hop * sr)
+    if scorer == "lufs":
+        from .loudness import LoudnessStream
+        return LoudnessStream(sr, win_length, hop_length)
+    return EnvelopeStream(win_length, hop_length)
+
+def analyze_blocks(blocks, sr, window, hop, top_n=None, bin_size=find_loud.BIN_SIZE, scorer="rms"):
+    """
+    Find loud segments in an iterator of mono float blocks sampled at sr.
+    """
+    envelope = envelope_stream(sr, window, hop, scorer)
+    selector = BinSelector(window, int(hop * sr), sr, top_n, bin_size, scorer)
+    segments = []
+    for block in blocks:
+        frames = envelope.push(block)
+        segments.extend(selector.push(*frames) if scorer == "lufs" else selector.push(frames))
+    segments.extend(selector.finish())
+    return segments
+
+def envelope_from_blocks(blocks, sr, window, hop, scorer="rms"):
+    """
+    Envelope of an iterator of mono float blocks, in the same form as
+    find_loud.compute_envelope. Only the envelope is kept in memory.
+    """
+    envelope = envelope_stream(sr, window, hop, scorer)
+    frames = [envelope.push(block) for block in blocks]
+    result = {"scorer": scorer, "sr": sr, "hop_length": int(hop * sr), "duration": envelope.samples / sr}
+    if scorer == "lufs":
+        result["rms"] = np.concatenate([f[0] for f in frames]) if frames else np.zeros(0)
+        result["momentary"] = np.concatenate([f[1] for f in frames]) if frames else np.zeros(0)
+    else:
+        result["rms"] = np.concatenate(frames) if frames else np.zeros(0)
+    return result
+
+def resample_blocks(blocks, in_sr, out_sr, channels=1):
+    """
+    Resample an iterator of float32 blocks from in_sr to out_sr with a soxr
+    stream. Blocks are mono, or of shape (frames, channels) when channels > 1.
+    """
+    if out_sr == in_sr:
+        yield from blocks
+        return
+    import soxr
+    resampler = soxr.ResampleStream(in_sr, out_sr, channels, dtype="float32", quality="HQ")
+    for y in blocks:
+        yield resampler.resample_chunk(y)
+    tail = (0,) if channels == 1 else (0, channels)
+    yield resampler.resample_chunk(np.zeros(tail, dtype=np.float32), last=True)
+
+def mono_blocks(path, sr=None, blocksize=BLOCK_FRAMES):
+    """
+    Read an audio file block by block as mono float32, resampled to sr if given.
+    Returns (blocks, sr) with sr the effective sample rate.
+    """
+    info = sf.info(path)
+
+    def gen():
+        with sf.SoundFile(path) as f:
+            for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                yield block.mean(axis=1, dtype=np.float32)
+
+    out_sr = sr or info.samplerate
+    return resample_blocks(gen(), info.samplerate, out_sr), out_sr
+
+def pipe_blocks(input_path, sr=None, blocksize=BLOCK_FRAMES, channels=1):
+    """
+    Decode any ffmpeg-readable input through a pipe as mono float32 blocks.
+    ffmpeg first downmixes to channels, as for the WAV segments (with 1, the
+    default, it does the whole downmix); with sr it also resamples (see
+    analysis_rate_blocks). Returns (blocks, sr) with sr the effective sample rate.
+    """
+    from .audio_utils import pcm_blocks, probe_sample_rate
+    if sr:
+        return analysis_rate_blocks(input_path, sr, blocksize, channels), sr
+    native_sr = probe_sample_rate(input_path)
+
+    def gen():
+        # s16 with -ac channels like the WAV segments, then averaged the way librosa does
+        for block in pcm_blocks(input_path, channels=channels, block_frames=blocksize):
+            y = block.mean(axis=1, dtype=np.float32)
+            y *= 1.0 / 32768
+            yield y
+
+    return gen(), native_sr
+
+def analysis_rate_blocks(input_path, sr=ANALYSIS_RATE, blocksize=BLOCK_FRAMES, channels=1):
+    """
+    Mono float32 blocks of input_path at a low analysis rate. ffmpeg does the
+    downmix and the anti-aliased decimation (soxr when ffmpeg has it) and writes float32 PCM,
+    so only sr samples per second of audio reach Python. RMS loudness over
+    windows of a second or so is set by the low frequencies that carry most
+    of the energy, so peaks match the native-rate analysis (see
+    bench.compare_rates).
+    """
+    from .audio_utils import pcm_blocks
+    for block in pcm_blocks(input_path, channels=channels, block_frames=blocksize, sr=sr, dtype="float32"):
+        yield block[:, 0] if channels == 1 else block.mean(axis=1, dtype=np.float32)
+
+def stream_loud_segments(path, sr, window, hop, top_n=None, bin_size=find_loud.BIN_SIZE,
+                         blocksize=BLOCK_FRAMES, scorer="rms"):
+    """
+    Streaming equivalent of find_loud.find_loud_segments for WAV/FLAC files.
+    """
+    blocks, sr = mono_blocks(path, sr, blocksize)
+    return analyze_blocks(blocks, sr, window, hop, top_n, bin_size, scorer)
+
+def pipe_loud_segments(input_path, sr, window, hop, top_n=None, bin_size=find_loud.BIN_SIZE,
+                       blocksize=BLOCK_FRAMES, scorer="rms", channels=1):
+    """
+    Find loud segments in any audio/video file, decoding it through an ffmpeg
+    pipe with no intermediate WAV. Start times are absolute in the input.
+    """
+    blocks, sr = pipe_blocks(input_path, sr, blocksize, channels)
+    return analyze_blocks(blocks, sr, window, hop, top_n, bin_size, scorer)
+
+def pipe_envelope(input_path, sr, window, hop, blocksize=BLOCK_FRAMES, tap=None, scorer="rms", channels=1):
+    """
+    Envelope of any ffmpeg-readable input, decoded through a pipe.
+    tap(blocks, sr), if given, wraps the block iterator to see the samples too.
+    """
+    blocks, sr = pipe_blocks(input_path, sr, blocksize, channels)
+    if tap is not None:
+        blocks = tap(blocks, sr)
+    return envelope_from_blocks(blocks, sr, window, hop, scorer)
+
+def pipe_channel_blocks(input_path, sr=None, blocksize=BLOCK_FRAMES):
+    """
+    Decode every channel of any ffmpeg-readable input through a pipe, as
+    float32 blocks of shape (frames, channels) with no downmix.
+    Returns (blocks, sr, channels) with sr the effective sample rate.
+    """
+    from .audio_utils import pcm_blocks, probe_channels, probe_sample_rate
+    native_sr = probe_sample_rate(input_path)
+    channels = probe_channels(input_path)
+
+    def gen():
+        for block in pcm_blocks(input_path, channels=channels, block_frames=blocksize):
+            y = block.astype(np.float32)
+            y *= 1.0 / 32768
+            yield y
+
+    out_sr = sr or native_sr
+    return resample_blocks(gen(), native_sr, out_sr, channels), out_sr, channels
+
+def pipe_channel_envelope(input_path, sr, window, hop, blocksize=BLOCK_FRAMES):
+    """
+    RMS envelopes of all channels of an input from a single decode, as
+    find_loud.compute_envelope with "rms" of shape (frames, channels).
+    """
+    blocks, sr, channels = pipe_channel_blocks(input_path, sr, blocksize)
+    envelope = envelope_from_blocks(blocks, sr, window, hop)
+    if not len(envelope["rms"]):
+        envelope["rms"] = np.zeros((0, channels))
+    envelope["channels"] = channels
+    return envelope
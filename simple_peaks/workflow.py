@@ -0,0 +1,328 @@
+"""
+Default simple-peaks workflow: audio extraction and peak analysis of one input.
+
+The input's audio is either split into 900 s WAV segments with ffmpeg or
+decoded through an ffmpeg pipe, reduced to RMS envelopes, and the 5
+loudest peaks of every 15-minute bin are selected (with per_minute, one per
+started minute of audio instead). Envelopes are cached in the output
+folder, so re-running with other selection settings skips decoding.
+"""
+import glob
+import json
+import math
+import os
+
+import soundfile as sf
+
+from . import cache, find_loud, profiling, split_audio
+
+SEGMENT_LENGTH = 900
+
+def output_dir_for(input_path):
+    """
+    The <base>.simple-peaks folder next to input_path.
+    """
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(os.path.dirname(input_path), f"{base}.simple-peaks")
+
+def segment_envelopes(input_path, out_dir, sr, channels, window, hop, jobs=1, manifest=None, scorer="rms"):
+    """
+    Split input_path into ≤900 s WAVs and compute the envelope of each,
+    over a process pool when jobs > 1. The split is skipped when manifest
+    shows its WAVs are up to date.
+    Returns envelope dicts (see find_loud.compute_envelope) with the
+    "wav_file" and time "offset" of their segment.
+    """
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    stage_inputs = {input_path: cache.fingerprint(input_path)}
+    stage_params = {"segment_length": SEGMENT_LENGTH, "sr": sr, "channels": channels}
+    if manifest is not None and manifest.is_fresh("split", stage_inputs, stage_params):
+        wavs = manifest.outputs("split")
+        print(f"Up to date: {len(wavs)} WAV segments in {out_dir}")
+    else:
+        # 2. Split to ≤900s wavs
+        split_audio.check_ffmpeg()
+        split_audio.split_audio(
+            input_path, SEGMENT_LENGTH, out_dir, base, sr, channels
+        )
+        wavs = sorted(glob.glob(os.path.join(out_dir, f"{base}_*.wav")))
+        if not wavs:
+            # If only one segment, fallback to single wav extraction
+            wav_path = os.path.join(out_dir, f"{base}.wav")
+            from .audio_utils import extract_audio_to_wav
+            extract_audio_to_wav(input_path, wav_path, sr=sr, channels=channels)
+            wavs = [wav_path]
+        if manifest is not None:
+            manifest.record("split", stage_inputs, stage_params, wavs)
+    # 3. Analyze each segment
+    tasks = []
+    for wav in wavs:
+        # Detect sample rate if not set
+        _sr = sr
+        if _sr is None:
+            with sf.SoundFile(wav) as f:
+                _sr = f.samplerate
+        tasks.append((wav, _sr, window, hop, scorer))
+    with profiling.stage("analyze segments", segments=len(wavs), jobs=jobs):
+        results = [None] * len(wavs)
+        if jobs > 1 and len(tasks) > 1:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+                futures = {pool.submit(find_loud.compute_envelope, *task): i for i, task in enumerate(tasks)}
+                # Workers finish out of order; results are kept by segment index
+                for done, future in enumerate(as_completed(futures), 1):
+                    i = futures[future]
+                    results[i] = future.result()
+                    print(f"Analyzed {done}/{len(wavs)}: {wavs[i]}")
+        else:
+            for i, task in enumerate(tasks):
+                results[i] = find_loud.compute_envelope(*task)
+                print(f"Analyzed {i + 1}/{len(wavs)}: {wavs[i]}")
+    # Segments are placed end to end
+    offset = 0.0
+    for wav, envelope in zip(wavs, results):
+        envelope["wav_file"] = wav
+        envelope["offset"] = offset
+        offset += envelope["duration"]
+    return results
+
+def pipe_envelopes(input_path, sr, window, hop, tap=None, scorer="rms", channels=1):
+    """
+    Envelope of the whole input decoded through an ffmpeg pipe, as a single
+    segment with no WAV file.
+    """
+    from .streaming import pipe_envelope
+    split_audio.check_ffmpeg()
+    with profiling.stage("pipe envelope"):
+        envelope = pipe_envelope(input_path, sr, window, hop, tap=tap, scorer=scorer, channels=channels)
+    envelope["wav_file"] = None
+    envelope["offset"] = 0.0
+    return [envelope]
+
+def write_pyramid(input_path, out_dir, envelopes, sr, channels=1):
+    """
+    Write the loudness pyramid of input_path next to its peaks JSON, reading
+    the WAV segments when they are still on disk and decoding through an
+    ffmpeg pipe otherwise. Returns the header path.
+    """
+    from . import streaming
+    from .pyramid import PyramidBuilder, pyramid_paths
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    bin_path, _ = pyramid_paths(out_dir, base)
+    wavs = [envelope["wav_file"] for envelope in envelopes]
+    if all(wav and os.path.exists(wav) for wav in wavs):
+        sr = sr or sf.info(wavs[0]).samplerate
+        blocks = (block for wav in wavs for block in streaming.mono_blocks(wav, sr)[0])
+    else:
+        blocks, sr = streaming.pipe_blocks(input_path, sr, channels=channels)
+    builder = PyramidBuilder(sr)
+    with profiling.stage("pyramid"):
+        for block in blocks:
+            builder.push(block)
+        return builder.write(bin_path)
+
+def select_per_minute(envelope, window):
+    """
+    Peaks of an envelope at one per started minute of each 15-minute bin.
+    """
+    rms = envelope["rms"]
+    momentary = envelope.get("momentary")
+    scorer = envelope.get("scorer", "rms")
+    duration = envelope["duration"]
+    starts = find_loud.frame_starts(len(rms), envelope["hop_length"], envelope["sr"])
+    segments = []
+    num_bins = max(1, int(math.ceil(duration / find_loud.BIN_SIZE)))
+    for b in range(num_bins):
+        bin_start = b * find_loud.BIN_SIZE
+        bin_end = min((b + 1) * find_loud.BIN_SIZE, duration)
+        lo = int(starts.searchsorted(bin_start, side="left"))
+        hi = int(starts.searchsorted(bin_end, side="left"))
+        top_n = max(1, math.ceil((bin_end - bin_start) / 60))
+        segments.extend(find_loud.select_bin(rms[lo:hi], starts[lo:hi], window, top_n, scorer,
+                                             None if momentary is None else momentary[lo:hi]))
+    return segments
+
+def peaks_from_envelopes(envelopes, input_path, window, per_minute=False):
+    """
+    Flat list of peaks with absolute positions in input_path: the 5 loudest
+    of every 15-minute bin, or with per_minute one per started minute.
+    """
+    all_peaks = []
+    for envelope in envelopes:
+        if not per_minute:
+            segs = find_loud.envelope_peaks(envelope, window)
+        elif envelope["wav_file"] is None:
+            segs = select_per_minute(envelope, window)
+        else:
+            top_n = max(1, math.ceil(envelope["duration"] / 60))
+            segs = find_loud.envelope_peaks(envelope, window, top_n)
+        for seg in segs:
+            peak = {
+                "wav_file": envelope["wav_file"],
+                "start_sec": seg["start_sec"],
+                "duration_sec": seg["duration_sec"],
+                "abs_start_sec": envelope["offset"] + seg["start_sec"],
+                "source_file": input_path,
+                "rms_db": seg["rms_db"]
+            }
+            if "momentary_lufs" in seg:
+                peak["momentary_lufs"] = seg["momentary_lufs"]
+            all_peaks.append(peak)
+    return all_peaks
+
+def analyze_source(input_path, out_dir, sr=None, channels=1, window=2.0, hop=0.5,
+                   pipe=False, jobs=1, use_cache=True, pyramid=False, manifest=None, scorer="rms",
+                   per_minute=False):
+    """
+    Compute (or load from the cache) the envelopes of input_path and select
+    its peaks (see peaks_from_envelopes), ranked by scorer (see find_loud.SCORERS). With pyramid, also
+    write the loudness pyramid (see pyramid.py).
+    A manifest with force set bypasses the cache and is updated with the
+    split and analysis stages.
+    Returns the flat peak list written to <base>_peaks.json.
+    """
+    builders = []
+
+    def tap(blocks, block_sr):
+        from .pyramid import PyramidBuilder
+        builders.append(PyramidBuilder(block_sr))
+        return builders[0].tap(blocks)
+
+    cache_dir = os.path.join(out_dir, cache.CACHE_DIR_NAME)
+    params = {
+        "sr": sr, "channels": channels, "window": window, "hop": hop,
+        "segment_length": None if pipe else SEGMENT_LENGTH, "scorer": scorer,
+    }
+    envelopes = None
+    if use_cache:
+        key = cache.cache_key(input_path, params)
+    if use_cache and not (manifest is not None and manifest.force):
+        with profiling.stage("cache load"):
+            envelopes = cache.load_envelopes(cache_dir, key)
+        if envelopes is not None:
+            print(f"Using cached envelopes: {os.path.join(cache_dir, key)}")
+    if envelopes is None:
+        if pipe:
+            # Decode through an ffmpeg pipe straight into the analyzer: no WAV
+            # segments, and timestamps are absolute across the whole input
+            envelopes = pipe_envelopes(input_path, sr, window, hop, tap if pyramid else None, scorer, channels)
+        else:
+            envelopes = segment_envelopes(input_path, out_dir, sr, channels, window, hop, jobs, manifest,
+                                          scorer)
+        if use_cache:
+            cache.save_envelopes(cache_dir, key, envelopes)
+            cache.evict(cache_dir)
+    if pyramid:
+        if builders:
+            # Built from the samples decoded for the envelope
+            from .pyramid import pyramid_paths
+            base = os.path.splitext(os.path.basename(input_path))[0]
+            header_path = builders[0].write(pyramid_paths(out_dir, base)[0])
+        else:
+            header_path = write_pyramid(input_path, out_dir, envelopes, sr, channels)
+        print(f"Loudness pyramid written to: {header_path}")
+    return peaks_from_envelopes(envelopes, input_path, window, per_minute)
+
+def peaks_json_path(input_path, out_dir):
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(out_dir, f"{base}_peaks.json")
+
+def analyze_to_json(input_path, out_dir, sr=None, channels=1, window=2.0, hop=0.5,
+                    pipe=False, jobs=1, use_cache=True, pyramid=False, manifest=None, db=None,
+                    scorer="rms", per_minute=False):
+    """
+    Run analyze_source and write its peaks to <base>_peaks.json, unless
+    manifest shows that file is up to date for the same input and settings.
+    With db, the peaks are also stored in that peaks database (see store.py).
+    Returns the JSON path.
+    """
+    json_path = peaks_json_path(input_path, out_dir)
+    stage_inputs = {input_path: cache.fingerprint(input_path)}
+    stage_params = {"sr": sr, "channels": channels, "window": window, "hop": hop,
+                    "pipe": pipe, "pyramid": pyramid, "scorer": scorer, "per_minute": per_minute}
+    if manifest is not None and manifest.is_fresh("peaks", stage_inputs, stage_params):
+        print(f"Up to date: {json_path}")
+        if db is not None:
+            with open(json_path) as f:
+                store_peaks(db, input_path, json.load(f), stage_params)
+        return json_path
+    with profiling.stage("analysis", input=input_path):
+        all_peaks = analyze_source(input_path, out_dir, sr, channels, window, hop,
+                                   pipe, jobs, use_cache, pyramid, manifest, scorer, per_minute)
+    # Write as a single JSON array
+    with open(json_path, "w") as f:
+        json.dump(all_peaks, f, indent=2)
+    outputs = [json_path]
+    if pyramid:
+        from .pyramid import pyramid_paths
+        outputs += pyramid_paths(out_dir, os.path.splitext(os.path.basename(input_path))[0])
+    if manifest is not None:
+        manifest.record("peaks", stage_inputs, stage_params, outputs)
+    print(f"Peak info written to: {json_path}")
+    if db is not None:
+        store_peaks(db, input_path, all_peaks, stage_params)
+    return json_path
+
+def store_peaks(db, input_path, peaks, params=None):
+    """
+    Replace the peaks of input_path in the peaks database at db.
+    """
+    from .store import PeakStore
+    with PeakStore(db) as store:
+        store.add_peaks(input_path, peaks, params)
+    print(f"Stored {len(peaks)} peaks in: {store.path}")
+
+def channel_peaks(envelope, input_path, window, mapping=None, per_minute=False):
+    """
+    Peaks of each channel of a multichannel envelope (see
+    streaming.pipe_channel_envelope), selected as in peaks_from_envelopes.
+    With mapping (corner -> channel, as split.CONFIG), only the mapped
+    channels are analyzed. Peaks carry their "channel" (0-based) and the
+    "corners" it is mapped to (several corners may share a channel; empty
+    if unmapped).
+    """
+    corners = {}
+    if mapping is None:
+        channels = range(envelope["channels"])
+    else:
+        channels = sorted(set(mapping.values()))
+        for corner, channel in mapping.items():
+            corners.setdefault(channel, []).append(corner)
+    peaks = []
+    for channel in channels:
+        if channel >= envelope["channels"]:
+            raise ValueError(f"{input_path} has {envelope['channels']} audio channels, no channel {channel}")
+        channel_envelope = dict(envelope, rms=envelope["rms"][:, channel])
+        if per_minute:
+            segs = select_per_minute(channel_envelope, window)
+        else:
+            segs = find_loud.envelope_peaks(channel_envelope, window)
+        for seg in segs:
+            peaks.append({
+                "channel": channel,
+                "corners": corners.get(channel, []),
+                "start_sec": seg["start_sec"],
+                "duration_sec": seg["duration_sec"],
+                "abs_start_sec": seg["start_sec"],
+                "source_file": input_path,
+                "rms_db": seg["rms_db"]
+            })
+    return peaks
+
+def analyze_channels(input_path, out_dir, sr=None, window=2.0, hop=0.5, mapping=None, per_minute=False):
+    """
+    Decode all channels of input_path once and write the peaks of every
+    channel (or of every corner of mapping) to <base>_channel_peaks.json.
+    Returns the JSON path.
+    """
+    from .streaming import pipe_channel_envelope
+    split_audio.check_ffmpeg()
+    envelope = pipe_channel_envelope(input_path, sr, window, hop)
+    print(f"Analyzed {envelope['channels']} channels of {input_path}")
+    peaks = channel_peaks(envelope, input_path, window, mapping, per_minute)
+    base = os.path.splitext(os.path.basename(input_path))[0]
+    json_path = os.path.join(out_dir, f"{base}_channel_peaks.json")
+    with open(json_path, "w") as f:
+        json.dump(peaks, f, indent=2)
+    print(f"Channel peak info written to: {json_path}")
+    return json_path
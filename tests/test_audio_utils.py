@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+
+from simple_peaks.audio_utils import read_pcm
+
+
+class _Trickle(io.BytesIO):
+    # Pipes return short reads: at most 1000 bytes at a time
+    def readinto(self, b):
+        return super().readinto(memoryview(b)[:1000])
+
+
+def _read(data, **kwargs):
+    # Blocks share one buffer: copy each before reading the next
+    return [block.copy() for block in read_pcm(_Trickle(data), **kwargs)]
+
+
+def test_read_pcm_blocks():
+    ramp = np.arange(2500 * 2, dtype="<i2").reshape(-1, 2)
+    blocks = _read(ramp.tobytes(), channels=2, block_frames=1024)
+    assert [len(b) for b in blocks] == [1024, 1024, 452]
+    # Frames come out in order with none lost or repeated across blocks
+    np.testing.assert_array_equal(np.concatenate(blocks), ramp)
+
+    # A stream cut off mid-frame drops the partial frame
+    blocks = _read(ramp.tobytes()[:-3], channels=2, block_frames=1024)
+    assert sum(len(b) for b in blocks) == 2499
+    np.testing.assert_array_equal(np.concatenate(blocks), ramp[:-1])
+
+    floats = np.linspace(-1, 1, 2048, dtype="<f4")
+    blocks = _read(floats.tobytes(), channels=1, block_frames=1024, dtype="float32")
+    assert [b.shape for b in blocks] == [(1024, 1), (1024, 1)]
+    np.testing.assert_array_equal(np.concatenate(blocks)[:, 0], floats)
+
+    assert _read(b"", channels=2) == []
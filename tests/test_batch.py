@@ -0,0 +1,22 @@
+from simple_peaks.batch import expand_inputs, rank_peaks
+
+
+def test_expand_inputs(tmp_path):
+    for name in ["a.mov", "b.MP4", "notes.txt"]:
+        (tmp_path / name).write_text("")
+    (tmp_path / "a.simple-peaks").mkdir()
+    assert expand_inputs([str(tmp_path)]) == [str(tmp_path / "a.mov"), str(tmp_path / "b.MP4")]
+    assert expand_inputs([str(tmp_path / "*.txt"), str(tmp_path / "a.mov")]) == [
+        str(tmp_path / "a.mov"), str(tmp_path / "notes.txt")]
+
+
+def test_rank_peaks_across_files():
+    def peak(source, start, db):
+        return {"source_file": source, "abs_start_sec": start, "rms_db": db}
+
+    merged = rank_peaks({
+        "a.mov": [peak("a.mov", 10.0, -20.0), peak("a.mov", 70.0, -8.0)],
+        "b.mov": [peak("b.mov", 5.0, -12.0)],
+    })
+    assert [(p["source_file"], p["rank"], p["file_rank"]) for p in merged] == [
+        ("a.mov", 1, 1), ("b.mov", 2, 1), ("a.mov", 3, 2)]
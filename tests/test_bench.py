@@ -0,0 +1,13 @@
+from simple_peaks.bench import compare
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    def doc(wall, rss):
+        return {"results": {"find_loud_segments/60": {"wall_sec": wall, "peak_rss_mb": rss}}}
+
+    baseline = doc(2.0, 100.0)
+    assert compare(baseline, doc(2.2, 110.0), tolerance=0.15) == []
+    assert len(compare(baseline, doc(2.5, 110.0), tolerance=0.15)) == 1
+    assert len(compare(baseline, doc(2.5, 200.0), tolerance=0.15)) == 2
+    # Timer noise on very short cases is not a regression
+    assert compare(doc(0.01, 100.0), doc(0.03, 100.0)) == []
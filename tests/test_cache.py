@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from simple_peaks import cache
+
+
+def test_roundtrip_and_key_changes(tmp_path):
+    src = tmp_path / "rec.wav"
+    src.write_bytes(b"\0" * 100000)
+    key = cache.cache_key(str(src), {"window": 2.0, "hop": 0.5})
+    assert key != cache.cache_key(str(src), {"window": 2.0, "hop": 0.25})
+    cache_dir = str(tmp_path / "cache")
+    assert cache.load_envelopes(cache_dir, key) is None
+    rms = np.linspace(0, 1, 50)
+    cache.save_envelopes(cache_dir, key, [{"rms": rms, "sr": 8000, "offset": 0.0}])
+    (seg,) = cache.load_envelopes(cache_dir, key)
+    assert seg["sr"] == 8000
+    np.testing.assert_array_equal(seg["rms"], rms)
+    src.write_bytes(b"\1" * 100000)
+    os.utime(src, ns=(0, 0))
+    assert cache.cache_key(str(src), {"window": 2.0, "hop": 0.5}) != key
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path)
+    for i, key in enumerate(["old", "new"]):
+        cache.save_envelopes(cache_dir, key, [{"rms": np.zeros(1000)}])
+        os.utime(os.path.join(cache_dir, key, "meta.json"), (1000 + i, 1000 + i))
+    cache.evict(cache_dir, max_bytes=10000, max_age=float("inf"))
+    assert sorted(os.listdir(cache_dir)) == ["new"]
@@ -0,0 +1,169 @@
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from simple_peaks import extract_clips
+from simple_peaks.manifest import Manifest
+from simple_peaks.scheduler import Job, run_jobs
+
+
+def _peak(source, start):
+    return {"source_file": source, "abs_start_sec": start, "duration_sec": 2.0}
+
+
+def test_plan_batches_merges_nearby_clips_per_source():
+    peaks = [_peak("b.mov", 5.0), _peak("a.mov", 500.0), _peak("a.mov", 10.0),
+             _peak("a.mov", 12.0), _peak("a.mov", 30.0)]
+    batches = extract_clips.plan_batches(peaks, max_gap=5.0)
+    assert [(source, start, end, len(clips)) for source, start, end, clips in batches] == [
+        ("b.mov", 5.0, 7.0, 1), ("a.mov", 10.0, 14.0, 2), ("a.mov", 30.0, 32.0, 1), ("a.mov", 500.0, 502.0, 1)]
+
+
+def test_plan_batches_limits_clips_per_process():
+    peaks = [_peak("a.mov", 2.0 * i) for i in range(5)]
+    batches = extract_clips.plan_batches(peaks, max_clips=2)
+    assert [len(clips) for _, _, _, clips in batches] == [2, 2, 1]
+
+
+def test_batch_clip_cmd_trims_each_clip_from_one_decode():
+    peaks = [_peak("a.mov", 10.0), _peak("a.mov", 11.5)]
+    (source, start, end, clips), = extract_clips.plan_batches(peaks)
+    paths = {extract_clips.clip_name(p): extract_clips.clip_name(p) for p in peaks}
+    cmd = extract_clips.batch_clip_cmd(source, start, end, clips, paths)
+    assert cmd.count("-i") == 1 and cmd[cmd.index("-ss") + 1] == "10.0"
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert graph.startswith("[0:v:0]split=2[v0][v1];[0:a:0]asplit=2[a0][a1]")
+    assert "trim=start=1.5:duration=2.0" in graph
+    assert cmd[-1] == "a_11.500.mp4"
+
+
+def _outputs_of(cmd):
+    # Output path -> the labels mapped into it
+    maps = {}
+    labels = []
+    for arg, nxt in zip(cmd, cmd[1:]):
+        if arg == "-map":
+            labels.append(nxt)
+        elif arg == "-y":
+            maps[nxt] = labels
+            labels = []
+    return maps
+
+
+def test_single_pass_clip_graph():
+    outputs = {"original": "o.mp4", "540": "540.mp4", "scrolling": "s.mp4",
+               "540_gif": "540.gif", "270_gif": "270.gif"}
+    cmd = extract_clips.single_pass_clip_cmd("a.mov", 10.0, 2.0, outputs)
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1].split(";")
+    assert graph[0] == "[0:v:0]split=5[vorig][v540][vscroll][vgif540][vgif270]"
+    assert graph[1] == "[0:a:0]asplit=2[aorig][a540]"
+    for w in (540, 270):
+        assert f"[vgif{w}]fps=15,scale=-2:{w}:flags=lanczos,split[g{w}a][g{w}b]" in graph
+        assert f"[g{w}a]palettegen[p{w}]" in graph and f"[g{w}b][p{w}]paletteuse[ogif{w}]" in graph
+    assert _outputs_of(cmd) == {"o.mp4": ["[vorig]", "[aorig]"], "540.mp4": ["[o540]", "[a540]"],
+                                "s.mp4": ["[vscroll]"], "540.gif": ["[ogif540]"], "270.gif": ["[ogif270]"]}
+
+    # Disabled renditions lose their branch and output
+    cmd = extract_clips.single_pass_clip_cmd("a.mov", 10.0, 2.0, dict(outputs, **{"540": None, "270_gif": None}))
+    graph = cmd[cmd.index("-filter_complex") + 1].split(";")
+    assert graph[:2] == ["[0:v:0]split=3[vorig][vscroll][vgif540]", "[0:a:0]asplit=1[aorig]"]
+    assert "[v540]scale=-2:540[o540]" not in graph and not any("gif270" in g for g in graph)
+    assert set(_outputs_of(cmd)) == {"o.mp4", "s.mp4", "540.gif"}
+
+
+def test_skip_up_to_date_reruns_changed_clips(tmp_path):
+    source, original, gif = (str(tmp_path / name) for name in ("a.mov", "a.mp4", "a.gif"))
+    with open(source, "w") as f:
+        f.write("source")
+
+    def copy(src, dst):
+        return [sys.executable, "-c", f"import shutil; shutil.copy({src!r}, {dst!r})"]
+
+    def plan(force=False):
+        jobs = [Job("a.mp4", [copy(source, original)], inputs=[source], outputs=[original]),
+                Job("a.gif", [copy(original, gif)], deps=["a.mp4"], inputs=[original], outputs=[gif])]
+        return extract_clips.skip_up_to_date(jobs, Manifest(str(tmp_path), force=force))
+
+    def names(jobs):
+        return [job.name for job in jobs]
+
+    manifest_job = f"manifest: {tmp_path / 'manifest.json'}"
+    jobs = plan()
+    assert names(jobs) == ["a.mp4", "a.gif", manifest_job]
+    run_jobs(jobs)
+    assert plan() == []
+
+    with open(gif, "w") as f:
+        f.write("edited gif")
+    jobs = plan()
+    # The original is up to date: its dependents do not wait for it
+    assert names(jobs) == ["a.gif", manifest_job] and jobs[0].deps == []
+    run_jobs(jobs)
+    assert plan() == []
+
+    with open(source, "w") as f:
+        f.write("new source")
+    jobs = plan()
+    assert names(jobs) == ["a.mp4", "a.gif", manifest_job] and jobs[1].deps == ["a.mp4"]
+    run_jobs(jobs)
+    assert plan() == []
+    assert names(plan(force=True)) == ["a.mp4", "a.gif", manifest_job]
+
+
+def test_plan_cut_copies_whole_gops_only():
+    from simple_peaks import smartcut
+    # 10 fps, a keyframe every second
+    index = {"codec": "h264", "pix_fmt": "yuv420p", "pts": [i / 10 for i in range(100)],
+             "keyframes": [float(s) for s in range(10)]}
+    pieces = smartcut.plan_cut(index, 1.55, 3.0)
+    assert pieces == [("head", 1.6, 4), ("copy", 2.0, 20), ("tail", 4.0, 6)]
+    assert sum(frames for _, _, frames in pieces) == 30
+    assert smartcut.plan_cut(index, 2.0, 2.0)[0] == ("copy", 2.0, 10)
+    # No whole GOP inside the clip
+    assert smartcut.plan_cut(index, 1.5, 1.0) is None
+
+
+def test_full_range_sources_are_not_fast_cut():
+    from simple_peaks import smartcut
+    index = {"codec": "h264", "pix_fmt": "yuv420p", "color_range": "tv"}
+    assert smartcut.can_copy(index)
+    assert not smartcut.can_copy(dict(index, pix_fmt="yuvj420p"))
+    assert not smartcut.can_copy(dict(index, color_range="pc"))
+    assert not smartcut.can_copy(dict(index, parameter_sets_match=False))
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+                    reason="needs ffmpeg and ffprobe")
+@pytest.mark.parametrize("x264_params", ["keyint=25", "keyint=25:ref=1:bframes=0:cabac=0"])
+def test_fast_cut_decodes_cleanly(tmp_path, x264_params):
+    from simple_peaks import smartcut
+    source = str(tmp_path / "src.mp4")
+    subprocess.run([
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "testsrc2=s=320x240:r=25:d=8",
+        "-f", "lavfi", "-i", "sine=d=8",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-x264-params", x264_params,
+        "-c:a", "aac", "-y", source
+    ], check=True)
+    peak = {"source_file": source, "abs_start_sec": 1.3, "duration_sec": 4.0}
+    out_dir = str(tmp_path / "out")
+    jobs = extract_clips.clip_jobs_for_peaks([peak], out_dir, fast_cut=True)
+    original = extract_clips.clip_outputs(out_dir, extract_clips.clip_name(peak))["original"]
+    (job,) = [job for job in jobs if job.name == original]
+    assert job.message.startswith("Fast-cutting")
+    run_jobs([job])
+    # Decoded the way players do: from the MP4's own parameter sets, failing on any error
+    decode = subprocess.run(["ffmpeg", "-v", "error", "-xerror", "-i", original, "-f", "null", "-"],
+                            capture_output=True, text=True)
+    assert decode.returncode == 0 and not decode.stderr
+    frames = subprocess.run(["ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+                             "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", original],
+                            capture_output=True, text=True, check=True).stdout.strip()
+    assert int(frames) == 100
+    index = smartcut.load_index(source, out_dir)
+    if "cabac=0" in x264_params:
+        # The default libx264 edges cannot match: fully re-encoded, and later clips skip fast cuts
+        assert index["parameter_sets_match"] is False
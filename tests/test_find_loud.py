@@ -0,0 +1,115 @@
+import numpy as np
+import soundfile as sf
+
+from simple_peaks import find_loud
+
+
+def _reference_rms(y, win_length, hop_length):
+    return np.array([np.sqrt(np.mean(y[i:i + win_length] ** 2))
+                     for i in range(0, len(y) - win_length + 1, hop_length)])
+
+
+def _bursty_signal(sr, seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    y = 0.01 * rng.standard_normal(sr * seconds)
+    for start in rng.integers(0, seconds - 3, size=8):
+        y[start * sr:(start + 2) * sr] *= rng.uniform(5, 40)
+    return y.astype(np.float32)
+
+
+def test_rms_envelope_matches_reference():
+    y = _bursty_signal(1000, 60)
+    for win, hop in [(2000, 500), (1500, 700), (1000, 1000)]:
+        fast = find_loud.rms_envelope(y, win, hop)
+        ref = _reference_rms(y, win, hop)
+        assert fast.shape == ref.shape
+        np.testing.assert_allclose(fast, ref, rtol=1e-5)
+
+
+def test_find_loud_segments_from_wav(tmp_path):
+    sr = 8000
+    path = str(tmp_path / "bursts.wav")
+    sf.write(path, _bursty_signal(sr, 120), sr, subtype="FLOAT")
+    segs = find_loud.find_loud_segments(path, None, 2.0, 0.5)
+    assert 1 <= len(segs) <= find_loud.PEAKS_PER_BIN
+    starts = [s["start_sec"] for s in segs]
+    assert starts == sorted(starts)
+    assert all(b - a >= 2.0 for a, b in zip(starts, starts[1:]))
+
+
+def _reference_select(rms, starts, window, top_n):
+    order = sorted(range(len(rms)), key=lambda i: rms[i], reverse=True)
+    selected = []
+    for i in order:
+        if rms[i] < find_loud.MIN_RMS:
+            break
+        if all(starts[i] + window <= starts[j] or starts[i] >= starts[j] + window for j in selected):
+            selected.append(i)
+        if len(selected) >= top_n:
+            break
+    return sorted(selected)
+
+
+def test_select_bin_matches_greedy_reference():
+    rng = np.random.default_rng(7)
+    starts = find_loud.frame_starts(20000, 50, 1000)
+    # Quantized values so ties are common
+    rms = np.round(rng.random(20000), 2)
+    for top_n in [1, 5, 40]:
+        segs = find_loud.select_bin(rms, starts, 2.0, top_n)
+        expected = _reference_select(rms, starts, 2.0, top_n)
+        assert [s["start_sec"] for s in segs] == [round(float(starts[i]), 3) for i in expected]
+
+
+def test_select_peaks_honors_top_n_globally():
+    starts = find_loud.frame_starts(4000, 500, 1000)
+    rms = np.linspace(0.01, 1.0, 4000)
+    per_bin = find_loud.select_peaks(rms, starts, 2.0, 2000.0, top_n=3)
+    assert len(per_bin) == 9  # bins of 900, 900 and 200 s
+    overall = find_loud.select_peaks(rms, starts, 2.0, 2000.0, top_n=3, bin_size=None)
+    assert [s["start_sec"] for s in overall] == [1995.5, 1997.5, 1999.5]
+
+
+def test_rms_envelope_per_channel():
+    rng = np.random.default_rng(3)
+    y = rng.normal(size=(10000, 4))
+    rms = find_loud.rms_envelope(y, 800, 300)
+    assert rms.shape == (len(find_loud.rms_envelope(y[:, 0], 800, 300)), 4)
+    for c in range(4):
+        np.testing.assert_allclose(rms[:, c], find_loud.rms_envelope(y[:, c], 800, 300))
+
+
+def test_workflow_selects_five_per_bin_unless_per_minute():
+    from simple_peaks.workflow import peaks_from_envelopes
+    rng = np.random.default_rng(3)
+    sr, hop_length = 8000, 4000
+    envelope = {"rms": 0.1 + rng.random(1800), "hop_length": hop_length, "sr": sr, "duration": 900.0,
+                "wav_file": None, "offset": 0.0}
+    assert len(peaks_from_envelopes([envelope], "rec.mov", 2.0)) == 5
+    assert len(peaks_from_envelopes([envelope], "rec.mov", 2.0, per_minute=True)) == 15
+
+
+def test_segment_envelopes_in_process_pool(tmp_path):
+    from simple_peaks import cache
+    from simple_peaks.manifest import Manifest
+    from simple_peaks.workflow import SEGMENT_LENGTH, segment_envelopes
+    source = tmp_path / "rec.mov"
+    source.write_bytes(b"source")
+    sr = 4000
+    wavs = []
+    for i, seconds in enumerate((9, 6, 12, 5)):
+        wav = str(tmp_path / f"rec_{i:03d}.wav")
+        sf.write(wav, _bursty_signal(sr, seconds, seed=i), sr)
+        wavs.append(wav)
+    # Up-to-date split: the WAVs are used without running ffmpeg
+    manifest = Manifest(str(tmp_path))
+    manifest.record("split", {str(source): cache.fingerprint(str(source))},
+                    {"segment_length": SEGMENT_LENGTH, "sr": sr, "channels": 1}, wavs)
+
+    serial = segment_envelopes(str(source), str(tmp_path), sr, 1, 1.0, 0.5, jobs=1, manifest=manifest)
+    pooled = segment_envelopes(str(source), str(tmp_path), sr, 1, 1.0, 0.5, jobs=2, manifest=manifest)
+    assert [e["wav_file"] for e in pooled] == wavs
+    assert [e["offset"] for e in pooled] == [0.0, 9.0, 15.0, 27.0]
+    for a, b in zip(serial, pooled):
+        assert a["offset"] == b["offset"] and a["duration"] == b["duration"]
+        np.testing.assert_array_equal(a["rms"], b["rms"])
@@ -0,0 +1,22 @@
+import numpy as np
+
+from simple_peaks import find_loud
+from simple_peaks.live import LiveSelector
+
+
+def test_live_peaks_match_offline_selection():
+    sr = 2000
+    rng = np.random.default_rng(5)
+    y = (0.01 * rng.standard_normal(sr * 300)).astype(np.float32)
+    for start in rng.integers(0, 295, size=12):
+        y[start * sr:(start + 2) * sr] *= rng.uniform(2, 30)
+    selector = LiveSelector(sr, 2.0, 0.5, bin_size=60, top_n=2)
+    live = []
+    for i in range(0, len(y), 1777):
+        live += selector.push(y[i:i + 1777])
+    live += selector.finish()
+    rms = find_loud.rms_envelope(y, 2 * sr, sr // 2)
+    starts = find_loud.frame_starts(len(rms), sr // 2, sr)
+    expected = find_loud.select_peaks(rms, starts, 2.0, len(y) / sr, 2, bin_size=60)
+    assert [{k: v for k, v in p.items() if k != "bin"} for p in live] == expected
+    assert [p["bin"] for p in live] == [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
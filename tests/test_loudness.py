@@ -0,0 +1,39 @@
+import numpy as np
+
+from simple_peaks import find_loud, loudness, streaming
+
+
+def test_k_weighting_matches_bs1770_at_48k():
+    sos = loudness.k_weighting_sos(48000)
+    np.testing.assert_allclose(sos[0], [1.53512485958697, -2.69169618940638, 1.19839281085285,
+                                        1.0, -1.69065929318241, 0.73248077421585], atol=1e-9)
+    np.testing.assert_allclose(sos[1], [1.0, -2.0, 1.0, 1.0, -1.99004745483398, 0.99007225036621], atol=1e-9)
+
+
+def test_full_scale_sine_reads_minus_3_lufs():
+    sr = 48000
+    y = np.sin(2 * np.pi * 997 * np.arange(sr * 5) / sr)
+    short_term, momentary = loudness.loudness_envelope(y, sr, 2 * sr, sr // 2)
+    np.testing.assert_allclose(short_term[1:], -3.01, atol=0.02)
+    np.testing.assert_allclose(momentary[1:], -3.01, atol=0.02)
+
+
+def test_blocks_match_whole_signal_and_rumble_ranks_low():
+    sr = 8000
+    rng = np.random.default_rng(5)
+    t = np.arange(sr * 60) / sr
+    y = 0.01 * rng.standard_normal(len(t))
+    # Loud 30 Hz rumble at 10 s, quieter 1 kHz tone at 40 s
+    y[10 * sr:13 * sr] += 0.5 * np.sin(2 * np.pi * 30 * t[10 * sr:13 * sr])
+    y[40 * sr:43 * sr] += 0.2 * np.sin(2 * np.pi * 1000 * t[40 * sr:43 * sr])
+    y = y.astype(np.float32)
+    whole = streaming.envelope_from_blocks([y], sr, 2.0, 0.5, scorer="lufs")
+    blocks = streaming.envelope_from_blocks(np.array_split(y, 37), sr, 2.0, 0.5, scorer="lufs")
+    np.testing.assert_allclose(blocks["rms"], whole["rms"], atol=1e-3)
+    np.testing.assert_allclose(blocks["momentary"], whole["momentary"], atol=1e-3)
+
+    rms_top = find_loud.envelope_peaks(streaming.envelope_from_blocks([y], sr, 2.0, 0.5), 2.0, 1, None)
+    lufs_top = find_loud.envelope_peaks(whole, 2.0, 1, None)
+    assert 9 <= rms_top[0]["start_sec"] <= 11
+    assert 39 <= lufs_top[0]["start_sec"] <= 41
+    assert -20 < lufs_top[0]["rms_db"] < 0 and "momentary_lufs" in lufs_top[0]
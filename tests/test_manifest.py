@@ -0,0 +1,26 @@
+from simple_peaks.manifest import Manifest
+
+
+def test_stage_freshness(tmp_path):
+    out = tmp_path / "clip.mp4"
+    out.write_text("clip")
+    manifest = Manifest(str(tmp_path))
+    manifest.record("clip", {"src.mov": "abc"}, {"start": 1.5}, [str(out)])
+
+    reloaded = Manifest(str(tmp_path))
+    assert reloaded.is_fresh("clip", {"src.mov": "abc"}, {"start": 1.5})
+    assert not reloaded.is_fresh("clip", {"src.mov": "abd"}, {"start": 1.5})
+    assert not reloaded.is_fresh("clip", {"src.mov": "abc"}, {"start": 2.0})
+    assert not Manifest(str(tmp_path), force=True).is_fresh("clip", {"src.mov": "abc"}, {"start": 1.5})
+    out.write_text("changed clip")
+    assert not reloaded.is_fresh("clip", {"src.mov": "abc"}, {"start": 1.5})
+
+
+def test_unsaved_records_are_written_by_save(tmp_path):
+    out = tmp_path / "clip.mp4"
+    out.write_text("clip")
+    manifest = Manifest(str(tmp_path))
+    manifest.record("clip", {"src.mov": "abc"}, {}, [str(out)], save=False)
+    assert not Manifest(str(tmp_path)).is_fresh("clip", {"src.mov": "abc"}, {})
+    manifest.save()
+    assert Manifest(str(tmp_path)).is_fresh("clip", {"src.mov": "abc"}, {})
@@ -0,0 +1,46 @@
+import json
+import sys
+
+from simple_peaks import profiling
+
+
+def test_stages_and_commands_are_traced(tmp_path):
+    profiling.enable()
+    with profiling.stage("outer"):
+        with profiling.stage("inner", size=3):
+            profiling.run([sys.executable, "-c", "pass"])
+    trace_path = tmp_path / "trace.json"
+    profiling.finish(str(trace_path))
+    events = {e["name"]: e for e in json.loads(trace_path.read_text())["traceEvents"]}
+    assert set(events) == {"outer", "inner", f"{sys.executable.rsplit('/', 1)[-1]} (inner)"}
+    command = events[f"{sys.executable.rsplit('/', 1)[-1]} (inner)"]
+    assert command["cat"] == "subprocess"
+    assert command["args"]["returncode"] == 0
+    assert command["args"]["cmd"].endswith("-c pass")
+    assert events["inner"]["args"]["size"] == 3
+    # Nested events lie within their stage
+    assert events["outer"]["ts"] <= command["ts"] <= command["ts"] + command["dur"] <= \
+        events["outer"]["ts"] + events["outer"]["dur"] + 1
+
+
+def test_inactive_profile_records_nothing():
+    with profiling.stage("ignored"):
+        profiling.run([sys.executable, "-c", "pass"])
+    assert profiling.disable() is None
+
+
+def test_profile_option_forms():
+    from simple_peaks.cli import PROFILE_TRACE, profile_option
+    assert profile_option(["find", "a.wav"]) == (["find", "a.wav"], None)
+    assert profile_option(["--profile", "a.mov"]) == (["a.mov"], PROFILE_TRACE)
+    assert profile_option(["--profile", "t.json", "a.mov"]) == (["a.mov"], "t.json")
+    assert profile_option(["a.mov", "--profile=t.json"]) == (["a.mov"], "t.json")
+
+
+def test_profiled_wait_returns_popen_exit_codes(tmp_path):
+    profiling.enable()
+    with profiling.stage("codes"):
+        assert profiling.wait(profiling.popen([sys.executable, "-c", "raise SystemExit(3)"])) == 3
+        killed = [sys.executable, "-c", "import os, signal; os.kill(os.getpid(), signal.SIGTERM)"]
+        assert profiling.wait(profiling.popen(killed)) == -15
+    profiling.finish(str(tmp_path / "trace.json"))
@@ -0,0 +1,41 @@
+import numpy as np
+
+from simple_peaks import find_loud
+from simple_peaks.pyramid import LoudnessPyramid, PyramidBuilder
+
+
+def test_rms_and_zoom_levels(tmp_path):
+    sr = 8000
+    rng = np.random.default_rng(5)
+    y = (0.1 * rng.standard_normal(sr * 30)).astype(np.float32)
+    builder = PyramidBuilder(sr)
+    for i in range(0, len(y), 3001):
+        builder.push(y[i:i + 3001])
+    builder.write(str(tmp_path / "rec_loudness.bin"))
+
+    pyramid = LoudnessPyramid(str(tmp_path / "rec_loudness.json"))
+    assert pyramid.duration == 30.0
+    rms, hop_length = pyramid.rms(2.0, 0.5)
+    np.testing.assert_allclose(rms, find_loud.rms_envelope(y, 2 * sr, sr // 2))
+    assert hop_length == sr // 2
+
+    zoomed = pyramid.envelope(0.0, 30.0, max_points=100)
+    assert len(zoomed["rms"]) <= 100
+    # Each coarse value is the RMS over its span
+    n = int(round(zoomed["step_sec"] * sr))
+    assert np.isclose(zoomed["rms"][0], np.sqrt(np.mean(y[:n].astype(np.float64) ** 2)))
+
+
+def test_coarse_levels_keep_the_tail(tmp_path):
+    sr = 1000
+    # 7 base blocks of 10 ms: odd at every level
+    y = np.ones(70)
+    y[60:] = 3.0
+    builder = PyramidBuilder(sr)
+    builder.push(y)
+    builder.write(str(tmp_path / "rec_loudness.bin"))
+    pyramid = LoudnessPyramid(str(tmp_path / "rec_loudness.json"))
+    assert [len(pyramid.level(k)) for k in range(pyramid.num_levels)] == [7, 4, 2, 1]
+    assert pyramid.level(pyramid.num_levels - 1)[0] == np.sum(y ** 2)
+    # The partial last cell is the RMS of what it covers
+    assert pyramid.envelope(0.0, 0.07, level=1)["rms"] == [1.0, 1.0, 1.0, 3.0]
@@ -0,0 +1,61 @@
+import pytest
+
+from simple_peaks.scheduler import Job, ffmpeg_threads, run_jobs
+
+
+def test_dependencies_run_first():
+    order = []
+    jobs = [
+        Job("derived", [lambda: order.append("derived")], deps=["source"]),
+        Job("source", [lambda: order.append("source")]),
+    ]
+    assert sorted(run_jobs(jobs, max_workers=4)) == ["derived", "source"]
+    assert order == ["source", "derived"]
+
+
+def test_failure_stops_dependents():
+    ran = []
+
+    def fail():
+        raise RuntimeError("encode failed")
+
+    jobs = [
+        Job("source", [fail]),
+        Job("derived", [lambda: ran.append("derived")], deps=["source"]),
+    ]
+    with pytest.raises(RuntimeError):
+        run_jobs(jobs, max_workers=2)
+    assert ran == []
+
+
+def test_thread_budget():
+    assert ffmpeg_threads(1) == []
+    assert ffmpeg_threads(4, 2) == ["-threads", "2"]
+
+
+def test_slots_and_spawned_jobs():
+    import threading
+    lock = threading.Lock()
+    running = {"n": 0, "max": 0}
+
+    def encode():
+        with lock:
+            running["n"] += 1
+            running["max"] = max(running["max"], running["n"])
+        threading.Event().wait(0.01)
+        with lock:
+            running["n"] -= 1
+
+    def analyze():
+        return [Job(f"clip {i}", [encode], slot="encode") for i in range(6)]
+
+    done = run_jobs([Job("analyze", [analyze])], max_workers=4, slots={"encode": 2})
+    assert len(done) == 7
+    assert running["max"] <= 2
+
+
+def test_unknown_dependencies_and_duplicate_names_are_errors():
+    with pytest.raises(ValueError, match="unknown"):
+        run_jobs([Job("derived", [lambda: None], deps=["sorce"])])
+    with pytest.raises(ValueError, match="Duplicate"):
+        run_jobs([Job("clip", [lambda: None]), Job("clip", [lambda: None])])
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+from simple_peaks.server import JobServer
+
+
+async def _request(port, method, path, headers=(), body=b"", host="localhost"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", f"Content-Length: {len(body)}", *headers]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, head.decode(), body
+
+
+def _unchunk(body):
+    data = b""
+    while True:
+        size, _, body = body.partition(b"\r\n")
+        size = int(size, 16)
+        if not size:
+            return data
+        data += body[:size]
+        body = body[size + 2:]
+
+
+def test_jobs_events_and_ranges(tmp_path):
+    (tmp_path / "rec.mov").write_bytes(bytes(range(100)))
+
+    def echo(server, path, options, emit):
+        for i in range(3):
+            emit({"event": "peak", "n": i})
+        return {"path": path}
+
+    async def main():
+        server = JobServer(str(tmp_path), max_jobs=1)
+        server.runners["echo"] = echo
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            status, _, body = await _request(port, "POST", "/jobs",
+                                             body=json.dumps({"kind": "echo", "path": "rec.mov"}).encode())
+            assert status == 202
+            events_url = json.loads(body)["events"]
+            status, head, body = await _request(port, "GET", events_url)
+            assert status == 200 and "application/x-ndjson" in head
+            events = [json.loads(line) for line in _unchunk(body).splitlines()]
+            assert [e["event"] for e in events] == ["queued", "started", "peak", "peak", "peak", "done"]
+            assert events[-1]["path"] == str(tmp_path / "rec.mov")
+
+            status, _, body = await _request(port, "GET", events_url + "?format=sse")
+            assert _unchunk(body).startswith(b'data: {"event": "queued"}\n\n')
+
+            status, head, body = await _request(port, "GET", "/files/rec.mov", ["Range: bytes=10-19"])
+            assert status == 206 and "Content-Range: bytes 10-19/100" in head
+            assert body == bytes(range(10, 20))
+            status, _, body = await _request(port, "GET", "/files/rec.mov", ["Range: bytes=-5"])
+            assert status == 206 and body == bytes(range(95, 100))
+            status, _, _ = await _request(port, "GET", "/files/rec.mov", ["Range: bytes=200-"])
+            assert status == 416
+
+            status, _, _ = await _request(port, "GET", "/files/../outside.mov")
+            assert status == 404
+            status, _, _ = await _request(port, "POST", "/jobs", body=b'{"kind": "nope", "path": "rec.mov"}')
+            assert status == 400
+
+    asyncio.run(main())
+
+
+def test_hosts_and_origins_are_checked(tmp_path):
+    (tmp_path / "rec.mov").write_bytes(b"x")
+
+    async def main():
+        server = JobServer(str(tmp_path), allow_origins=["http://localhost:3000"])
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            status, head, _ = await _request(port, "GET", "/files/rec.mov")
+            assert status == 200 and "Access-Control-Allow-Origin" not in head
+            status, _, _ = await _request(port, "GET", "/files/rec.mov", host="[::1]")
+            assert status == 200
+            # DNS rebinding: a page on evil.example resolving to 127.0.0.1
+            status, _, _ = await _request(port, "GET", "/files/rec.mov", host="evil.example")
+            assert status == 403
+
+            status, _, _ = await _request(port, "POST", "/jobs", ["Origin: http://evil.example"],
+                                          body=b'{"kind": "split", "path": "rec.mov"}')
+            assert status == 403
+            status, _, _ = await _request(port, "OPTIONS", "/jobs", ["Origin: http://evil.example"])
+            assert status == 403
+            status, head, _ = await _request(port, "OPTIONS", "/jobs", ["Origin: http://localhost:3000"])
+            assert status == 204
+            assert "Access-Control-Allow-Origin: http://localhost:3000" in head and "Vary: Origin" in head
+
+    asyncio.run(main())
@@ -0,0 +1,20 @@
+import pytest
+
+from simple_peaks.split import parse_mapping, single_pass_cmd
+
+
+def test_parse_mapping():
+    assert parse_mapping(["top_left=7", "bottom_right=0"]) == {"top_left": 7, "bottom_right": 0}
+    for bad in ("top_left", "middle=3", "top_left=seven", "top_left=-1"):
+        with pytest.raises(ValueError, match="Invalid mapping"):
+            parse_mapping([bad])
+
+
+def test_single_pass_graph():
+    cmd = single_pass_cmd("in.mov", "out", {"top_left": 7, "bottom_right": 9})
+    graph = cmd[cmd.index("-filter_complex") + 1].split(";")
+    assert graph[:2] == ["[0:v]split=2[v0][v1]", "[0:a]asplit=2[a0][a1]"]
+    assert graph[2:] == ["[v0]crop=1920:1080:0:0[vout0]", "[a0]pan=stereo|c0=c7|c1=c7[aout0]",
+                         "[v1]crop=1920:1080:1920:1080[vout1]", "[a1]pan=stereo|c0=c9|c1=c9[aout1]"]
+    assert cmd.count("-i") == 1
+    assert cmd[-1] == "out/bottom_right.mp4" and "[vout1]" in cmd and "[aout1]" in cmd
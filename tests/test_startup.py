@@ -0,0 +1,14 @@
+import subprocess
+import sys
+
+from simple_peaks.daemon import forward
+
+
+def test_cli_import_is_light():
+    code = "import sys, simple_peaks.cli; print(sorted({'numpy', 'librosa', 'soundfile'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
+def test_forward_without_daemon_runs_locally(tmp_path):
+    assert forward(["--help"], str(tmp_path / "missing.sock")) is None
@@ -0,0 +1,85 @@
+import json
+import os
+
+import numpy as np
+
+from simple_peaks.store import PeakStore, to_json_shape
+
+
+def _peak(source, start, db):
+    return {"wav_file": source + ".wav", "start_sec": start, "duration_sec": 2.0,
+            "abs_start_sec": start, "source_file": os.path.abspath(source), "rms_db": db}
+
+
+def test_query_replace_and_export(tmp_path):
+    db = str(tmp_path / "peaks.db")
+    with PeakStore(db) as store:
+        store.add_peaks("a.mov", [_peak("a.mov", 10.0, -20.0), _peak("a.mov", 50.0, -5.0)])
+        store.add_peaks("b.mov", [_peak("b.mov", 30.0, -10.0)])
+
+        assert [p["rms_db"] for p in store.query()] == [-5.0, -10.0, -20.0]
+        assert [p["start_sec"] for p in store.query(order="time")] == [10.0, 50.0, 30.0]
+        assert store.query(sources=["b.mov"]) == [_peak("b.mov", 30.0, -10.0)]
+        assert [p["start_sec"] for p in store.query(start=20.0, min_db=-12.0)] == [50.0, 30.0]
+        assert len(store.query(top=1)) == 1
+
+        # Analyzing a recording again replaces its peaks
+        store.add_peaks("a.mov", [_peak("a.mov", 70.0, -1.0)])
+        assert store.sources() == {os.path.abspath("a.mov"): 1, os.path.abspath("b.mov"): 1}
+
+        by_wav = to_json_shape(store.query(sources=["a.mov"]), "by-wav")
+        assert by_wav == {"a.mov.wav": [{"start_sec": 70.0, "duration_sec": 2.0, "rms_db": -1.0}]}
+
+
+def test_import_json_shapes(tmp_path):
+    listed = tmp_path / "a_peaks.json"
+    listed.write_text(json.dumps([_peak("a.mov", 10.0, -3.0)]))
+    by_wav = tmp_path / "b_peaks.json"
+    by_wav.write_text(json.dumps({"b_000.wav": [{"start_sec": 4.0, "duration_sec": 2.0, "rms_db": -8.0}]}))
+    with PeakStore(str(tmp_path / "peaks.db")) as store:
+        assert store.import_json(str(listed)) == 1
+        assert store.import_json(str(by_wav)) == 1
+        assert store.query(sources=["a.mov"]) == [_peak("a.mov", 10.0, -3.0)]
+        assert store.query(sources=[str(tmp_path / "b_000.wav")])[0]["abs_start_sec"] == 4.0
+
+
+def test_shared_channel_keeps_every_corner(tmp_path):
+    from simple_peaks.workflow import channel_peaks
+    rms = np.zeros((100, 4))
+    rms[40] = [0.1, 0.2, 0.3, 0.4]
+    envelope = {"rms": rms, "channels": 4, "hop_length": 4000, "sr": 8000, "duration": 50.0}
+    peaks = channel_peaks(envelope, "rec.mov", 2.0, {"top_left": 3, "top_right": 3, "bottom_left": 1})
+    assert [(p["channel"], p["corners"]) for p in peaks] == [(1, ["bottom_left"]), (3, ["top_left", "top_right"])]
+
+    with PeakStore(str(tmp_path / "peaks.db")) as store:
+        store.add_peaks("rec.mov", peaks)
+        assert sorted(p["corners"] for p in store.query()) == [["bottom_left"], ["top_left", "top_right"]]
+
+
+def test_import_resolves_relative_sources(tmp_path, monkeypatch):
+    rec = tmp_path / "day1" / "rec.mov"
+    out_dir = tmp_path / "day1" / "rec.simple-peaks"
+    out_dir.mkdir(parents=True)
+    rec.write_bytes(b"")
+    # As written by the default workflow run from tmp_path
+    peak = dict(_peak("x", 12.0, -3.0), source_file="day1/rec.mov", momentary_lufs=-1.5)
+    (out_dir / "rec_peaks.json").write_text(json.dumps([peak]))
+    monkeypatch.chdir(out_dir)
+    with PeakStore(str(tmp_path / "peaks.db")) as store:
+        store.import_json("rec_peaks.json")
+        (stored,) = store.query(since=0)
+        assert stored["source_file"] == str(rec)
+        assert stored["momentary_lufs"] == -1.5
+
+
+def test_import_converts_linear_rms(tmp_path):
+    # rms_db was the linear RMS before it was in dBFS
+    legacy = tmp_path / "a_peaks.json"
+    legacy.write_text(json.dumps([_peak("a.mov", 10.0, 0.1), _peak("a.mov", 20.0, 0.5)]))
+    current = tmp_path / "b_peaks.json"
+    current.write_text(json.dumps([_peak("b.mov", 30.0, -12.0)]))
+    with PeakStore(str(tmp_path / "peaks.db")) as store:
+        store.import_json(str(legacy))
+        store.import_json(str(current))
+        assert [p["rms_db"] for p in store.query()] == [20 * np.log10(0.5), -12.0, -20.0]
+        assert [p["start_sec"] for p in store.query(min_db=-10.0)] == [20.0]
@@ -0,0 +1,54 @@
+import numpy as np
+import soundfile as sf
+
+from simple_peaks import find_loud, streaming
+
+
+def test_stream_matches_in_memory(tmp_path):
+    sr = 4000
+    rng = np.random.default_rng(3)
+    y = 0.01 * rng.standard_normal(sr * 1000)
+    for start in rng.integers(0, 995, size=20):
+        y[start * sr:(start + 3) * sr] *= rng.uniform(2, 30)
+    path = str(tmp_path / "long.wav")
+    sf.write(path, np.stack([y, 0.5 * y], axis=1).astype(np.float32), sr, subtype="FLOAT")
+    expected = find_loud.find_loud_segments(path, None, 2.0, 0.5)
+    # Block size unrelated to window and hop, so windows straddle blocks
+    assert streaming.stream_loud_segments(path, None, 2.0, 0.5, blocksize=7919) == expected
+    # Two bins: 900 s and a 100 s remainder
+    assert any(s["start_sec"] >= find_loud.BIN_SIZE for s in expected)
+
+
+def test_low_rate_analysis_selects_native_peaks():
+    # The check bench.compare_rates runs through ffmpeg, on a synthetic signal
+    import soxr
+    from simple_peaks import workflow
+    sr = 48000
+    rng = np.random.default_rng(11)
+    t = np.arange(sr * 300) / sr
+    y = 0.01 * rng.standard_normal(len(t)) + 0.005 * np.sin(2 * np.pi * 180 * t)
+    for start in rng.integers(0, 295, size=15):
+        y[start * sr:(start + 2) * sr] *= rng.uniform(2, 20)
+    peaks = {}
+    for rate, signal in ((sr, y), (8000, soxr.resample(y, sr, 8000, "HQ"))):
+        envelope = streaming.envelope_from_blocks([signal.astype(np.float32)], rate, 2.0, 0.5)
+        peaks[rate] = [p["start_sec"] for p in workflow.select_per_minute(envelope, 2.0)]
+    assert peaks[8000] == peaks[sr]
+
+
+def test_pipe_decodes_with_the_segment_channel_count(monkeypatch):
+    from simple_peaks import audio_utils
+    calls = []
+
+    def fake_pcm_blocks(input_path, channels=2, block_frames=1 << 16, sr=None, dtype="int16"):
+        calls.append((channels, sr))
+        yield np.full((4, channels), 16384, dtype=dtype)
+
+    monkeypatch.setattr(audio_utils, "pcm_blocks", fake_pcm_blocks)
+    monkeypatch.setattr(audio_utils, "probe_sample_rate", lambda path: 48000)
+    blocks, sr = streaming.pipe_blocks("rec.mov")
+    assert sr == 48000 and np.allclose(next(blocks), 0.5)
+    blocks, _ = streaming.pipe_blocks("rec.mov", channels=2)
+    next(blocks)
+    next(streaming.pipe_blocks("rec.mov", 8000, channels=2)[0])
+    assert calls == [(1, None), (2, None), (2, 8000)]